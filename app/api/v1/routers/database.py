@@ -1,25 +1,138 @@
-import json
+import time
+import uuid
 from logging import getLogger
+from typing import Any, Optional
 
-from bson import ObjectId
-from core.authentication.subscription import validate_subscription
+from core.admission import Admission, admit
+from core.aggregation import PipelineNotAllowedError, aggregate_kwargs, validate_pipeline
+from core.authentication.auth_middleware import get_current_token
+from core.batch import run_batch
+from core.bson_json import dumps_document, dumps_documents
+from core.bulk_write import (
+    BulkWriteSummary,
+    ImportFormat,
+    ImportMode,
+    ImportSummary,
+    aiter_import_batches,
+    aiter_ndjson_batches,
+    arun_batches,
+    execute_batch,
+    import_progress,
+    iter_batches,
+    run_batches,
+)
+from core.change_streams import (
+    SSE_HEADERS,
+    ChangeStreamLimitError,
+    change_streams,
+    iter_sse,
+    poll_changes,
+    validate_watch,
+)
+from core.config import settings
+from core.document_stream import MEDIA_TYPES, aiter_lines, iter_raw_batches
+from core.explain import (
+    ExplainOptionsError,
+    capture_slow_query,
+    explain_command,
+    slow_queries,
+    summarize_explain,
+)
+from core.export import (
+    InvalidRangeTokenError,
+    compressor,
+    content_disposition,
+    csv_header,
+    decode_range_token,
+    encode_range_token,
+    encoder,
+    iter_export,
+    media_type,
+    plan_ranges,
+)
+from core.filters import FilterDecodeError, decode_filter, decode_update, field_types
+from core.find_options import count_kwargs, distinct_kwargs, find_kwargs, with_read_preference
+from core.indexes import (
+    build_index,
+    create_indexes_kwargs,
+    equality_fields,
+    index_advisor,
+    index_model,
+    index_result,
+    index_usage_result,
+    parse_selectivity,
+    recommend_indexes,
+    selectivity_pipeline,
+)
+from core.metadata import (
+    NAMESPACE_NOT_FOUND,
+    collection_stats,
+    collection_stats_pipeline,
+    creating,
+    database_stats,
+    list_collection_names,
+    list_database_names,
+)
+from core.mongo_client_registry import mongo_clients
+from core.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    dumps_page,
+    encode_cursor,
+    keyset_filter,
+    keyset_sort,
+)
 from core.platfom_integration_client import (
     PlatformIntegrationClient,
     get_platform_client,
 )
-from fastapi import APIRouter, Depends, HTTPException
-from pymongo import MongoClient
+from core.query_cache import query_cache
+from core.write_coalescer import write_coalescer
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pymongo.errors import ExecutionTimeout, OperationFailure
 from schemas.database import (
+    AggregateQueryInput,
+    BatchQueryInput,
+    BatchQueryResult,
+    BulkWriteQueryInput,
+    BulkWriteQueryResult,
+    ChangesQueryInput,
+    ChangesQueryResult,
+    CollectionStatsResult,
+    CountQueryInput,
+    CountQueryResult,
+    CreateIndexQueryInput,
+    CreateIndexQueryResult,
+    DatabaseStatsResult,
     DeleteQueryInput,
     DeleteQueryResult,
+    DistinctQueryInput,
+    DropIndexQueryResult,
+    ExplainQueryInput,
+    ExplainQueryResult,
+    ExportPlanQueryInput,
+    ExportPlanQueryResult,
+    ExportQueryInput,
+    ExportRangeResult,
     FindQueryInput,
+    ImportQueryResult,
+    IndexAdviceResult,
+    IndexResult,
+    IndexUsageResult,
     InsertQueryInput,
     InsertQueryResult,
+    PageQueryInput,
+    StreamFindQueryInput,
     UpdateQueryInput,
     UpdateQueryResult,
+    WatchQueryInput,
 )
+from schemas.page import Page
+from schemas.token import TokenData
 
-router = APIRouter(dependencies=[Depends(validate_subscription)])
+router = APIRouter(dependencies=[Depends(admit)])
 
 
 @router.get(
@@ -36,21 +149,17 @@ def list_databases(
     """
 
     logger = getLogger(__name__ + ".query_documents")
-    client: MongoClient | None = None
     try:
         mongo_details = platform_client.get_mongodb_details(mongo_project)
         connection_string = mongo_details.get("connection_string")
-        client = MongoClient(connection_string)
 
-        db_names = client.list_database_names()
+        with mongo_clients.lease(connection_string) as client:
+            db_names = list_database_names(client, connection_string)
 
-        return db_names
+            return db_names
     except Exception as ex:
         logger.exception(ex)
         raise HTTPException(status_code=500, detail=f"Could not query documents: {ex}")
-    finally:
-        if client:
-            client.close()
 
 
 @router.get(
@@ -68,22 +177,198 @@ def list_collections(
     """
 
     logger = getLogger(__name__ + ".query_documents")
-    client: MongoClient | None = None
     try:
         mongo_details = platform_client.get_mongodb_details(mongo_project)
         connection_string = mongo_details.get("connection_string")
 
-        client = MongoClient(connection_string)
-
-        collections = client[db_name].list_collection_names()
+        with mongo_clients.lease(connection_string) as client:
+            collections = list_collection_names(client, connection_string, db_name)
 
-        return collections
+            return collections
     except Exception as ex:
         logger.exception(ex)
         raise HTTPException(status_code=500, detail=f"Could not query documents: {ex}")
-    finally:
-        if client:
-            client.close()
+
+
+@router.get(
+    path="/databases/{db_name}/stats",
+    operation_id="database_stats",
+    response_model=DatabaseStatsResult,
+)
+def get_database_stats(
+    mongo_project: str,
+    db_name: str,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> DatabaseStatsResult:
+    """
+    Get the size of a database without reading its documents: the number of collections, views,
+    documents and indexes, the data, storage and index sizes in bytes and the average document size.
+    """
+
+    logger = getLogger(__name__ + ".get_database_stats")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            result = client[db_name].command("dbStats")
+
+            return database_stats(result)
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not get database stats: {ex}")
+
+
+@router.get(
+    path="/databases/{db_name}/collections/{collection_name}/stats",
+    operation_id="collection_stats",
+    response_model=CollectionStatsResult,
+)
+def get_collection_stats(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> CollectionStatsResult:
+    """
+    Get the size of a collection without reading its documents: the number of documents, the data
+    and storage sizes in bytes, the average document size and the size of each index. Use this to
+    size a query before fetching documents. Sharded collections are summed over their shards.
+    """
+
+    logger = getLogger(__name__ + ".get_collection_stats")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+            results = list(collection.aggregate(collection_stats_pipeline()))
+
+            return collection_stats(f"{db_name}.{collection_name}", results)
+    except OperationFailure as ex:
+        if ex.code != NAMESPACE_NOT_FOUND:
+            logger.exception(ex)
+            raise HTTPException(status_code=500, detail=f"Could not get collection stats: {ex}")
+        raise HTTPException(status_code=404, detail=f"Collection {db_name}.{collection_name} does not exist")
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not get collection stats: {ex}")
+
+
+@router.get(
+    path="/databases/{db_name}/collections/{collection_name}/documents/count/estimated",
+    operation_id="estimated_document_count",
+    response_model=CountQueryResult,
+)
+def estimated_document_count(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> CountQueryResult:
+    """
+    Get the number of documents in a collection from its metadata, without scanning it. The count
+    can be off after an unclean shutdown or with orphaned documents on sharded clusters.
+    """
+
+    logger = getLogger(__name__ + ".estimated_document_count")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            count = client[db_name][collection_name].estimated_document_count()
+
+            return CountQueryResult(count=count, estimated=True)
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not count documents: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/count",
+    operation_id="count_documents",
+    response_model=CountQueryResult,
+)
+def count_documents(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: CountQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> CountQueryResult:
+    """
+    Count the documents matching a filter exactly. Pass a limit to stop counting once it is reached.
+    """
+
+    logger = getLogger(__name__ + ".count_documents")
+    query.max_time_ms = admission.max_time_ms(query.max_time_ms)
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+
+            index_advisor.observe((connection_string, db_name, collection_name), filter, None, "count_documents")
+
+            count = collection.count_documents(filter, **count_kwargs(query))
+
+            return CountQueryResult(count=count)
+    except ExecutionTimeout as ex:
+        raise HTTPException(status_code=504, detail=f"Count exceeded max_time_ms: {ex}")
+    except FilterDecodeError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not count documents: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/distinct",
+    operation_id="distinct_values",
+    response_model=list[Any],
+)
+def distinct_values(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: DistinctQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> Response:
+    """
+    Get the distinct values of a field across the documents matching a filter. Values of array
+    fields are unwound, so each element counts as a value.
+    """
+
+    logger = getLogger(__name__ + ".distinct_values")
+    query.max_time_ms = admission.max_time_ms(query.max_time_ms)
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+
+            values = collection.distinct(query.field, filter, **distinct_kwargs(query))
+
+            content = dumps_document(values, query.json_mode)
+
+            return Response(content=content, media_type="application/json")
+    except ExecutionTimeout as ex:
+        raise HTTPException(status_code=504, detail=f"Distinct exceeded max_time_ms: {ex}")
+    except FilterDecodeError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not get distinct values: {ex}")
 
 
 @router.post(
@@ -103,25 +388,20 @@ def insert_documents(
     """
 
     logger = getLogger(__name__ + ".insert_documents")
-    client: MongoClient | None = None
     try:
         mongo_details = platform_client.get_mongodb_details(mongo_project)
         connection_string = mongo_details.get("connection_string")
 
-        client = MongoClient(connection_string)
-
-        collection = client[db_name][collection_name]
+        with mongo_clients.lease(connection_string) as client:
+            namespace = (connection_string, db_name, collection_name)
+            with query_cache.invalidating(namespace), creating(namespace):
+                ids = write_coalescer.insert_many(client, namespace, query.documents)
+            inserted_ids = [str(id) for id in ids]
 
-        res = collection.insert_many(documents=query.documents)
-        inserted_ids = [str(id) for id in res.inserted_ids]
-
-        return InsertQueryResult(inserted_ids=inserted_ids)
+            return InsertQueryResult(inserted_ids=inserted_ids)
     except Exception as ex:
         logger.exception(ex)
         raise HTTPException(status_code=500, detail=f"Could not insert documents: {ex}")
-    finally:
-        if client:
-            client.close()
 
 
 @router.post(
@@ -134,40 +414,1015 @@ def query_documents(
     db_name: str,
     collection_name: str,
     query: FindQueryInput,
+    background_tasks: BackgroundTasks,
+    bypass_cache: bool = Query(default=False, description="Read from MongoDB even if the results are cached"),
     platform_client: PlatformIntegrationClient = Depends(get_platform_client),
-) -> list[dict]:
+    admission: Admission = Depends(admit),
+) -> Response:
     """
     Query documents in the specified collection.
     """
 
     logger = getLogger(__name__ + ".query_documents")
-    client: MongoClient | None = None
+    query.limit = admission.limit(query.limit)
+    query.max_time_ms = admission.max_time_ms(query.max_time_ms)
+    admission.charge_documents(query.limit)
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+
+            namespace = (connection_string, db_name, collection_name)
+            index_advisor.observe(namespace, filter, query.sort, "query_documents")
+
+            cache_key = query_cache.key(namespace, filter, query, bypass_cache)
+            if cache_key is not None:
+                cached, generation = query_cache.get(cache_key)
+                if cached is not None:
+                    return Response(content=cached, media_type="application/json")
+
+            collection = with_read_preference(collection, query.read_preference)
+            started = time.perf_counter()
+            documents = collection.find(filter=filter, **find_kwargs(query))
+
+            # Encoded once straight into the response body, skipping response_model revalidation
+            content = dumps_documents(documents, query.json_mode)
+
+            if cache_key is not None:
+                query_cache.put(cache_key, content, generation)
+
+            duration_ms = (time.perf_counter() - started) * 1000
+            if slow_queries.is_slow(duration_ms):
+                # Explained after the response is sent, so capturing does not slow the query down further
+                background_tasks.add_task(
+                    capture_slow_query,
+                    connection_string,
+                    mongo_project,
+                    db_name,
+                    collection_name,
+                    filter,
+                    query,
+                    duration_ms,
+                    "query_documents",
+                )
+
+            return Response(content=content, media_type="application/json")
+    except ExecutionTimeout as ex:
+        raise HTTPException(status_code=504, detail=f"Query exceeded max_time_ms: {ex}")
+    except FilterDecodeError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not query documents: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/find/page",
+    operation_id="page_documents",
+    response_model=Page[dict],
+)
+def page_documents(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: PageQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> Response:
+    """
+    Query one page of documents in the specified collection using keyset pagination.
+    Pass the returned next_cursor to fetch the following page; it is null on the last page.
+    """
+
+    logger = getLogger(__name__ + ".page_documents")
+    query.limit = admission.limit(query.limit)
+    admission.charge_documents(query.limit)
     try:
         mongo_details = platform_client.get_mongodb_details(mongo_project)
         connection_string = mongo_details.get("connection_string")
 
-        client = MongoClient(connection_string)
-        collection = client[db_name][collection_name]
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+
+            # Each page is a range seek past the last sort key values, so cost does not grow with depth
+            sort = keyset_sort(query.sort)
+            page_filter = filter
+            if query.cursor:
+                page_filter = keyset_filter(filter, sort, decode_cursor(query.cursor, filter, sort))
+
+            cursor = collection.find(filter=page_filter, max_time_ms=admission.max_time_ms(None))
+            cursor = cursor.sort(sort).limit(query.limit + 1)
+            documents = list(cursor)
+
+            next_cursor = None
+            if len(documents) > query.limit:
+                documents = documents[: query.limit]
+                next_cursor = encode_cursor(documents[-1], filter, sort)
+
+            content = dumps_page(documents, next_cursor, query.json_mode)
+
+            return Response(content=content, media_type="application/json")
+    except ExecutionTimeout as ex:
+        raise HTTPException(status_code=504, detail=f"Query exceeded max_time_ms: {ex}")
+    except (FilterDecodeError, InvalidCursorError) as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not query documents: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/find/stream",
+    operation_id="stream_documents",
+    response_class=StreamingResponse,
+    tags=["streaming"],
+)
+def stream_documents(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: StreamFindQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> StreamingResponse:
+    """
+    Stream documents in the specified collection as NDJSON or a JSON array, one chunk per server batch.
+    """
 
-        filter = query.filter
+    logger = getLogger(__name__ + ".stream_documents")
+    query.max_time_ms = admission.max_time_ms(query.max_time_ms)
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
 
-        if "_id" in filter:
-            try:
-                filter["_id"] = ObjectId(filter["_id"])
-            except:
-                pass
+        # The lease is held until the stream completes or the client disconnects
+        lease = mongo_clients.acquire(connection_string)
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not query documents: {ex}")
 
-        documents = collection.find(filter=filter).limit(query.limit).skip(query.skip).sort(query.sort)
+    try:
+        collection = lease.client[db_name][collection_name]
 
-        res = [json.loads(json.dumps(document, default=str)) for document in documents]
+        filter = decode_filter(query.filter, field_types(lease.client, connection_string, db_name, collection_name))
 
-        return res
+        collection = with_read_preference(collection, query.read_preference)
+        cursor = collection.find_raw_batches(filter=filter, **find_kwargs(query))
+        first_batch = next(cursor, None)
+    except ExecutionTimeout as ex:
+        mongo_clients.release(lease)
+        raise HTTPException(status_code=504, detail=f"Query exceeded max_time_ms: {ex}")
+    except FilterDecodeError as ex:
+        mongo_clients.release(lease)
+        raise HTTPException(status_code=400, detail=str(ex))
     except Exception as ex:
+        mongo_clients.release(lease)
         logger.exception(ex)
         raise HTTPException(status_code=500, detail=f"Could not query documents: {ex}")
-    finally:
-        if client:
-            client.close()
+
+    # The slot is released with the lease, once the stream has finished or was abandoned
+    release_admission = admission.hold()
+
+    def on_close():
+        mongo_clients.release(lease)
+        release_admission()
+
+    return StreamingResponse(
+        iter_raw_batches(
+            cursor,
+            first_batch,
+            query.format,
+            query.json_mode,
+            on_close=on_close,
+            charge=admission.wait_for_documents,
+        ),
+        media_type=MEDIA_TYPES[query.format],
+    )
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/watch",
+    operation_id="watch_collection",
+    response_class=StreamingResponse,
+    tags=["streaming"],
+)
+async def watch_collection(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: WatchQueryInput,
+    last_event_id: Optional[str] = Header(default=None, description="The id of the last event an SSE client received"),
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> StreamingResponse:
+    """
+    Stream the changes to a collection as Server-Sent Events, with the resume token as the event id
+    and a keepalive comment when idle. Reconnect with Last-Event-ID, or resume_after, to resume.
+    """
+
+    logger = getLogger(__name__ + ".watch_collection")
+    try:
+        validate_watch(query)
+
+        mongo_details = await run_in_threadpool(platform_client.get_mongodb_details, mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        resume_after = query.resume_after or last_event_id
+        subscriber = await change_streams.subscribe(connection_string, db_name, collection_name, query, resume_after)
+        # Waiting for changes uses no query capacity, so the slot is given back once subscribed
+        admission.release()
+    except PipelineNotAllowedError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except ChangeStreamLimitError as ex:
+        raise HTTPException(status_code=503, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not watch changes: {ex}")
+
+    return StreamingResponse(
+        iter_sse(subscriber, query.json_mode, settings.CHANGE_STREAM_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.post(
+    path="/databases/{db_name}/watch",
+    operation_id="watch_database",
+    response_class=StreamingResponse,
+    tags=["streaming"],
+)
+async def watch_database(
+    mongo_project: str,
+    db_name: str,
+    query: WatchQueryInput,
+    last_event_id: Optional[str] = Header(default=None, description="The id of the last event an SSE client received"),
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> StreamingResponse:
+    """
+    Stream the changes to every collection of a database as Server-Sent Events, like watch_collection.
+    """
+
+    logger = getLogger(__name__ + ".watch_database")
+    try:
+        validate_watch(query)
+
+        mongo_details = await run_in_threadpool(platform_client.get_mongodb_details, mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        resume_after = query.resume_after or last_event_id
+        subscriber = await change_streams.subscribe(connection_string, db_name, None, query, resume_after)
+        # Waiting for changes uses no query capacity, so the slot is given back once subscribed
+        admission.release()
+    except PipelineNotAllowedError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except ChangeStreamLimitError as ex:
+        raise HTTPException(status_code=503, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not watch changes: {ex}")
+
+    return StreamingResponse(
+        iter_sse(subscriber, query.json_mode, settings.CHANGE_STREAM_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/changes",
+    operation_id="poll_collection_changes",
+    response_model=ChangesQueryResult,
+)
+async def poll_collection_changes(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: ChangesQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> Response:
+    """
+    Get the changes to a collection after resume_after, waiting up to wait_ms for one. Pass the returned
+    resume_token as resume_after in the next call; without resume_after, only changes from now on are
+    returned. Use this to detect new or changed documents instead of repeating finds.
+    """
+
+    logger = getLogger(__name__ + ".poll_collection_changes")
+    try:
+        validate_watch(query)
+
+        mongo_details = await run_in_threadpool(platform_client.get_mongodb_details, mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        subscriber = await change_streams.subscribe(
+            connection_string, db_name, collection_name, query, query.resume_after
+        )
+        # Waiting for changes uses no query capacity, so the slot is given back once subscribed
+        admission.release()
+        content = await poll_changes(subscriber, query)
+
+        return Response(content=content, media_type="application/json")
+    except PipelineNotAllowedError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except ChangeStreamLimitError as ex:
+        raise HTTPException(status_code=503, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not get changes: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/changes",
+    operation_id="poll_database_changes",
+    response_model=ChangesQueryResult,
+)
+async def poll_database_changes(
+    mongo_project: str,
+    db_name: str,
+    query: ChangesQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> Response:
+    """
+    Get the changes to every collection of a database, like poll_collection_changes.
+    """
+
+    logger = getLogger(__name__ + ".poll_database_changes")
+    try:
+        validate_watch(query)
+
+        mongo_details = await run_in_threadpool(platform_client.get_mongodb_details, mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        subscriber = await change_streams.subscribe(connection_string, db_name, None, query, query.resume_after)
+        # Waiting for changes uses no query capacity, so the slot is given back once subscribed
+        admission.release()
+        content = await poll_changes(subscriber, query)
+
+        return Response(content=content, media_type="application/json")
+    except PipelineNotAllowedError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except ChangeStreamLimitError as ex:
+        raise HTTPException(status_code=503, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not get changes: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/export/plan",
+    operation_id="plan_export",
+    response_model=ExportPlanQueryResult,
+    tags=["streaming"],
+)
+def plan_export(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: ExportPlanQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> ExportPlanQueryResult:
+    """
+    Split a collection into key ranges for a parallel, resumable export.
+    Pass the range tokens to export_documents; a range that failed can be exported again on its own.
+    """
+
+    logger = getLogger(__name__ + ".plan_export")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+
+            ranges = plan_ranges(collection, query.key, filter, query.partitions)
+
+            return ExportPlanQueryResult(
+                key=query.key,
+                ranges=[
+                    ExportRangeResult(
+                        range_token=encode_range_token(export_range, db_name, collection_name, query.key, filter),
+                        **export_range.describe(),
+                    )
+                    for export_range in ranges
+                ],
+            )
+    except FilterDecodeError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not plan export: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/export",
+    operation_id="export_documents",
+    response_class=StreamingResponse,
+    tags=["streaming"],
+)
+def export_documents(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: ExportQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> StreamingResponse:
+    """
+    Export the documents of a collection as NDJSON, a BSON dump or CSV, optionally compressed.
+    The collection is split into key ranges that are scanned in parallel and streamed as one response.
+    """
+
+    logger = getLogger(__name__ + ".export_documents")
+    if query.format == "csv" and not query.fields:
+        raise HTTPException(status_code=400, detail="CSV exports require fields")
+
+    compress = compressor(query.compression)
+
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        # The lease is held until the export completes or the client disconnects
+        lease = mongo_clients.acquire(connection_string)
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not export documents: {ex}")
+
+    try:
+        collection = lease.client[db_name][collection_name]
+
+        filter = decode_filter(query.filter, field_types(lease.client, connection_string, db_name, collection_name))
+
+        if query.range_tokens:
+            ranges = [
+                decode_range_token(token, db_name, collection_name, query.key, filter) for token in query.range_tokens
+            ]
+        else:
+            ranges = plan_ranges(collection, query.key, filter, query.partitions)
+    except (FilterDecodeError, InvalidRangeTokenError) as ex:
+        mongo_clients.release(lease)
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        mongo_clients.release(lease)
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not export documents: {ex}")
+
+    # The slot is released with the lease, once the stream has finished or was abandoned
+    release_admission = admission.hold()
+
+    def on_close():
+        mongo_clients.release(lease)
+        release_admission()
+
+    return StreamingResponse(
+        iter_export(
+            collection,
+            query.key,
+            filter,
+            ranges,
+            encoder(query.format, query.json_mode, query.fields),
+            csv_header(query.fields) if query.format == "csv" else b"",
+            compress,
+            query.workers,
+            {
+                "projection": query.projection,
+                "batch_size": query.batch_size,
+                "max_time_ms": admission.max_time_ms(None),
+            },
+            on_close=on_close,
+            charge=admission.wait_for_documents,
+        ),
+        media_type=media_type(query.format, query.compression),
+        headers={"Content-Disposition": content_disposition(collection_name, query.format, query.compression)},
+    )
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/aggregate",
+    operation_id="aggregate_documents",
+    response_model=list[dict],
+)
+def aggregate_documents(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: AggregateQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> StreamingResponse:
+    """
+    Run an aggregation pipeline on the specified collection. Use this to group, count and reduce
+    documents on the server instead of fetching them. Results are streamed as they are produced.
+    """
+
+    logger = getLogger(__name__ + ".aggregate_documents")
+    query.max_time_ms = admission.max_time_ms(query.max_time_ms)
+    try:
+        validate_pipeline(query.pipeline)
+
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        # The lease is held until the stream completes or the client disconnects
+        lease = mongo_clients.acquire(connection_string)
+    except PipelineNotAllowedError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not aggregate documents: {ex}")
+
+    try:
+        collection = lease.client[db_name][collection_name]
+
+        cursor = collection.aggregate_raw_batches(query.pipeline, **aggregate_kwargs(query))
+        first_batch = next(cursor, None)
+    except ExecutionTimeout as ex:
+        mongo_clients.release(lease)
+        raise HTTPException(status_code=504, detail=f"Aggregation exceeded max_time_ms: {ex}")
+    except Exception as ex:
+        mongo_clients.release(lease)
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not aggregate documents: {ex}")
+
+    # The slot is released with the lease, once the stream has finished or was abandoned
+    release_admission = admission.hold()
+
+    def on_close():
+        mongo_clients.release(lease)
+        release_admission()
+
+    return StreamingResponse(
+        iter_raw_batches(
+            cursor,
+            first_batch,
+            query.format,
+            query.json_mode,
+            on_close=on_close,
+            charge=admission.wait_for_documents,
+        ),
+        media_type=MEDIA_TYPES[query.format],
+    )
+
+
+@router.post(
+    path="/batch",
+    operation_id="batch_operations",
+    response_model=BatchQueryResult,
+)
+def batch_operations(
+    mongo_project: str,
+    query: BatchQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+    admission: Admission = Depends(admit),
+) -> Response:
+    """
+    Run several find, count, aggregate and distinct operations, on any databases and collections
+    of the project, in one call. Up to concurrency operations run at the same time. Results are
+    returned in order, each with its own error and duration, so one failed operation does not fail the rest.
+    """
+
+    logger = getLogger(__name__ + ".batch_operations")
+    query.concurrency = admission.concurrency(query.concurrency)
+    for operation in query.operations:
+        operation.max_time_ms = admission.max_time_ms(operation.max_time_ms)
+        if operation.op == "find":
+            operation.limit = admission.limit(operation.limit)
+    admission.charge_documents(sum(operation.limit for operation in query.operations if operation.op == "find"))
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            results = run_batch(
+                client,
+                connection_string,
+                query.operations,
+                query.concurrency,
+                "batch_operations",
+                max_results=admission.limit(0),
+                charge=admission.charge_documents,
+            )
+
+            # Encoded once straight into the response body, skipping response_model revalidation
+            content = dumps_document({"results": results}, query.json_mode)
+
+            return Response(content=content, media_type="application/json")
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not run batch: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/explain",
+    operation_id="explain_query",
+    response_model=ExplainQueryResult,
+)
+def explain_query(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: ExplainQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> ExplainQueryResult:
+    """
+    Explain how a find, aggregate, update or delete would run: the winning plan, the indexes it uses
+    and, unless the verbosity is queryPlanner, the keys and documents examined versus returned and
+    the execution time. Updates and deletes are planned but not applied.
+    """
+
+    logger = getLogger(__name__ + ".explain_query")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        if query.operation == "aggregate":
+            validate_pipeline(query.pipeline)
+
+        with mongo_clients.lease(connection_string) as client:
+            decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+            if query.update is not None:
+                decode_update(query.update)
+            command = explain_command(collection_name, query)
+
+            explain = client[db_name].command("explain", command, verbosity=query.verbosity)
+
+            return summarize_explain(explain)
+    except (ExplainOptionsError, FilterDecodeError, PipelineNotAllowedError) as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not explain query: {ex}")
+
+
+@router.get(
+    path="/databases/{db_name}/collections/{collection_name}/indexes",
+    operation_id="list_indexes",
+    response_model=list[IndexResult],
+)
+def list_indexes(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> list[IndexResult]:
+    """
+    List the indexes of the specified collection.
+    """
+
+    logger = getLogger(__name__ + ".list_indexes")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            return [index_result(spec) for spec in collection.list_indexes()]
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not list indexes: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/indexes",
+    operation_id="create_index",
+    response_model=CreateIndexQueryResult,
+)
+def create_index(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: CreateIndexQueryInput,
+    background_tasks: BackgroundTasks,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> CreateIndexQueryResult:
+    """
+    Create an index on the specified collection. Set wait to false for large collections: the build
+    then continues after the response and its progress shows in index_usage.
+    """
+
+    logger = getLogger(__name__ + ".create_index")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        model = index_model(query)
+        name = model.document["name"]
+
+        if not query.wait:
+            background_tasks.add_task(
+                build_index, connection_string, db_name, collection_name, model, create_indexes_kwargs(query)
+            )
+            return CreateIndexQueryResult(name=name, status="building")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+            with creating((connection_string, db_name, collection_name)):
+                collection.create_indexes([model], **create_indexes_kwargs(query))
+
+            return CreateIndexQueryResult(name=name, status="created")
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not create index: {ex}")
+
+
+@router.delete(
+    path="/databases/{db_name}/collections/{collection_name}/indexes/{index_name}",
+    operation_id="drop_index",
+    response_model=DropIndexQueryResult,
+)
+def drop_index(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    index_name: str,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> DropIndexQueryResult:
+    """
+    Drop an index from the specified collection by name.
+    """
+
+    logger = getLogger(__name__ + ".drop_index")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+            collection.drop_index(index_name)
+
+            return DropIndexQueryResult(name=index_name)
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not drop index: {ex}")
+
+
+@router.get(
+    path="/databases/{db_name}/collections/{collection_name}/indexes/usage",
+    operation_id="index_usage",
+    response_model=list[IndexUsageResult],
+)
+def index_usage(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> list[IndexUsageResult]:
+    """
+    Get how often each index of the specified collection has been used since the server started
+    or the index was created, and whether it is still being built. Unused indexes only slow down writes.
+    """
+
+    logger = getLogger(__name__ + ".index_usage")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+            cursor = collection.aggregate([{"$indexStats": {}}])
+
+            return [index_usage_result(stats) for stats in cursor]
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not get index usage: {ex}")
+
+
+@router.get(
+    path="/databases/{db_name}/collections/{collection_name}/indexes/advice",
+    operation_id="advise_indexes",
+    response_model=IndexAdviceResult,
+)
+def advise_indexes(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    sample_size: int = Query(
+        default=settings.INDEX_ADVISOR_SAMPLE_SIZE,
+        ge=0,
+        le=100000,
+        description="The number of documents sampled to estimate selectivity. 0 skips sampling",
+    ),
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> IndexAdviceResult:
+    """
+    Recommend compound indexes for the filter and sort shapes that query_documents, update_documents
+    and delete_documents have sent to the specified collection. Keys follow the ESR rule: equality
+    fields first, most selective first, then sort fields, then range fields. Shapes an existing index
+    already serves name it in covered_by.
+    """
+
+    logger = getLogger(__name__ + ".advise_indexes")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            shapes = index_advisor.shapes((connection_string, db_name, collection_name))
+            indexes = [index_result(spec) for spec in collection.list_indexes()]
+
+            fields = equality_fields(shapes)
+            sample = None
+            if fields and sample_size:
+                cursor = collection.aggregate(selectivity_pipeline(fields, sample_size))
+                sample = next(cursor, None)
+            sampled, distinct = parse_selectivity(sample, fields)
+
+            return recommend_indexes(f"{db_name}.{collection_name}", shapes, indexes, sampled, distinct)
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not advise indexes: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/bulk",
+    operation_id="bulk_write_documents",
+    response_model=BulkWriteQueryResult,
+)
+def bulk_write_documents(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    query: BulkWriteQueryInput,
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> BulkWriteQueryResult:
+    """
+    Run a mix of insert, update, replace and delete operations in the specified collection as bulk writes.
+    Failed operations are reported individually instead of failing the whole request.
+    """
+
+    logger = getLogger(__name__ + ".bulk_write_documents")
+    try:
+        mongo_details = platform_client.get_mongodb_details(mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            summary = BulkWriteSummary()
+
+            def execute(batch):
+                return execute_batch(collection, batch, query.ordered, summary)
+
+            batches = iter_batches(query.operations, query.batch_size, summary)
+            namespace = (connection_string, db_name, collection_name)
+            with query_cache.invalidating(namespace), creating(namespace):
+                run_batches(batches, execute, query.ordered, query.workers)
+
+            return summary.result
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not write documents: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/bulk/ndjson",
+    operation_id="bulk_write_ndjson",
+    response_model=BulkWriteQueryResult,
+    tags=["streaming"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": {"$ref": "#/components/schemas/BulkWriteOperation"}}},
+        }
+    },
+)
+async def bulk_write_ndjson(
+    request: Request,
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    ordered: bool = Query(default=False, description="Whether to stop at the first error"),
+    batch_size: int = Query(default=1000, ge=1, le=100000, description="The number of operations per bulk batch"),
+    workers: int = Query(default=1, ge=1, le=16, description="The number of batches written in parallel"),
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> BulkWriteQueryResult:
+    """
+    Run bulk writes from an NDJSON body with one operation per line. The body is parsed as it arrives
+    and written in batches, so uploads of any size use bounded memory.
+    """
+
+    logger = getLogger(__name__ + ".bulk_write_ndjson")
+    try:
+        mongo_details = await run_in_threadpool(platform_client.get_mongodb_details, mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+            summary = BulkWriteSummary()
+
+            async def execute(batch):
+                return await run_in_threadpool(execute_batch, collection, batch, ordered, summary)
+
+            batches = aiter_ndjson_batches(aiter_lines(request.stream()), batch_size, summary)
+            namespace = (connection_string, db_name, collection_name)
+            with query_cache.invalidating(namespace), creating(namespace):
+                await arun_batches(batches, execute, ordered, workers)
+
+            return summary.result
+    except Exception as ex:
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not write documents: {ex}")
+
+
+@router.post(
+    path="/databases/{db_name}/collections/{collection_name}/documents/import",
+    operation_id="import_documents",
+    response_model=ImportQueryResult,
+    tags=["streaming"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": {"type": "object"}}},
+        }
+    },
+)
+async def import_documents(
+    request: Request,
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    format: ImportFormat = Query(default="ndjson", description="ndjson, or mongoexport for Extended JSON lines"),
+    mode: ImportMode = Query(
+        default="insert",
+        description="insert, dedup to skip documents whose _id already exists, or upsert to replace them",
+    ),
+    batch_size: int = Query(default=1000, ge=1, le=100000, description="The number of documents per insert batch"),
+    workers: int = Query(default=4, ge=1, le=16, description="The number of batches written in parallel"),
+    import_id: Optional[str] = Query(
+        default=None, max_length=64, description="An id to poll the progress with. Generated when omitted"
+    ),
+    current_token: TokenData = Depends(get_current_token),
+    platform_client: PlatformIntegrationClient = Depends(get_platform_client),
+) -> ImportQueryResult:
+    """
+    Import documents from an NDJSON or mongoexport body with one document per line. The body is parsed
+    as it arrives and written by parallel unordered insert workers, and the upload is throttled when the
+    workers fall behind. Poll import_progress with the import_id to follow a running import.
+    """
+
+    logger = getLogger(__name__ + ".import_documents")
+    import_id = import_id or uuid.uuid4().hex
+    summary = ImportSummary(import_id, skip_duplicates=mode == "dedup")
+    import_progress.start((current_token.id, import_id), summary)
+    try:
+        mongo_details = await run_in_threadpool(platform_client.get_mongodb_details, mongo_project)
+        connection_string = mongo_details.get("connection_string")
+
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
+
+            async def execute(batch):
+                batch_summary = ImportSummary(import_id, summary.skip_duplicates)
+                ok = await run_in_threadpool(execute_batch, collection, batch, False, batch_summary)
+                summary.add_batch(batch, batch_summary)
+                return ok
+
+            batches = aiter_import_batches(aiter_lines(request.stream()), format, mode, batch_size, summary)
+            namespace = (connection_string, db_name, collection_name)
+            with query_cache.invalidating(namespace), creating(namespace):
+                await arun_batches(batches, execute, False, workers)
+
+            summary.set_status("completed")
+            return summary.snapshot()
+    except Exception as ex:
+        summary.set_status("failed")
+        logger.exception(ex)
+        raise HTTPException(status_code=500, detail=f"Could not import documents: {ex}")
+
+
+@router.get(
+    path="/imports/{import_id}",
+    operation_id="import_progress",
+    response_model=ImportQueryResult,
+    tags=["streaming"],
+)
+def get_import_progress(
+    import_id: str,
+    current_token: TokenData = Depends(get_current_token),
+) -> ImportQueryResult:
+    """
+    Get the progress of a running or recent import.
+    """
+
+    summary = import_progress.get((current_token.id, import_id))
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Import {import_id} not found")
+
+    return summary.snapshot()
 
 
 @router.patch(
@@ -187,34 +1442,26 @@ def update_documents(
     """
 
     logger = getLogger(__name__ + ".query_documents")
-    client: MongoClient | None = None
     try:
         mongo_details = platform_client.get_mongodb_details(mongo_project)
         connection_string = mongo_details.get("connection_string")
 
-        client = MongoClient(connection_string)
-        collection = client[db_name][collection_name]
+        with mongo_clients.lease(connection_string) as client:
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
+            update = decode_update(query.update)
 
-        filter = query.filter
+            index_advisor.observe((connection_string, db_name, collection_name), filter, None, "update_documents")
 
-        if "_id" in filter:
-            try:
-                filter["_id"] = ObjectId(filter["_id"])
-            except:
-                pass
+            namespace = (connection_string, db_name, collection_name)
+            with query_cache.invalidating(namespace), creating(namespace):
+                res = write_coalescer.update(client, namespace, filter, update, query.multi, query.upsert)
 
-        if query.multi:
-            res = collection.update_many(filter=filter, update=query.update, upsert=query.upsert)
-        else:
-            res = collection.update_one(filter=filter, update=query.update, upsert=query.upsert)
-
-        return UpdateQueryResult(matched_count=res.matched_count, modified_count=res.modified_count)
+            return UpdateQueryResult(matched_count=res.matched_count, modified_count=res.modified_count)
+    except FilterDecodeError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
     except Exception as ex:
         logger.exception(ex)
         raise HTTPException(status_code=500, detail=f"Could not update documents: {ex}")
-    finally:
-        if client:
-            client.close()
 
 
 @router.delete(
@@ -234,31 +1481,26 @@ def delete_documents(
     """
 
     logger = getLogger(__name__ + ".query_documents")
-    client: MongoClient | None = None
     try:
         mongo_details = platform_client.get_mongodb_details(mongo_project)
         connection_string = mongo_details.get("connection_string")
 
-        client = MongoClient(connection_string)
-        collection = client[db_name][collection_name]
+        with mongo_clients.lease(connection_string) as client:
+            collection = client[db_name][collection_name]
 
-        filter = query.filter
+            filter = decode_filter(query.filter, field_types(client, connection_string, db_name, collection_name))
 
-        if "_id" in filter:
-            try:
-                filter["_id"] = ObjectId(filter["_id"])
-            except:
-                pass
+            index_advisor.observe((connection_string, db_name, collection_name), filter, None, "delete_documents")
 
-        if query.multi:
-            res = collection.delete_many(filter=filter)
-        else:
-            res = collection.delete_one(filter=filter)
+            with query_cache.invalidating((connection_string, db_name, collection_name)):
+                if query.multi:
+                    res = collection.delete_many(filter=filter)
+                else:
+                    res = collection.delete_one(filter=filter)
 
-        return DeleteQueryResult(deleted_count=res.deleted_count)
+            return DeleteQueryResult(deleted_count=res.deleted_count)
+    except FilterDecodeError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
     except Exception as ex:
         logger.exception(ex)
         raise HTTPException(status_code=500, detail=f"Could not delete documents: {ex}")
-    finally:
-        if client:
-            client.close()
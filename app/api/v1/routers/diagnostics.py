@@ -0,0 +1,190 @@
+from core.admission import admission_controller
+from core.authentication.role import allow_resource_admin
+from core.authentication.subscription import timed_cache
+from core.change_streams import change_streams
+from core.explain import slow_queries
+from core.filters import async_field_types_cache, field_types_cache, filter_decoder
+from core.metadata import async_metadata_cache, metadata_cache
+from core.mongo_client_registry import async_mongo_clients, mongo_clients
+from core.platfom_integration_client import (
+    async_graph_token_cache,
+    async_mongodb_details_cache,
+    async_power_automate_flow_cache,
+    graph_token_cache,
+    mongodb_details_cache,
+    power_automate_flow_cache,
+)
+from core.query_cache import query_cache
+from core.write_coalescer import async_write_coalescer, write_coalescer
+from fastapi import APIRouter, Depends, Query
+from schemas.database import SlowQueryResult
+
+router = APIRouter(dependencies=[Depends(allow_resource_admin)])
+
+
+@router.get(
+    path="/diagnostics/mongo-pools",
+    operation_id="mongo_pool_stats",
+    response_model=dict,
+)
+def mongo_pool_stats() -> dict:
+    """
+    Get statistics for the shared MongoDB client pools.
+    """
+
+    return {
+        "sync": mongo_clients.stats(),
+        "async": async_mongo_clients.stats(),
+    }
+
+
+@router.get(
+    path="/diagnostics/platform-cache",
+    operation_id="platform_cache_stats",
+    response_model=dict,
+)
+def platform_cache_stats() -> dict:
+    """
+    Get hit and miss counters for the platform integration caches.
+    """
+
+    return {
+        "mongodb_details": mongodb_details_cache.stats(),
+        "graph_token": graph_token_cache.stats(),
+        "power_automate_flow": power_automate_flow_cache.stats(),
+        "async_mongodb_details": async_mongodb_details_cache.stats(),
+        "async_graph_token": async_graph_token_cache.stats(),
+        "async_power_automate_flow": async_power_automate_flow_cache.stats(),
+    }
+
+
+@router.get(
+    path="/diagnostics/change-streams",
+    operation_id="change_stream_stats",
+    response_model=dict,
+)
+async def change_stream_stats() -> dict:
+    """
+    Get the shared and dedicated change streams open, their subscribers and events, and how many
+    reconnecting subscribers were replayed from memory.
+    """
+
+    return change_streams.stats()
+
+
+@router.get(
+    path="/diagnostics/metadata-cache",
+    operation_id="metadata_cache_stats",
+    response_model=dict,
+)
+def metadata_cache_stats() -> dict:
+    """
+    Get hit and miss counters for the database and collection listing caches.
+    """
+
+    return {
+        "sync": metadata_cache.stats(),
+        "async": async_metadata_cache.stats(),
+    }
+
+
+@router.get(
+    path="/diagnostics/filter-decoder",
+    operation_id="filter_decoder_stats",
+    response_model=dict,
+)
+def filter_decoder_stats() -> dict:
+    """
+    Get the filter shapes compiled and their hit ratio, and the sampled field type caches.
+    """
+
+    return {
+        "shapes": filter_decoder.stats(),
+        "field_types": field_types_cache.stats(),
+        "async_field_types": async_field_types_cache.stats(),
+    }
+
+
+@router.get(
+    path="/diagnostics/subscription-cache",
+    operation_id="subscription_cache_stats",
+    response_model=dict,
+)
+def subscription_cache_stats() -> dict:
+    """
+    Get hit, miss, refresh and failure counters for the subscription tier cache.
+    """
+
+    return timed_cache.stats()
+
+
+@router.get(
+    path="/diagnostics/admission",
+    operation_id="admission_stats",
+    response_model=dict,
+)
+def admission_stats() -> dict:
+    """
+    Get the admission control limits per tier, the tenants tracked, their running and queued
+    requests, and the requests rejected per exhausted budget.
+    """
+
+    return admission_controller.stats()
+
+
+@router.get(
+    path="/diagnostics/write-coalescer",
+    operation_id="write_coalescer_stats",
+    response_model=dict,
+)
+def write_coalescer_stats() -> dict:
+    """
+    Get the coalesced batches sent, the writes they carried and the writes sent on their own.
+    """
+
+    return {
+        "sync": write_coalescer.stats(),
+        "async": async_write_coalescer.stats(),
+    }
+
+
+@router.get(
+    path="/diagnostics/slow-queries",
+    operation_id="slow_queries",
+    response_model=list[SlowQueryResult],
+)
+def list_slow_queries(
+    limit: int = Query(default=100, ge=1, le=10000, description="The number of queries to return"),
+) -> list[SlowQueryResult]:
+    """
+    Get the most recent slow query_documents calls, newest first, with their query shape and plan summary.
+    Capturing is enabled with SLOW_QUERY_CAPTURE_ENABLED.
+    """
+
+    return slow_queries.entries(limit)
+
+
+@router.get(
+    path="/diagnostics/slow-queries/stats",
+    operation_id="slow_query_stats",
+    response_model=dict,
+)
+def slow_query_stats() -> dict:
+    """
+    Get the slow query capture settings and the number of queries recorded.
+    """
+
+    return slow_queries.stats()
+
+
+@router.get(
+    path="/diagnostics/query-cache",
+    operation_id="query_cache_stats",
+    response_model=dict,
+)
+def query_cache_stats() -> dict:
+    """
+    Get the size, hit ratio, bypass and invalidation counters of the query result cache.
+    """
+
+    return query_cache.stats()
@@ -0,0 +1,400 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable
+
+from core.authentication.auth_middleware import get_current_token
+from core.authentication.subscription import SubscriptionTier, validate_subscription
+from core.config import settings
+from core.metrics import admission_rejections, admission_wait
+from fastapi import Depends, HTTPException
+from schemas.token import TokenData
+
+
+class TierLimits:
+    """What one tenant of a subscription tier may use at a time"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queued: int,
+        max_queue_wait: float,
+        requests_per_second: float,
+        request_burst: int,
+        documents_per_second: float,
+        document_burst: int,
+        max_time_ms: int,
+        max_limit: int,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_queue_wait = max_queue_wait
+        self.requests_per_second = requests_per_second
+        self.request_burst = request_burst
+        self.documents_per_second = documents_per_second
+        self.document_burst = document_burst
+        self.max_time_ms = max_time_ms
+        self.max_limit = max_limit
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+DEFAULT_TIER_LIMITS: dict[str, dict] = {
+    "FREE": {
+        "max_concurrency": 2,
+        "max_queued": 4,
+        "max_queue_wait": 1,
+        "requests_per_second": 5,
+        "request_burst": 10,
+        "documents_per_second": 1000,
+        "document_burst": 5000,
+        "max_time_ms": 5000,
+        "max_limit": 1000,
+    },
+    "BASIC": {
+        "max_concurrency": 4,
+        "max_queued": 8,
+        "max_queue_wait": 2,
+        "requests_per_second": 20,
+        "request_burst": 40,
+        "documents_per_second": 5000,
+        "document_burst": 20000,
+        "max_time_ms": 10000,
+        "max_limit": 5000,
+    },
+    "STANDARD": {
+        "max_concurrency": 8,
+        "max_queued": 16,
+        "max_queue_wait": 2,
+        "requests_per_second": 50,
+        "request_burst": 100,
+        "documents_per_second": 20000,
+        "document_burst": 100000,
+        "max_time_ms": 30000,
+        "max_limit": 10000,
+    },
+    "PRO": {
+        "max_concurrency": 16,
+        "max_queued": 32,
+        "max_queue_wait": 5,
+        "requests_per_second": 100,
+        "request_burst": 200,
+        "documents_per_second": 50000,
+        "document_burst": 250000,
+        "max_time_ms": 60000,
+        "max_limit": 10000,
+    },
+    "ENTERPRISE": {
+        "max_concurrency": 32,
+        "max_queued": 64,
+        "max_queue_wait": 5,
+        "requests_per_second": 250,
+        "request_burst": 500,
+        "documents_per_second": 200000,
+        "document_burst": 1000000,
+        "max_time_ms": 120000,
+        "max_limit": 10000,
+    },
+}
+
+
+def tier_limits(overrides: dict[str, dict]) -> dict[str, TierLimits]:
+    """Returns the limits of every tier, with the configured overrides applied on top of the defaults"""
+    return {
+        tier: TierLimits(**{**defaults, **overrides.get(tier, {})}) for tier, defaults in DEFAULT_TIER_LIMITS.items()
+    }
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is over its tenant's budget. `retry_after` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Thread safe token bucket refilled continuously at `rate` tokens per second, up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float = 1) -> float:
+        """
+        Takes `amount` tokens. Returns 0 if they were taken, otherwise the seconds until they are
+        available, without taking any. An amount over the capacity takes the full bucket.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.rate
+
+
+class _TenantState:
+    def __init__(self, limits: TierLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_second, limits.request_burst)
+        self.documents = TokenBucket(limits.documents_per_second, limits.document_burst)
+        self.slots = asyncio.Semaphore(limits.max_concurrency)
+        self.active = 0
+        self.waiting = 0
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and self.waiting == 0
+
+
+def _retry_after(seconds: float) -> int:
+    return max(1, math.ceil(seconds))
+
+
+class Admission:
+    """
+    The admission of one request, handed to routes to apply the per-tier caps and charge documents.
+    A request admitted while admission control is disabled has no limits.
+    """
+
+    def __init__(
+        self,
+        tier: str,
+        limits: TierLimits | None = None,
+        state: _TenantState | None = None,
+        controller: "AdmissionController | None" = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ):
+        self.tier = tier
+        self.limits = limits
+        self._state = state
+        self._controller = controller
+        self._loop = loop
+        self.held = False
+        self._released = False
+
+    def hold(self) -> Callable[[], None]:
+        """
+        Keeps the concurrency slot after the route returns, for a streamed response whose body
+        is sent later. Returns the callback releasing it, to call once the stream has finished
+        or was abandoned.
+        """
+        self.held = True
+        return self.release
+
+    def release(self):
+        """Gives the concurrency slot back. Can be called more than once, and from any thread."""
+        if self._controller is None:
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        # The slot semaphore belongs to the event loop; sync streams finish on a worker thread
+        if running is self._loop:
+            self._release()
+        else:
+            self._loop.call_soon_threadsafe(self._release)
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._controller.release(self)
+
+    def max_time_ms(self, requested: int | None) -> int | None:
+        """Returns the server time limit of a query: the tier maximum, or less if the caller asked for less"""
+        if self.limits is None:
+            return requested
+        return self.limits.max_time_ms if requested is None else min(requested, self.limits.max_time_ms)
+
+    def limit(self, requested: int) -> int:
+        """Returns the number of documents a query may return. 0, no limit, is capped too."""
+        if self.limits is None:
+            return requested
+        return self.limits.max_limit if requested == 0 else min(requested, self.limits.max_limit)
+
+    def concurrency(self, requested: int) -> int:
+        """Returns how many operations of a batch may run at the same time"""
+        return requested if self.limits is None else min(requested, self.limits.max_concurrency)
+
+    def charge_documents(self, count: int):
+        """
+        Takes up to `count` documents from the tenant's document budget.
+
+        Raises:
+            HTTPException: 429 if the budget cannot cover them
+        """
+        if self._state is None or count <= 0:
+            return
+
+        wait = self._state.documents.take(count)
+        if wait:
+            rate = self.limits.documents_per_second
+            detail = f"Document budget of the {self.tier} tier exceeded, {rate:g} documents per second"
+            raise too_many_requests(self._controller._reject(self.tier, "documents", wait, detail))
+
+    def wait_for_documents(self, count: int):
+        """
+        Takes `count` documents from the tenant's document budget, sleeping until it covers them.
+        Used by streamed responses, which can no longer be rejected once started, so they are
+        slowed to the tier's document rate instead.
+        """
+        if self._state is None or count <= 0:
+            return
+
+        while wait := self._state.documents.take(count):
+            time.sleep(wait)
+
+    async def await_documents(self, count: int):
+        """Async variant of `wait_for_documents`"""
+        if self._state is None or count <= 0:
+            return
+
+        while wait := self._state.documents.take(count):
+            await asyncio.sleep(wait)
+
+
+class AdmissionController:
+    """
+    Per-tenant admission control, by subscription tier. Each tenant gets a request and a
+    document token bucket and a number of concurrent requests. Requests over the concurrency
+    limit queue for at most `max_queue_wait` seconds; requests over a budget, or that find the
+    queue full, are rejected with the seconds after which to retry.
+
+    Tenants are kept in a bounded LRU. Only idle tenants are evicted, so their buckets restart full.
+    Runs on the event loop: routes are admitted by an async dependency, sync routes included.
+    """
+
+    def __init__(self, limits: dict[str, TierLimits], max_tenants: int, enabled: bool = True):
+        self.enabled = enabled
+        self.limits = limits
+        self.max_tenants = max_tenants
+        self._tenants: OrderedDict[tuple[str, str], _TenantState] = OrderedDict()
+        self.admitted = 0
+        self.rejected: dict[str, int] = {"requests": 0, "concurrency": 0, "documents": 0}
+
+    def _tenant(self, tenant_id: str, tier: str) -> _TenantState:
+        # Keyed by tier too, so a tenant changing tier starts with the limits of the new one
+        key = (tenant_id, tier)
+        state = self._tenants.get(key)
+        if state is None:
+            state = self._tenants[key] = _TenantState(self.limits[tier])
+            if len(self._tenants) > self.max_tenants:
+                for evicted in [other for other, tenant in self._tenants.items() if tenant.idle and other != key]:
+                    if len(self._tenants) <= self.max_tenants:
+                        break
+                    del self._tenants[evicted]
+        self._tenants.move_to_end(key)
+        return state
+
+    def _reject(self, tier: str, reason: str, retry_after: float, detail: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        admission_rejections.labels(tier, reason).inc()
+        return AdmissionRejected(reason, _retry_after(retry_after), detail)
+
+    async def acquire(self, tenant_id: str, tier: str) -> Admission:
+        """
+        Admits a request, waiting for a free slot if needed. Every admission must be released.
+
+        Raises:
+            AdmissionRejected: if the request is over budget, the queue is full or the wait timed out
+        """
+        if not self.enabled or tier not in self.limits:
+            return Admission(tier)
+
+        state = self._tenant(tenant_id, tier)
+        limits = state.limits
+
+        wait = state.requests.take()
+        if wait:
+            detail = f"Request rate of the {tier} tier exceeded, {limits.requests_per_second:g} per second"
+            raise self._reject(tier, "requests", wait, detail)
+
+        if state.slots.locked():
+            if state.waiting >= limits.max_queued:
+                detail = f"Too many concurrent requests for the {tier} tier, at most {limits.max_concurrency}"
+                raise self._reject(tier, "concurrency", limits.max_queue_wait, detail)
+
+            started = time.perf_counter()
+            state.waiting += 1
+            try:
+                await asyncio.wait_for(state.slots.acquire(), limits.max_queue_wait)
+            except TimeoutError:
+                detail = f"Timed out waiting for one of the {limits.max_concurrency} request slots of the {tier} tier"
+                raise self._reject(tier, "concurrency", limits.max_queue_wait, detail)
+            finally:
+                state.waiting -= 1
+            admission_wait.labels(tier).observe(time.perf_counter() - started)
+        else:
+            await state.slots.acquire()
+
+        state.active += 1
+        self.admitted += 1
+        return Admission(tier, limits, state, self, asyncio.get_running_loop())
+
+    def release(self, admission: Admission):
+        state = admission._state
+        if state is not None:
+            state.active -= 1
+            state.slots.release()
+
+    def stats(self) -> dict:
+        tiers = {tier: {"tenants": 0, "active": 0, "waiting": 0} for tier in self.limits}
+        for (_, tier), state in self._tenants.items():
+            tiers[tier]["tenants"] += 1
+            tiers[tier]["active"] += state.active
+            tiers[tier]["waiting"] += state.waiting
+
+        return {
+            "enabled": self.enabled,
+            "tenants": len(self._tenants),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "tiers": tiers,
+            "limits": {tier: limits.as_dict() for tier, limits in self.limits.items()},
+        }
+
+
+admission_controller = AdmissionController(
+    limits=tier_limits(settings.ADMISSION_TIER_LIMITS),
+    max_tenants=settings.ADMISSION_MAX_TENANTS,
+    enabled=settings.ADMISSION_ENABLED,
+)
+
+
+def too_many_requests(ex: AdmissionRejected) -> HTTPException:
+    """The 429 response for a rejected request"""
+    return HTTPException(status_code=429, detail=str(ex), headers={"Retry-After": str(ex.retry_after)})
+
+
+async def admit(
+    current_token: TokenData = Depends(get_current_token),
+    tier: SubscriptionTier = Depends(validate_subscription),
+) -> AsyncIterator[Admission]:
+    """
+    Router dependency admitting a request for its tenant and tier. The slot is released when
+    the route returns, or, for a streamed response, by the callback `Admission.hold` returned,
+    as older FastAPI versions end the dependency before the body is sent.
+    """
+    try:
+        admission = await admission_controller.acquire(current_token.id, tier)
+    except AdmissionRejected as ex:
+        raise too_many_requests(ex)
+
+    try:
+        yield admission
+    finally:
+        if not admission.held:
+            admission.release()
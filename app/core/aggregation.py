@@ -0,0 +1,58 @@
+from typing import Any
+
+from core.config import settings
+
+# Stages that embed sub-pipelines, and where those pipelines live in the stage spec
+_NESTED_PIPELINES = {
+    "$lookup": lambda spec: [spec.get("pipeline", [])],
+    "$unionWith": lambda spec: [spec.get("pipeline", [])] if isinstance(spec, dict) else [],
+    "$facet": lambda spec: list(spec.values()),
+}
+
+
+class PipelineNotAllowedError(ValueError):
+    """Raised when an aggregation pipeline uses a stage outside the allow-list"""
+
+
+def allowed_stages() -> set[str]:
+    """Returns the configured aggregation stage allow-list"""
+    return {stage.strip() for stage in settings.AGGREGATION_ALLOWED_STAGES.split(",") if stage.strip()}
+
+
+def validate_pipeline(pipeline: list[dict[str, Any]], allowed: set[str] | None = None):
+    """
+    Checks every stage of a pipeline, including nested $lookup, $unionWith and $facet pipelines,
+    against the allow-list.
+
+    Raises:
+        PipelineNotAllowedError: if a stage is malformed or not allowed
+    """
+    allowed = allowed_stages() if allowed is None else allowed
+
+    for stage in pipeline:
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise PipelineNotAllowedError("Each pipeline stage must be a document with exactly one stage operator")
+
+        name, spec = next(iter(stage.items()))
+        if name not in allowed:
+            raise PipelineNotAllowedError(f"Aggregation stage {name} is not allowed")
+
+        nested = _NESTED_PIPELINES.get(name)
+        if nested and isinstance(spec, dict):
+            for sub_pipeline in nested(spec):
+                validate_pipeline(sub_pipeline, allowed)
+
+
+def aggregate_kwargs(query) -> dict[str, Any]:
+    """Builds the keyword arguments for Collection.aggregate from an aggregate request"""
+    kwargs: dict[str, Any] = {"allowDiskUse": query.allow_disk_use}
+    if query.max_time_ms is not None:
+        kwargs["maxTimeMS"] = query.max_time_ms
+    if query.batch_size is not None:
+        kwargs["batchSize"] = query.batch_size
+    if query.hint is not None:
+        kwargs["hint"] = query.hint
+    if query.collation is not None:
+        kwargs["collation"] = query.collation
+
+    return kwargs
@@ -1,8 +1,13 @@
 import base64
+import hashlib
+import time
+from logging import getLogger
 
 from core.config import settings
+from core.ttl_cache import TTLCache
 from fastapi import HTTPException, status
-from jose import ExpiredSignatureError, JWTError, jwt
+from jose import ExpiredSignatureError, JWTError, jwk, jwt
+from jose.constants import ALGORITHMS
 from schemas.token import ClientIdentifier, TokenData
 
 KEYS = {
@@ -11,6 +16,21 @@ KEYS = {
 
 PUBLIC_KEY = base64.b64decode(settings.PUBLIC_KEY_B64)
 
+
+def _load_public_key():
+    """Parses the RS256 public key once instead of on every verification"""
+    try:
+        return jwk.construct(PUBLIC_KEY, algorithm=ALGORITHMS.RS256)
+    except Exception as ex:
+        getLogger(__name__ + "._load_public_key").warning(f"Could not pre-load the RS256 public key: {ex}")
+        return PUBLIC_KEY
+
+
+PUBLIC_KEY_OBJ = _load_public_key()
+
+# Verified tokens keyed by token digest, each kept until the token expires
+token_cache = TTLCache(ttl=settings.TOKEN_CACHE_MAX_TTL, maxsize=settings.TOKEN_CACHE_MAXSIZE)
+
 credentials_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Could not validate credentials",
@@ -23,7 +43,7 @@ def verify_access_token(
     audience: str | None = settings.SERVICE_ID,
 ) -> TokenData:
     """
-    Verifies an access token
+    Verifies an access token. Successful verifications are cached until the token expires.
 
     Args:
         token: the jwt token string
@@ -31,14 +51,44 @@ def verify_access_token(
     Returns:
         TokenData object containing the data in the token
     """
+    key = (hashlib.sha256(token.encode()).digest(), audience)
+    token_data, _ = token_cache.get_or_load(
+        key,
+        lambda: decode_access_token(token, audience),
+        ttl_for=_seconds_until_expiry,
+    )
+    return token_data
+
+
+def _seconds_until_expiry(verified: tuple[TokenData, float | None]) -> float:
+    _, expires_at = verified
+    if expires_at is None:
+        return settings.TOKEN_CACHE_MAX_TTL
+    return expires_at - time.time()
+
+
+def decode_access_token(
+    token: str,
+    audience: str | None = settings.SERVICE_ID,
+) -> tuple[TokenData, float | None]:
+    """
+    Verifies an access token without the cache
+
+    Args:
+        token: the jwt token string
+
+    Returns:
+        TokenData object containing the data in the token, and the token expiry timestamp
+    """
     try:
-        version = jwt.get_unverified_claims(token).get("version", 1)
-        client_id = jwt.get_unverified_claims(token).get("client_id")
+        claims = jwt.get_unverified_claims(token)
+        version = claims.get("version", 1)
+        client_id = claims.get("client_id")
 
         if version == 1:
             payload = jwt.decode(token, KEYS[client_id], algorithms=["HS256"])
         else:
-            payload = jwt.decode(token, PUBLIC_KEY, algorithms=["RS256"], audience=audience)
+            payload = jwt.decode(token, PUBLIC_KEY_OBJ, algorithms=["RS256"], audience=audience)
 
         email: str = payload.get("sub")
         id: str = payload.get("id")
@@ -48,7 +98,8 @@ def verify_access_token(
         if email is None or id is None:
             raise credentials_exception
 
-        return TokenData(email=email, id=id, type=token_type, role=role, client_id=client_id, access_token=token)
+        token_data = TokenData(email=email, id=id, type=token_type, role=role, client_id=client_id, access_token=token)
+        return token_data, payload.get("exp")
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,60 +1,73 @@
-import time
+import hashlib
 from logging import getLogger
 from typing import Literal
 
 import httpx
 from core.authentication.auth_middleware import get_current_token
 from core.config import settings
+from core.metrics import timed_upstream_call
+from core.ttl_cache import AsyncTTLCache
 from fastapi import Depends, HTTPException
 from schemas.token import TokenData
 
 SubscriptionTier = Literal["FREE", "BASIC", "STANDARD", "PRO", "ENTERPRISE"]
 
+# Shared, connection pooled client for marketplace calls. Closed on app shutdown.
+marketplace_client = httpx.AsyncClient(timeout=settings.MARKETPLACE_HTTP_TIMEOUT)
+
 
 class TimedCache:
-    def __init__(self, ttl: int = 60, maxsize: int = 128):
+    """
+    Caches subscription tiers per caller on top of AsyncTTLCache.
+
+    Concurrent lookups for the same caller share one marketplace call, and hot entries
+    are refreshed in the background before they expire. A failed lookup falls back to
+    FREE, but only for `failure_ttl` seconds so a transient marketplace error does not
+    lock paying users out for the full TTL.
+    """
+
+    def __init__(self, ttl: int = 60, maxsize: int = 128, failure_ttl: int = 10, refresh_ahead: int = 0):
         self.ttl = ttl
         self.maxsize = maxsize
-        self._cache: tuple[str, tuple[str, float]] = {}
+        self.failure_ttl = failure_ttl
+        self.failures = 0
+        self._cache = AsyncTTLCache(ttl=ttl, maxsize=maxsize, refresh_ahead=refresh_ahead)
+
+    @timed_upstream_call("marketplace", "subscription")
+    async def _fetch_subscription_info(self, url: str, headers: dict) -> SubscriptionTier:
+        logger = getLogger(__name__ + ".fetch_subscription_info")
+        response = await marketplace_client.get(url, headers=headers)
+        response.raise_for_status()
+        tier = response.json().get("subscription_package", {}).get("tier", "FREE").upper()
+        logger.info(f"Subscription tier: {tier}")
+        return tier
 
     async def get_subscription_info(self, headers: dict | None = None) -> SubscriptionTier:
         logger = getLogger(__name__ + ".get_subscription_info")
         MARKETPLACE_URL = settings.MARKETPLACE_URL.strip("/") + "/api/v1/subscription"
         headers = headers or {}
-        key = (MARKETPLACE_URL, tuple(sorted(headers.items())))
-        now = time.time()
-
-        # Check if cached
-        if key in self._cache:
-            value, timestamp = self._cache[key]
-            if now - timestamp < self.ttl:
-                return value
-            else:
-                # expired
-                self._cache.pop(key)
-
-        # Fetch fresh
-        async with httpx.AsyncClient() as client:
-
-            response = await client.get(MARKETPLACE_URL, headers=headers)
-            try:
-                response.raise_for_status()
-                body = response.json().get("subscription_package", {}).get("tier", "FREE").upper()
-                logger.info(f"Subscription tier: {body}")
-            except Exception as ex:
-                body = "FREE"
-
-        # Store
-        if len(self._cache) >= self.maxsize:
-            # drop oldest
-            oldest_key = min(self._cache, key=lambda k: self._cache[k][1])
-            self._cache.pop(oldest_key)
-
-        self._cache[key] = (body, now)
-        return body
-
-
-timed_cache = TimedCache(ttl=500, maxsize=256)
+        # Key on a digest so bearer tokens are not kept in memory as cache keys
+        digest = hashlib.sha256(repr(sorted(headers.items())).encode()).digest()
+        key = (MARKETPLACE_URL, digest)
+
+        try:
+            return await self._cache.get_or_load(key, lambda: self._fetch_subscription_info(MARKETPLACE_URL, headers))
+        except Exception as ex:
+            logger.warning(f"Could not fetch subscription info, falling back to FREE: {ex}")
+            self.failures += 1
+            self._cache.set(key, "FREE", self.failure_ttl)
+            return "FREE"
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "failures": self.failures}
+
+
+timed_cache = TimedCache(
+    ttl=500,
+    maxsize=256,
+    failure_ttl=settings.SUBSCRIPTION_CACHE_FAILURE_TTL,
+    refresh_ahead=settings.SUBSCRIPTION_CACHE_REFRESH_AHEAD,
+)
 
 
 async def validate_subscription(current_token: TokenData = Depends(get_current_token)) -> SubscriptionTier:
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable
+
+from core.aggregation import validate_pipeline
+from core.filters import afield_types, decode_filter, field_types
+from core.indexes import index_advisor
+from schemas.database import BatchOperation
+
+
+class BatchOptionsError(ValueError):
+    """Raised when a batch operation is missing the options it needs"""
+
+
+def _options(operation: BatchOperation) -> dict[str, Any]:
+    return {} if operation.max_time_ms is None else {"maxTimeMS": operation.max_time_ms}
+
+
+def _find_kwargs(operation: BatchOperation) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {"skip": operation.skip, "limit": operation.limit, **_options(operation)}
+    if operation.projection is not None:
+        kwargs["projection"] = operation.projection
+    if operation.sort:
+        kwargs["sort"] = operation.sort
+    return kwargs
+
+
+def _count_kwargs(operation: BatchOperation) -> dict[str, Any]:
+    kwargs: dict[str, Any] = _options(operation)
+    if operation.skip:
+        kwargs["skip"] = operation.skip
+    if operation.limit:
+        kwargs["limit"] = operation.limit
+    return kwargs
+
+
+def _pipeline(operation: BatchOperation, max_results: int) -> list[dict[str, Any]]:
+    return [*operation.pipeline, {"$limit": max_results}] if max_results else operation.pipeline
+
+
+def _check(operation: BatchOperation):
+    if operation.op == "aggregate":
+        validate_pipeline(operation.pipeline)
+    if operation.op == "distinct" and not operation.field:
+        raise BatchOptionsError("A field is required to get distinct values")
+
+
+def _observe(connection_string: str, operation: BatchOperation, filter: dict[str, Any], operation_id: str):
+    if operation.op in ("find", "count"):
+        namespace = (connection_string, operation.db_name, operation.collection_name)
+        index_advisor.observe(namespace, filter, operation.sort if operation.op == "find" else None, operation_id)
+
+
+def _result(index: int, operation: BatchOperation, started: float, result: Any = None, error: str | None = None):
+    # Kept as a plain dict so the documents are encoded once, in the requested json_mode
+    return {
+        "index": index,
+        "op": operation.op,
+        "ok": error is None,
+        "result": result,
+        "error": error,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def run_operation(
+    client,
+    connection_string: str,
+    operation: BatchOperation,
+    operation_id: str,
+    max_results: int = 0,
+    charge: Callable[[int], None] | None = None,
+) -> Any:
+    """
+    Runs one read operation of a batch. An aggregation or distinct returns at most `max_results`
+    documents or values, 0 for no limit, and `charge` is called with how many it returned.
+    """
+    _check(operation)
+    collection = client[operation.db_name][operation.collection_name]
+    types = field_types(client, connection_string, operation.db_name, operation.collection_name)
+    filter = decode_filter(operation.filter, types)
+    _observe(connection_string, operation, filter, operation_id)
+
+    if operation.op == "count":
+        return collection.count_documents(filter, **_count_kwargs(operation))
+    if operation.op == "distinct":
+        result = collection.distinct(operation.field, filter, **_options(operation))
+    elif operation.op == "aggregate":
+        result = list(collection.aggregate(_pipeline(operation, max_results), **_options(operation)))
+    else:
+        return list(collection.find(filter, **_find_kwargs(operation)))
+
+    result = result[:max_results] if max_results else result
+    if charge is not None:
+        charge(len(result))
+    return result
+
+
+async def arun_operation(
+    client,
+    connection_string: str,
+    operation: BatchOperation,
+    operation_id: str,
+    max_results: int = 0,
+    charge: Callable[[int], None] | None = None,
+) -> Any:
+    """Async variant of `run_operation`"""
+    _check(operation)
+    collection = client[operation.db_name][operation.collection_name]
+    types = await afield_types(client, connection_string, operation.db_name, operation.collection_name)
+    filter = decode_filter(operation.filter, types)
+    _observe(connection_string, operation, filter, operation_id)
+
+    if operation.op == "count":
+        return await collection.count_documents(filter, **_count_kwargs(operation))
+    if operation.op == "distinct":
+        result = await collection.distinct(operation.field, filter, **_options(operation))
+    elif operation.op == "aggregate":
+        cursor = await collection.aggregate(_pipeline(operation, max_results), **_options(operation))
+        result = await cursor.to_list()
+    else:
+        return await collection.find(filter, **_find_kwargs(operation)).to_list()
+
+    result = result[:max_results] if max_results else result
+    if charge is not None:
+        charge(len(result))
+    return result
+
+
+def run_batch(
+    client,
+    connection_string: str,
+    operations: list[BatchOperation],
+    concurrency: int,
+    operation_id: str,
+    max_results: int = 0,
+    charge: Callable[[int], None] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Runs the operations on up to `concurrency` threads and returns their results in order.
+    A failed operation is reported in its result rather than failing the batch.
+    `max_results` and `charge` apply to the aggregations and distincts, as in `run_operation`.
+    """
+
+    def execute(index: int, operation: BatchOperation) -> dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = run_operation(client, connection_string, operation, operation_id, max_results, charge)
+            return _result(index, operation, started, result)
+        except Exception as ex:
+            return _result(index, operation, started, error=str(ex))
+
+    if concurrency == 1 or len(operations) <= 1:
+        return [execute(index, operation) for index, operation in enumerate(operations)]
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(operations)), thread_name_prefix="batch") as executor:
+        # Each operation runs in a copy of the request context, so its metrics carry the operation id
+        futures = [
+            executor.submit(copy_context().run, execute, index, operation) for index, operation in enumerate(operations)
+        ]
+        return [future.result() for future in futures]
+
+
+async def arun_batch(
+    client,
+    connection_string: str,
+    operations: list[BatchOperation],
+    concurrency: int,
+    operation_id: str,
+    max_results: int = 0,
+    charge: Callable[[int], None] | None = None,
+) -> list[dict[str, Any]]:
+    """Async variant of `run_batch`, with up to `concurrency` operations in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def execute(index: int, operation: BatchOperation) -> dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await arun_operation(client, connection_string, operation, operation_id, max_results, charge)
+                return _result(index, operation, started, result)
+            except Exception as ex:
+                return _result(index, operation, started, error=str(ex))
+
+    return await asyncio.gather(*(execute(index, operation) for index, operation in enumerate(operations)))
@@ -0,0 +1,44 @@
+from functools import partial
+from typing import Any, Iterable, Literal
+
+import orjson
+from bson import json_util
+
+JsonMode = Literal["string", "relaxed", "canonical"]
+
+# "string" reproduces the historical json.dumps(document, default=str) output:
+# ObjectId, datetime, Decimal128, Binary etc. are rendered with str().
+_STRING_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+# Relaxed Extended JSON. orjson encodes the native JSON types and calls back into
+# json_util only for BSON specific values, so documents are walked once in C.
+_relaxed_default = partial(json_util.default, json_options=json_util.RELAXED_JSON_OPTIONS)
+_RELAXED_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps_document(document: Any, mode: JsonMode = "string") -> bytes:
+    """
+    Encodes a decoded BSON document as JSON bytes.
+
+    Args:
+        document: the document (or any BSON compatible value)
+        mode: string, relaxed or canonical Extended JSON
+
+    Returns:
+        The UTF-8 encoded JSON
+    """
+    if mode == "string":
+        return orjson.dumps(document, default=str, option=_STRING_OPTIONS)
+    if mode == "relaxed":
+        return orjson.dumps(document, default=_relaxed_default, option=_RELAXED_OPTIONS)
+
+    # Canonical Extended JSON wraps every number, which orjson cannot express
+    return json_util.dumps(document, json_options=json_util.CANONICAL_JSON_OPTIONS).encode()
+
+
+def dumps_documents(documents: Iterable[Any], mode: JsonMode = "string") -> bytes:
+    """Encodes documents as a single JSON array"""
+    if mode == "canonical":
+        return b"[" + b",".join(dumps_document(document, mode) for document in documents) + b"]"
+
+    return dumps_document(list(documents), mode)
@@ -0,0 +1,414 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterable, Iterator, Literal
+
+import orjson
+from bson import json_util
+from bson.errors import BSONError
+from core.config import settings
+from core.filters import decode_filter, decode_update
+from pydantic import ValidationError
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from schemas.database import (
+    BulkWriteOperation,
+    BulkWriteOperationError,
+    BulkWriteQueryResult,
+    ImportBatchResult,
+    ImportQueryResult,
+)
+
+# A batch is a list of (request index, pymongo write model) pairs
+Batch = list[tuple[int, object]]
+
+ImportFormat = Literal["ndjson", "mongoexport"]
+ImportMode = Literal["insert", "dedup", "upsert"]
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def to_write_model(operation: BulkWriteOperation):
+    """
+    Converts a requested operation into a pymongo write model, decoding the Extended JSON of its
+    filter and update. Raises ValueError for an invalid operation.
+    """
+    if operation.op == "insert_one":
+        if operation.document is None:
+            raise ValueError("insert_one requires a document")
+        return InsertOne(operation.document)
+
+    if operation.op in ("update_one", "update_many"):
+        if not operation.update:
+            raise ValueError(f"{operation.op} requires an update")
+        model = UpdateOne if operation.op == "update_one" else UpdateMany
+        return model(decode_filter(operation.filter), decode_update(operation.update), upsert=operation.upsert)
+
+    if operation.op == "replace_one":
+        if operation.replacement is None:
+            raise ValueError("replace_one requires a replacement")
+        return ReplaceOne(decode_filter(operation.filter), operation.replacement, upsert=operation.upsert)
+
+    if operation.op == "delete_one":
+        return DeleteOne(decode_filter(operation.filter))
+
+    return DeleteMany(decode_filter(operation.filter))
+
+
+class BulkWriteSummary:
+    """Thread safe accumulator of bulk write counts and per-operation errors"""
+
+    def __init__(self, max_errors: int = settings.BULK_WRITE_MAX_ERRORS, result: BulkWriteQueryResult | None = None):
+        self.max_errors = max_errors
+        self._lock = threading.Lock()
+        self.result = result or BulkWriteQueryResult()
+
+    def add_error(self, index: int, message: str, code: int | None = None):
+        with self._lock:
+            self.result.error_count += 1
+            if len(self.result.errors) < self.max_errors:
+                self.result.errors.append(BulkWriteOperationError(index=index, code=code, message=message))
+
+    def add_counts(
+        self,
+        batch: Batch,
+        inserted: int,
+        matched: int,
+        modified: int,
+        deleted: int,
+        upserted: dict[int, object],
+    ):
+        with self._lock:
+            self.result.inserted_count += inserted
+            self.result.matched_count += matched
+            self.result.modified_count += modified
+            self.result.deleted_count += deleted
+            self.result.upserted_count += len(upserted)
+            for position, _id in upserted.items():
+                self.result.upserted_ids[batch[position][0]] = str(_id)
+
+    def add_bulk_write_error(self, batch: Batch, ex: BulkWriteError):
+        """Records the partial result of a batch that raised BulkWriteError"""
+        details = ex.details
+        self.add_counts(
+            batch,
+            inserted=details.get("nInserted", 0),
+            matched=details.get("nMatched", 0),
+            modified=details.get("nModified", 0),
+            deleted=details.get("nRemoved", 0),
+            upserted={upsert["index"]: upsert["_id"] for upsert in details.get("upserted", [])},
+        )
+        for error in details.get("writeErrors", []):
+            self.add_error(batch[error["index"]][0], error.get("errmsg", "Write error"), error.get("code"))
+        for error in details.get("writeConcernErrors", []):
+            self.add_error(-1, f"Write concern error: {error.get('errmsg')}", error.get("code"))
+
+    def add_batch_error(self, batch: Batch, ex: Exception):
+        """Records an error that failed a whole batch, e.g. a network error, on each of its operations"""
+        for index, _ in batch:
+            self.add_error(index, f"Batch failed: {ex}", getattr(ex, "code", None))
+
+
+class ImportSummary(BulkWriteSummary):
+    """
+    Summary of a streamed import, readable while the import runs.
+
+    In dedup mode duplicate key errors are counted as skipped duplicates rather than
+    failures, so retrying an upload of documents with _ids is idempotent. Upserted ids
+    are counted but not kept, since an import may upsert millions of documents.
+    """
+
+    def __init__(self, import_id: str, skip_duplicates: bool = False, max_errors: int = settings.BULK_WRITE_MAX_ERRORS):
+        super().__init__(max_errors, ImportQueryResult(import_id=import_id))
+        self.skip_duplicates = skip_duplicates
+
+    def add_error(self, index: int, message: str, code: int | None = None):
+        if self.skip_duplicates and code == DUPLICATE_KEY_ERROR:
+            with self._lock:
+                self.result.duplicate_count += 1
+            return
+        super().add_error(index, message, code)
+
+    def add_counts(
+        self,
+        batch: Batch,
+        inserted: int,
+        matched: int,
+        modified: int,
+        deleted: int,
+        upserted: dict[int, object],
+    ):
+        with self._lock:
+            self.result.inserted_count += inserted
+            self.result.matched_count += matched
+            self.result.modified_count += modified
+            self.result.deleted_count += deleted
+            self.result.upserted_count += len(upserted)
+
+    def add_batch(self, batch: Batch, batch_summary: "ImportSummary"):
+        """Merges the summary of one written batch into the import summary"""
+        other = batch_summary.result
+        with self._lock:
+            self.result.batch_count += 1
+            self.result.inserted_count += other.inserted_count
+            self.result.matched_count += other.matched_count
+            self.result.modified_count += other.modified_count
+            self.result.upserted_count += other.upserted_count
+            self.result.duplicate_count += other.duplicate_count
+            self.result.error_count += other.error_count
+            self.result.errors.extend(other.errors[: max(0, self.max_errors - len(self.result.errors))])
+            if other.error_count and len(self.result.failed_batches) < self.max_errors:
+                self.result.failed_batches.append(
+                    ImportBatchResult(
+                        batch=self.result.batch_count,
+                        first_index=batch[0][0],
+                        documents=len(batch),
+                        inserted_count=other.inserted_count,
+                        upserted_count=other.upserted_count,
+                        duplicate_count=other.duplicate_count,
+                        error_count=other.error_count,
+                    )
+                )
+
+    def add_documents_read(self, count: int):
+        with self._lock:
+            self.result.documents_read += count
+
+    def set_status(self, status: str):
+        with self._lock:
+            self.result.status = status
+
+    def snapshot(self) -> ImportQueryResult:
+        """Returns a consistent copy of the progress so far"""
+        with self._lock:
+            return self.result.model_copy(deep=True)
+
+
+class ImportProgressRegistry:
+    """Keeps the summaries of running and recent imports so their progress can be polled"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._imports: OrderedDict[Hashable, ImportSummary] = OrderedDict()
+
+    def start(self, key: Hashable, summary: ImportSummary):
+        with self._lock:
+            self._imports[key] = summary
+            self._imports.move_to_end(key)
+            while len(self._imports) > self.maxsize:
+                self._imports.popitem(last=False)
+
+    def get(self, key: Hashable) -> ImportSummary | None:
+        with self._lock:
+            return self._imports.get(key)
+
+
+import_progress = ImportProgressRegistry()
+
+
+def parse_import_line(line: bytes, format: ImportFormat) -> dict[str, Any]:
+    """Parses one line of an NDJSON or mongoexport (Extended JSON) upload"""
+    document = json_util.loads(line) if format == "mongoexport" else orjson.loads(line)
+    if not isinstance(document, dict):
+        raise ValueError("Each line must be a JSON object")
+    return document
+
+
+def to_import_model(document: dict[str, Any], mode: ImportMode):
+    """Inserts the document, or replaces the document with the same _id in upsert mode"""
+    if mode == "upsert" and "_id" in document:
+        return ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+    return InsertOne(document)
+
+
+def iter_batches(
+    operations: Iterable[BulkWriteOperation],
+    batch_size: int,
+    summary: BulkWriteSummary,
+) -> Iterator[Batch]:
+    """Converts operations into batches, recording invalid operations as errors"""
+    batch: Batch = []
+    for index, operation in enumerate(operations):
+        try:
+            batch.append((index, to_write_model(operation)))
+        except ValueError as ex:
+            summary.add_error(index, str(ex))
+            continue
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+async def aiter_batches(
+    operations: Iterable[BulkWriteOperation],
+    batch_size: int,
+    summary: BulkWriteSummary,
+) -> AsyncIterator[Batch]:
+    """Async iterator over iter_batches, for use with arun_batches"""
+    for batch in iter_batches(operations, batch_size, summary):
+        yield batch
+
+
+async def aiter_ndjson_batches(
+    lines: AsyncIterator[bytes],
+    batch_size: int,
+    summary: BulkWriteSummary,
+) -> AsyncIterator[Batch]:
+    """Parses NDJSON operations incrementally into batches, recording unparsable lines as errors"""
+    batch: Batch = []
+    index = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            batch.append((index, to_write_model(BulkWriteOperation.model_validate_json(line))))
+        except (ValidationError, ValueError) as ex:
+            summary.add_error(index, str(ex))
+
+        index += 1
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+async def aiter_import_batches(
+    lines: AsyncIterator[bytes],
+    format: ImportFormat,
+    mode: ImportMode,
+    batch_size: int,
+    summary: ImportSummary,
+) -> AsyncIterator[Batch]:
+    """Parses an uploaded document stream incrementally into batches, recording unparsable lines as errors"""
+    batch: Batch = []
+    index = 0
+    reported = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            batch.append((index, to_import_model(parse_import_line(line, format), mode)))
+        except (ValueError, TypeError, BSONError) as ex:
+            summary.add_error(index, str(ex))
+
+        index += 1
+        if len(batch) >= batch_size:
+            summary.add_documents_read(index - reported)
+            reported = index
+            yield batch
+            batch = []
+
+    summary.add_documents_read(index - reported)
+    if batch:
+        yield batch
+
+
+def execute_batch(collection, batch: Batch, ordered: bool, summary: BulkWriteSummary) -> bool:
+    """Writes one batch with bulk_write. Returns False if any operation failed."""
+    try:
+        res = collection.bulk_write([model for _, model in batch], ordered=ordered)
+    except BulkWriteError as ex:
+        summary.add_bulk_write_error(batch, ex)
+        return False
+    except Exception as ex:
+        # Whether any of the batch was written is unknown, so every operation is reported as failed
+        summary.add_batch_error(batch, ex)
+        return False
+
+    summary.add_counts(
+        batch, res.inserted_count, res.matched_count, res.modified_count, res.deleted_count, res.upserted_ids
+    )
+    return True
+
+
+async def aexecute_batch(collection, batch: Batch, ordered: bool, summary: BulkWriteSummary) -> bool:
+    """Async counterpart of execute_batch for AsyncMongoClient collections"""
+    try:
+        res = await collection.bulk_write([model for _, model in batch], ordered=ordered)
+    except BulkWriteError as ex:
+        summary.add_bulk_write_error(batch, ex)
+        return False
+    except Exception as ex:
+        # Whether any of the batch was written is unknown, so every operation is reported as failed
+        summary.add_batch_error(batch, ex)
+        return False
+
+    summary.add_counts(
+        batch, res.inserted_count, res.matched_count, res.modified_count, res.deleted_count, res.upserted_ids
+    )
+    return True
+
+
+def run_batches(
+    batches: Iterable[Batch],
+    execute: Callable[[Batch], bool],
+    ordered: bool,
+    workers: int,
+):
+    """Runs batches sequentially when ordered, otherwise on up to `workers` threads"""
+    if ordered or workers == 1:
+        for batch in batches:
+            if not execute(batch) and ordered:
+                return
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-write") as executor:
+        # Consume the results so batch exceptions propagate
+        list(executor.map(execute, batches))
+
+
+async def arun_batches(
+    batches: AsyncIterator[Batch],
+    execute: Callable[[Batch], Awaitable[bool]],
+    ordered: bool,
+    workers: int,
+):
+    """
+    Runs batches from an async source sequentially when ordered, otherwise with up to
+    `workers` batches in flight. The source is only read when a worker is free, so a
+    streamed upload is throttled to the write throughput.
+    """
+    if ordered or workers == 1:
+        async for batch in batches:
+            if not await execute(batch) and ordered:
+                return
+        return
+
+    semaphore = asyncio.Semaphore(workers)
+    tasks: set[asyncio.Task] = set()
+    # Finished tasks are dropped to keep long imports bounded, so their exceptions are kept here
+    errors: list[BaseException] = []
+
+    async def run(batch: Batch):
+        try:
+            await execute(batch)
+        finally:
+            semaphore.release()
+
+    def done(task: asyncio.Task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            errors.append(task.exception())
+
+    try:
+        async for batch in batches:
+            await semaphore.acquire()
+            task = asyncio.create_task(run(batch))
+            tasks.add(task)
+            task.add_done_callback(done)
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    if errors:
+        raise errors[0]
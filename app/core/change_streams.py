@@ -0,0 +1,420 @@
+import asyncio
+import time
+from collections import deque
+from logging import getLogger
+from typing import Any, AsyncIterator
+
+import orjson
+from core.aggregation import validate_pipeline
+from core.bson_json import JsonMode, dumps_document
+from core.config import settings
+from core.metrics import change_stream_subscribers, change_stream_subscribers_dropped
+from core.mongo_client_registry import async_mongo_clients
+from schemas.database import ChangesQueryInput, WatchQueryInput
+
+# Stages a change stream pipeline may use
+CHANGE_STREAM_STAGES = {"$match", "$project", "$addFields", "$set", "$unset", "$replaceRoot", "$replaceWith", "$redact"}
+
+# Response headers keeping proxies from buffering an event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# The connection string, database, collection (None for a whole database), pipeline and fullDocument mode of a stream
+StreamKey = tuple[str, str, str | None, bytes, str]
+
+
+class ChangeStreamLimitError(RuntimeError):
+    """Raised when opening a change stream would exceed CHANGE_STREAM_MAX_STREAMS"""
+
+
+class SubscriptionClosed(Exception):
+    """Raised to a subscriber whose change stream ended or who fell too far behind"""
+
+
+def validate_watch(query: WatchQueryInput):
+    """
+    Checks the change stream pipeline against the stages a change stream supports.
+
+    Raises:
+        PipelineNotAllowedError: if a stage is malformed or not allowed
+    """
+    validate_pipeline(query.pipeline, CHANGE_STREAM_STAGES)
+
+
+def _token_id(token: dict[str, Any] | None) -> str | None:
+    # Resume tokens are documents holding one hex string, which is all an SSE event id can carry
+    return None if token is None else token.get("_data")
+
+
+class ChangeEvent:
+    """A change event, encoded once per JSON mode however many subscribers it is sent to"""
+
+    __slots__ = ("id", "change", "_encoded")
+
+    def __init__(self, change: dict[str, Any]):
+        self.id = _token_id(change.get("_id"))
+        self.change = change
+        self._encoded: dict[str, bytes] = {}
+
+    def encoded(self, json_mode: JsonMode) -> bytes:
+        content = self._encoded.get(json_mode)
+        if content is None:
+            content = self._encoded[json_mode] = dumps_document(self.change, json_mode)
+        return content
+
+
+class _Closed:
+    __slots__ = ("reason",)
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class Subscriber:
+    """
+    One client of a change stream, with a bounded buffer. A subscriber that lets its buffer fill up
+    is dropped rather than slowing the stream down for everyone else; it resumes from its last event.
+    """
+
+    def __init__(self, hub: "ChangeStreamHub", buffer_size: int, position: str | None):
+        self.hub = hub
+        self.queue: asyncio.Queue[ChangeEvent | _Closed] = asyncio.Queue(maxsize=buffer_size + 1)
+        self.buffer_size = buffer_size
+        self.position = position
+        self.closed = False
+
+    def push(self, event: ChangeEvent):
+        if self.closed:
+            return
+        if self.queue.qsize() >= self.buffer_size:
+            change_stream_subscribers_dropped.inc()
+            reason = f"Dropped after falling {self.buffer_size} events behind, resume after the last event received"
+            self.close(reason, discard=True)
+            return
+        self.queue.put_nowait(event)
+
+    def close(self, reason: str, discard: bool = False):
+        """Ends the subscription after the buffered events, or at once if `discard` is set"""
+        if self.closed:
+            return
+        self.closed = True
+        if discard:
+            # The subscriber resumes from the last event it received, so nothing is lost
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        # The queue holds one item more than the buffer, so there is always room for this one
+        self.queue.put_nowait(_Closed(reason))
+
+    async def get(self, timeout: float) -> ChangeEvent | None:
+        """
+        Returns the next event, or None if there was none within `timeout` seconds.
+
+        Raises:
+            SubscriptionClosed: once the stream ended or the subscriber was dropped
+        """
+        try:
+            item = await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+        return self._take(item)
+
+    def get_nowait(self) -> ChangeEvent | None:
+        """Returns the next buffered event, or None if there is none"""
+        try:
+            item = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+        return self._take(item)
+
+    def _take(self, item: ChangeEvent | _Closed) -> ChangeEvent:
+        if isinstance(item, _Closed):
+            # Left in place, so every later read sees the stream as closed too
+            self.queue.put_nowait(item)
+            raise SubscriptionClosed(item.reason)
+        self.position = item.id or self.position
+        return item
+
+    @property
+    def resume_token(self) -> str | None:
+        """The position to resume from: past the buffered events, the position of the stream itself"""
+        if self.queue.empty() and not self.closed:
+            return self.hub.resume_token or self.position
+        return self.position
+
+    def unsubscribe(self):
+        self.hub.remove(self)
+
+
+class ChangeStreamHub:
+    """
+    One upstream change stream fanned out to every subscriber watching the same namespace with
+    the same pipeline. Recent events are kept so subscribers reconnecting with a resume token can
+    be replayed from memory. Shared hubs keep running for `idle_seconds` after their last
+    subscriber left, so a long-polling client finds its position still in memory on the next poll.
+    """
+
+    def __init__(
+        self,
+        manager: "ChangeStreamManager",
+        key: StreamKey,
+        pipeline: list[dict[str, Any]],
+        resume_after: str | None,
+        shared: bool,
+    ):
+        self.manager = manager
+        self.key = key
+        self.pipeline = pipeline
+        self.resume_after = resume_after
+        self.shared = shared
+        self.subscribers: set[Subscriber] = set()
+        # Recent events with the position the stream was at before each
+        self.recent: deque[tuple[str | None, ChangeEvent]] = deque(maxlen=manager.replay_size)
+        self.resume_token: str | None = resume_after
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.idle_since = time.monotonic()
+        self.closed = False
+        self.reason = "Change stream ended"
+        self.joined = False
+        self.events = 0
+        self.task = asyncio.create_task(self._run())
+
+    def replay_after(self, token: str | None) -> list[ChangeEvent] | None:
+        """Returns the events after a resume token, or None if the token is not in memory"""
+        if token is None or token == self.resume_token:
+            return []
+        for i, (previous, _) in enumerate(self.recent):
+            if previous == token:
+                return [event for _, event in list(self.recent)[i:]]
+        return None
+
+    def add(self, replay: list[ChangeEvent], position: str | None) -> Subscriber:
+        """Adds a subscriber at `position`, with the events after it that are still in memory"""
+        subscriber = Subscriber(self, self.manager.buffer_size, position)
+        for event in replay:
+            subscriber.push(event)
+        if self.closed:
+            subscriber.close(self.reason)
+        self.subscribers.add(subscriber)
+        self.joined = True
+        change_stream_subscribers.inc()
+        return subscriber
+
+    def remove(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            change_stream_subscribers.dec()
+            if not self.subscribers:
+                self.idle_since = time.monotonic()
+
+    def _idle(self) -> bool:
+        if self.subscribers:
+            return False
+        if not self.shared:
+            # A dedicated stream ends with its subscriber
+            return self.joined
+        return time.monotonic() - self.idle_since >= self.manager.idle_seconds
+
+    async def _run(self):
+        logger = getLogger(__name__ + ".run")
+        connection_string, db_name, collection_name, _, full_document = self.key
+        reason = "Change stream ended"
+        kwargs: dict[str, Any] = {"max_await_time_ms": 1000}
+        if full_document != "default":
+            kwargs["full_document"] = full_document
+        if self.resume_after is not None:
+            kwargs["resume_after"] = {"_data": self.resume_after}
+
+        try:
+            with async_mongo_clients.lease(connection_string) as client:
+                target = client[db_name] if collection_name is None else client[db_name][collection_name]
+                async with await target.watch(self.pipeline, **kwargs) as stream:
+                    self.resume_token = _token_id(stream.resume_token) or self.resume_token
+                    self.ready.set_result(None)
+
+                    while stream.alive and not self._idle():
+                        change = await stream.try_next()
+                        if change is None:
+                            # Advances past events the pipeline filtered out, so resuming skips them too
+                            self.resume_token = _token_id(stream.resume_token) or self.resume_token
+                            continue
+
+                        event = ChangeEvent(change)
+                        self.events += 1
+                        self.recent.append((self.resume_token, event))
+                        for subscriber in list(self.subscribers):
+                            subscriber.push(event)
+                        self.resume_token = event.id or self.resume_token
+
+                        if change.get("operationType") == "invalidate":
+                            reason = "Change stream invalidated, the collection or database was dropped or renamed"
+                            break
+        except asyncio.CancelledError:
+            reason = "Service shutting down"
+            raise
+        except Exception as ex:
+            if not self.ready.done():
+                self.ready.set_exception(ex)
+            else:
+                logger.warning(f"Change stream on {db_name}.{collection_name or '*'} failed: {ex}")
+                reason = f"Change stream failed: {ex}"
+        finally:
+            self.closed = True
+            self.reason = reason
+            self.manager._discard(self)
+            for subscriber in list(self.subscribers):
+                subscriber.close(reason)
+            if not self.ready.done():
+                self.ready.set_exception(RuntimeError(reason))
+
+
+class ChangeStreamManager:
+    """
+    Opens at most one upstream change stream per namespace, pipeline and fullDocument mode and
+    fans it out to its subscribers. Subscribers resuming from a token that is no longer in
+    memory get a dedicated stream resuming after it. Runs on the event loop.
+    """
+
+    def __init__(self, max_streams: int, buffer_size: int, replay_size: int, idle_seconds: float):
+        self.max_streams = max_streams
+        self.buffer_size = buffer_size
+        self.replay_size = replay_size
+        self.idle_seconds = idle_seconds
+        self._shared: dict[StreamKey, ChangeStreamHub] = {}
+        self._dedicated: set[ChangeStreamHub] = set()
+        self.opened = 0
+        self.replays = 0
+
+    async def subscribe(
+        self,
+        connection_string: str,
+        db_name: str,
+        collection_name: str | None,
+        query: WatchQueryInput,
+        resume_after: str | None = None,
+    ) -> Subscriber:
+        """
+        Subscribes to the changes of a collection, or of a database if `collection_name` is None.
+        Returns once the stream is open, so errors opening it are raised here.
+
+        Raises:
+            ChangeStreamLimitError: if CHANGE_STREAM_MAX_STREAMS streams are already open
+        """
+        pipeline_key = orjson.dumps(query.pipeline, option=orjson.OPT_SORT_KEYS)
+        key: StreamKey = (connection_string, db_name, collection_name, pipeline_key, query.full_document)
+
+        hub = self._shared.get(key)
+        if hub is not None:
+            await asyncio.shield(hub.ready)
+            replay = hub.replay_after(resume_after)
+            if replay is not None and not hub.closed:
+                if replay:
+                    self.replays += 1
+                return hub.add(replay, resume_after if replay else hub.resume_token)
+
+        if len(self._shared) + len(self._dedicated) >= self.max_streams:
+            raise ChangeStreamLimitError(f"Too many change streams open, at most {self.max_streams}")
+
+        # A resumed stream replays history only its subscriber needs, so it is not shared
+        shared = resume_after is None
+        hub = ChangeStreamHub(self, key, query.pipeline, resume_after, shared)
+        if shared:
+            self._shared[key] = hub
+        else:
+            self._dedicated.add(hub)
+        self.opened += 1
+
+        await asyncio.shield(hub.ready)
+        return hub.add([], hub.resume_token)
+
+    def _discard(self, hub: ChangeStreamHub):
+        if self._shared.get(hub.key) is hub:
+            del self._shared[hub.key]
+        self._dedicated.discard(hub)
+
+    def stats(self) -> dict:
+        hubs = [*self._shared.values(), *self._dedicated]
+        return {
+            "shared_streams": len(self._shared),
+            "dedicated_streams": len(self._dedicated),
+            "subscribers": sum(len(hub.subscribers) for hub in hubs),
+            "events": sum(hub.events for hub in hubs),
+            "opened": self.opened,
+            "replays": self.replays,
+            "max_streams": self.max_streams,
+        }
+
+    async def aclose(self):
+        """Stops every change stream. Called on application shutdown."""
+        hubs = [*self._shared.values(), *self._dedicated]
+        for hub in hubs:
+            hub.task.cancel()
+        await asyncio.gather(*(hub.task for hub in hubs), return_exceptions=True)
+
+
+change_streams = ChangeStreamManager(
+    max_streams=settings.CHANGE_STREAM_MAX_STREAMS,
+    buffer_size=settings.CHANGE_STREAM_BUFFER_SIZE,
+    replay_size=settings.CHANGE_STREAM_REPLAY_SIZE,
+    idle_seconds=settings.CHANGE_STREAM_IDLE_SECONDS,
+)
+
+
+def _sse_event(event: ChangeEvent, json_mode: JsonMode) -> bytes:
+    lines = b"" if event.id is None else b"id: " + event.id.encode() + b"\n"
+    return lines + b"data: " + event.encoded(json_mode) + b"\n\n"
+
+
+async def iter_sse(subscriber: Subscriber, json_mode: JsonMode, heartbeat: float) -> AsyncIterator[bytes]:
+    """
+    Yields the events of a subscription as Server-Sent Events, their resume token as the event id,
+    with a comment every `heartbeat` seconds without events so proxies keep the connection open.
+    The subscription ends when the client disconnects.
+    """
+    try:
+        # An id without data moves the client's Last-Event-ID to the position the stream opened at
+        position = subscriber.position
+        yield b"retry: 3000\n" + (b"" if position is None else b"id: " + position.encode() + b"\n") + b"\n"
+
+        while True:
+            try:
+                event = await subscriber.get(heartbeat)
+            except SubscriptionClosed as ex:
+                yield b"event: error\ndata: " + orjson.dumps({"error": str(ex)}) + b"\n\n"
+                return
+
+            if event is None:
+                yield b": keepalive\n\n"
+            else:
+                yield _sse_event(event, json_mode)
+    finally:
+        subscriber.unsubscribe()
+
+
+async def poll_changes(subscriber: Subscriber, query: ChangesQueryInput) -> bytes:
+    """
+    Waits up to `wait_ms` for a first event, then returns it with every event already buffered,
+    up to `max_events`, encoded as a ChangesQueryResult. The subscription ends when the poll returns.
+    """
+    events: list[ChangeEvent] = []
+    error = None
+    try:
+        event = await subscriber.get(query.wait_ms / 1000)
+        while event is not None:
+            events.append(event)
+            if len(events) >= query.max_events:
+                break
+            event = subscriber.get_nowait()
+    except SubscriptionClosed as ex:
+        error = str(ex)
+    finally:
+        resume_token = subscriber.resume_token
+        subscriber.unsubscribe()
+
+    return (
+        b'{"events":['
+        + b",".join(event.encoded(query.json_mode) for event in events)
+        + b'],"resume_token":'
+        + orjson.dumps(resume_token)
+        + b',"error":'
+        + orjson.dumps(error)
+        + b"}"
+    )
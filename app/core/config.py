@@ -1,15 +1,29 @@
+import atexit
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueListener, TimedRotatingFileHandler
 
+from core.log_pipeline import (
+    BoundedQueueHandler,
+    CorrelationIdFilter,
+    ExceptionRateLimitFilter,
+    JsonFormatter,
+    TextFormatter,
+)
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
 load_dotenv()
 
 
-def configure_logging():
+def configure_logging(settings: "Settings"):
+    """
+    Routes every record through a bounded queue to a listener thread writing the log files and
+    console, so request handlers never block on log I/O.
+    """
     os.makedirs("./logs", exist_ok=True)
+    formatter = JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter()
+
     # Create a TimedRotatingFileHandler
     handler = TimedRotatingFileHandler(
         "./logs/vector-store-tools-api.log",  # Log file path
@@ -17,33 +31,41 @@ def configure_logging():
         interval=1,  # Every 1 day
         backupCount=7,  # Keep last 7 days of logs
     )
-
-    # Create a formatter
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s  - %(message)s")
     handler.setFormatter(formatter)
     handler.setLevel(logging.INFO)
 
-    # Get the root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)  # Set the logging level globally
-    root_logger.addHandler(handler)
-
     # Optional: Adding console logging
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.INFO)
-    root_logger.addHandler(console_handler)
+
+    handlers: list[logging.Handler] = [handler, console_handler]
 
     # detailed logs
-    detailed_handler = TimedRotatingFileHandler(
-        "./logs/detailed.vector-store-tools-api.log",  # Log file path
-        when="midnight",  # Rotate at midnight
-        interval=1,  # Every 1 day
-        backupCount=7,  # Keep last 7 days of logs
-    )
-    detailed_handler.setFormatter(formatter)
-    detailed_handler.setLevel(logging.DEBUG)
-    root_logger.addHandler(detailed_handler)
+    if settings.LOG_DETAILED_ENABLED:
+        detailed_handler = TimedRotatingFileHandler(
+            "./logs/detailed.vector-store-tools-api.log",  # Log file path
+            when="midnight",  # Rotate at midnight
+            interval=1,  # Every 1 day
+            backupCount=7,  # Keep last 7 days of logs
+        )
+        detailed_handler.setFormatter(formatter)
+        detailed_handler.setLevel(logging.DEBUG)
+        handlers.append(detailed_handler)
+
+    queue_handler = BoundedQueueHandler(settings.LOG_QUEUE_SIZE)
+    queue_handler.addFilter(CorrelationIdFilter())
+    queue_handler.addFilter(ExceptionRateLimitFilter(settings.LOG_EXCEPTION_BURST, settings.LOG_EXCEPTION_INTERVAL))
+
+    # Get the root logger. Without the detailed log, DEBUG records are not even created.
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG if settings.LOG_DETAILED_ENABLED else logging.INFO)
+    root_logger.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flushes the queued records on shutdown
+    atexit.register(listener.stop)
 
 
 class Settings(BaseSettings):
@@ -58,7 +80,65 @@ class Settings(BaseSettings):
     MARKETPLACE_URL: str = "https://agents-api-staging.mangobeach-c18b898d.switzerlandnorth.azurecontainerapps.io"
     SERVICE_TIER: str = "BASIC"
     PLATFRORM_INT_URL: str
+    MONGO_MAX_CLIENTS: int = 32
+    MONGO_CLIENT_IDLE_TTL: int = 600
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int = 300000
+    PLATFORM_HTTP_TIMEOUT: float = 60
+    PLATFORM_CACHE_TTL: int = 300
+    PLATFORM_CACHE_STALE_TTL: int = 600
+    PLATFORM_CACHE_MAXSIZE: int = 1024
+    PAGINATION_SECRET_KEY: str | None = None
+    BULK_WRITE_MAX_ERRORS: int = 1000
+    TOKEN_CACHE_MAX_TTL: int = 3600
+    TOKEN_CACHE_MAXSIZE: int = 4096
+    MARKETPLACE_HTTP_TIMEOUT: float = 10
+    SUBSCRIPTION_CACHE_FAILURE_TTL: int = 10
+    SUBSCRIPTION_CACHE_REFRESH_AHEAD: int = 60
+    METRICS_ENABLED: bool = True
+    LOG_FORMAT: str = "json"
+    LOG_DETAILED_ENABLED: bool = True
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_EXCEPTION_BURST: int = 5
+    LOG_EXCEPTION_INTERVAL: float = 60
+    SLOW_QUERY_CAPTURE_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD_MS: float = 100
+    SLOW_QUERY_LOG_SIZE: int = 200
+    INDEX_ADVISOR_ENABLED: bool = True
+    INDEX_ADVISOR_MAX_NAMESPACES: int = 1024
+    INDEX_ADVISOR_MAX_SHAPES: int = 100
+    INDEX_ADVISOR_SAMPLE_SIZE: int = 1000
+    METADATA_CACHE_TTL: int = 30
+    METADATA_CACHE_MAXSIZE: int = 1024
+    QUERY_CACHE_COLLECTIONS: str = ""
+    QUERY_CACHE_TTL: float = 30
+    QUERY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    QUERY_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024
+    QUERY_CACHE_CHANGE_STREAMS: bool = False
+    QUERY_CACHE_MAX_WATCHERS: int = 64
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_TENANTS: int = 10000
+    # Per tier overrides of the admission limits, as JSON, e.g. {"FREE": {"max_concurrency": 1}}
+    ADMISSION_TIER_LIMITS: dict[str, dict[str, int | float]] = {}
+    CHANGE_STREAM_MAX_STREAMS: int = 100
+    CHANGE_STREAM_BUFFER_SIZE: int = 1000
+    CHANGE_STREAM_REPLAY_SIZE: int = 1000
+    CHANGE_STREAM_IDLE_SECONDS: float = 60
+    CHANGE_STREAM_HEARTBEAT_SECONDS: float = 15
+    FILTER_SHAPE_CACHE_SIZE: int = 1024
+    FILTER_SCHEMA_COERCION_ENABLED: bool = False
+    FILTER_SCHEMA_SAMPLE_SIZE: int = 100
+    FILTER_SCHEMA_TTL: int = 300
+    WRITE_COALESCING_ENABLED: bool = False
+    WRITE_COALESCING_WINDOW_MS: float = 2
+    WRITE_COALESCING_MAX_BATCH: int = 500
+    AGGREGATION_ALLOWED_STAGES: str = (
+        "$match,$project,$addFields,$set,$unset,$group,$sort,$limit,$skip,$count,$unwind,$lookup,$graphLookup,"
+        "$facet,$bucket,$bucketAuto,$sortByCount,$replaceRoot,$replaceWith,$sample,$unionWith,$setWindowFields,"
+        "$densify,$fill,$geoNear,$redact"
+    )
 
 
 settings = Settings()
-configure_logging()
+configure_logging(settings)
@@ -0,0 +1,129 @@
+import struct
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Literal
+
+import bson
+from core.bson_json import JsonMode, dumps_document
+from fastapi import Request
+from pymongo.command_cursor import RawBatchCommandCursor
+from pymongo.cursor import RawBatchCursor
+
+StreamFormat = Literal["ndjson", "json"]
+
+MEDIA_TYPES: dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Splits a streamed request body into lines without buffering the whole body"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+
+    if buffer:
+        yield buffer
+
+
+def count_raw_documents(raw_batch: bytes) -> int:
+    """Counts the documents of a raw BSON batch from their length prefixes, without decoding them"""
+    count = position = 0
+    while position < len(raw_batch):
+        position += struct.unpack_from("<i", raw_batch, position)[0]
+        count += 1
+    return count
+
+
+def _encode_batch(raw_batch: bytes, format: StreamFormat, json_mode: JsonMode, first: bool) -> bytes:
+    """Encodes one raw BSON batch as NDJSON lines or as a fragment of a JSON array"""
+    encoded = [dumps_document(document, json_mode) for document in bson.decode_all(raw_batch)]
+
+    if format == "ndjson":
+        return b"".join(line + b"\n" for line in encoded)
+
+    fragment = b",".join(encoded)
+    return fragment if first else b"," + fragment
+
+
+def iter_raw_batches(
+    cursor: RawBatchCursor | RawBatchCommandCursor,
+    first_batch: bytes | None,
+    format: StreamFormat,
+    json_mode: JsonMode,
+    on_close: Callable[[], None],
+    charge: Callable[[int], None] | None = None,
+) -> Iterator[bytes]:
+    """
+    Yields one encoded chunk per server batch of a raw batch cursor.
+
+    The response only pulls the next chunk once the previous one has been sent,
+    so a slow client naturally slows the getMore calls. When the client goes
+    away the generator is closed, which kills the server-side cursor.
+
+    Args:
+        cursor: the raw batch cursor, already advanced past first_batch
+        first_batch: the first batch, fetched eagerly so query errors surface before streaming
+        format: ndjson or json (a single array)
+        json_mode: how BSON types are rendered
+        on_close: called once the stream has finished or was abandoned
+        charge: called with the number of documents of each batch before it is sent
+    """
+    try:
+        if format == "json":
+            yield b"["
+
+        first = True
+        batch = first_batch
+        while batch is not None:
+            if batch:
+                if charge is not None:
+                    charge(count_raw_documents(batch))
+                yield _encode_batch(batch, format, json_mode, first)
+                first = False
+            batch = next(cursor, None)
+
+        if format == "json":
+            yield b"]"
+    finally:
+        cursor.close()
+        on_close()
+
+
+async def aiter_raw_batches(
+    cursor,
+    first_batch: bytes | None,
+    format: StreamFormat,
+    json_mode: JsonMode,
+    request: Request,
+    on_close: Callable[[], None],
+    charge: Callable[[int], Awaitable[None]] | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Async counterpart of iter_raw_batches for AsyncMongoClient raw batch (command) cursors.
+
+    Stops early and kills the cursor as soon as the client disconnects.
+    """
+    try:
+        if format == "json":
+            yield b"["
+
+        first = True
+        batch = first_batch
+        while batch is not None:
+            if await request.is_disconnected():
+                return
+            if batch:
+                if charge is not None:
+                    await charge(count_raw_documents(batch))
+                yield _encode_batch(batch, format, json_mode, first)
+                first = False
+            batch = await anext(cursor, None)
+
+        if format == "json":
+            yield b"]"
+    finally:
+        await cursor.close()
+        on_close()
@@ -0,0 +1,293 @@
+import datetime
+import threading
+from collections import deque
+from logging import getLogger
+from typing import Any, Iterator
+
+from core.config import settings
+from core.find_options import READ_PREFERENCES
+from core.mongo_client_registry import async_mongo_clients, mongo_clients
+from schemas.database import ExplainQueryInput, ExplainQueryResult, FindQueryInput, SlowQueryResult
+
+# Replaces literal values in query shapes, so queries differing only in their values share a shape
+SHAPE_PLACEHOLDER = "?"
+
+
+class ExplainOptionsError(ValueError):
+    """Raised when an explain request is missing the options its operation needs"""
+
+
+def _hint(hint: str | list[tuple[str, int]]) -> str | dict[str, int]:
+    return hint if isinstance(hint, str) else dict(hint)
+
+
+def explain_command(collection_name: str, query: ExplainQueryInput) -> dict[str, Any]:
+    """
+    Builds the command to explain. Updates and deletes are sent as their write commands,
+    which explain plans without applying.
+
+    Raises:
+        ExplainOptionsError: if an update is explained without an update document
+    """
+    # Options that apply to the whole command for reads, and to the statement for writes
+    options: dict[str, Any] = {}
+    if query.hint is not None:
+        options["hint"] = _hint(query.hint)
+    if query.collation is not None:
+        options["collation"] = query.collation
+
+    if query.operation == "aggregate":
+        return {"aggregate": collection_name, "pipeline": query.pipeline, "cursor": {}, **options}
+
+    if query.operation == "update":
+        if query.update is None:
+            raise ExplainOptionsError("An update document or pipeline is required to explain an update")
+        statement = {"q": query.filter, "u": query.update, "multi": query.multi, **options}
+        return {"update": collection_name, "updates": [statement]}
+
+    if query.operation == "delete":
+        statement = {"q": query.filter, "limit": 0 if query.multi else 1, **options}
+        return {"delete": collection_name, "deletes": [statement]}
+
+    command: dict[str, Any] = {"find": collection_name, "filter": query.filter}
+    if query.sort:
+        command["sort"] = dict(query.sort)
+    if query.projection is not None:
+        command["projection"] = query.projection
+    if query.limit:
+        command["limit"] = query.limit
+    if query.skip:
+        command["skip"] = query.skip
+
+    return {**command, **options}
+
+
+def _planner_sections(explain: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """
+    Yields the parts of an explain output holding a queryPlanner. Aggregations only have one
+    at the top when the whole pipeline runs in the query layer, otherwise it is in the $cursor stage,
+    and sharded aggregations have one per shard.
+    """
+    if "queryPlanner" in explain:
+        yield explain
+        return
+
+    stages = explain.get("stages") or []
+    if stages and isinstance(stages[0].get("$cursor"), dict):
+        yield stages[0]["$cursor"]
+
+    for shard in (explain.get("shards") or {}).values():
+        yield from _planner_sections(shard)
+
+
+def _plan_stages(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """Walks a plan tree from the root, including the plans of every shard"""
+    # Slot based execution wraps the classic plan
+    plan = plan.get("queryPlan", plan)
+    yield plan
+
+    for child in ("inputStage", "outerStage", "innerStage"):
+        if isinstance(plan.get(child), dict):
+            yield from _plan_stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+    for shard in plan.get("shards", []):
+        yield from _plan_stages(shard.get("winningPlan", {}))
+
+
+def _add(total: int | None, value: Any) -> int | None:
+    return total if value is None else (total or 0) + value
+
+
+def summarize_explain(explain: dict[str, Any]) -> ExplainQueryResult:
+    """Reduces the output of the explain command to the winning plan and its execution counters"""
+    result = ExplainQueryResult()
+
+    for section in _planner_sections(explain):
+        planner = section.get("queryPlanner", {})
+        result.namespace = result.namespace or planner.get("namespace")
+
+        winning_plan = planner.get("winningPlan", {})
+        result.rejected_plans += len(planner.get("rejectedPlans", []))
+        for shard in winning_plan.get("shards", []):
+            result.rejected_plans += len(shard.get("rejectedPlans", []))
+
+        for stage in _plan_stages(winning_plan):
+            if "stage" in stage:
+                result.stages.append(stage["stage"])
+            if stage.get("indexName") and stage["indexName"] not in result.indexes_used:
+                result.indexes_used.append(stage["indexName"])
+
+        stats = section.get("executionStats")
+        if stats:
+            result.keys_examined = _add(result.keys_examined, stats.get("totalKeysExamined"))
+            result.docs_examined = _add(result.docs_examined, stats.get("totalDocsExamined"))
+            result.n_returned = _add(result.n_returned, stats.get("nReturned"))
+            result.execution_time_ms = max(result.execution_time_ms or 0, stats.get("executionTimeMillis", 0))
+
+    # Later aggregation stages can filter or group the documents the query layer returned
+    stages = explain.get("stages") or []
+    if stages and "nReturned" in stages[-1]:
+        result.n_returned = stages[-1]["nReturned"]
+
+    result.collection_scan = "COLLSCAN" in result.stages
+    return result
+
+
+def query_shape(value: Any) -> Any:
+    """Replaces the literal values of a query with placeholders, keeping its fields and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        # Lists such as $in values collapse to their distinct shapes
+        shapes: list[Any] = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+
+    return SHAPE_PLACEHOLDER
+
+
+def find_shape(filter: dict[str, Any], query: FindQueryInput) -> dict[str, Any]:
+    """Returns the shape of a find: its filter shape, sort order and projected fields"""
+    shape: dict[str, Any] = {"filter": query_shape(filter), "sort": [list(key) for key in query.sort]}
+    if query.projection is not None:
+        shape["projection"] = sorted(query.projection)
+    return shape
+
+
+def find_explain_input(filter: dict[str, Any], query: FindQueryInput) -> ExplainQueryInput:
+    """Returns the planner only explain of a find request, which plans the query without running it again"""
+    return ExplainQueryInput(
+        operation="find",
+        filter=filter,
+        sort=query.sort,
+        projection=query.projection,
+        limit=query.limit,
+        skip=query.skip,
+        hint=query.hint,
+        collation=query.collation,
+        verbosity="queryPlanner",
+    )
+
+
+class SlowQueryLog:
+    """Thread safe ring buffer of the most recent queries slower than a threshold"""
+
+    def __init__(self, maxsize: int, threshold_ms: float, enabled: bool = True):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self._entries: deque[SlowQueryResult] = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def is_slow(self, duration_ms: float) -> bool:
+        return self.enabled and duration_ms >= self.threshold_ms
+
+    def record(self, entry: SlowQueryResult):
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def entries(self, limit: int | None = None) -> list[SlowQueryResult]:
+        """Returns the recorded queries, newest first"""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries if limit is None else entries[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold_ms": self.threshold_ms,
+                "maxsize": self._entries.maxlen,
+                "size": len(self._entries),
+                "recorded": self.recorded,
+            }
+
+
+slow_queries = SlowQueryLog(
+    maxsize=settings.SLOW_QUERY_LOG_SIZE,
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    enabled=settings.SLOW_QUERY_CAPTURE_ENABLED,
+)
+
+
+def _slow_query_entry(
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    filter: dict[str, Any],
+    query: FindQueryInput,
+    duration_ms: float,
+    operation_id: str,
+) -> SlowQueryResult:
+    return SlowQueryResult(
+        timestamp=datetime.datetime.now(datetime.timezone.utc),
+        mongo_project=mongo_project,
+        namespace=f"{db_name}.{collection_name}",
+        operation_id=operation_id,
+        duration_ms=round(duration_ms, 3),
+        shape=find_shape(filter, query),
+    )
+
+
+def capture_slow_query(
+    connection_string: str,
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    filter: dict[str, Any],
+    query: FindQueryInput,
+    duration_ms: float,
+    operation_id: str,
+):
+    """Explains a slow find and records it. Meant to run as a background task after the response is sent."""
+    logger = getLogger(__name__ + ".capture_slow_query")
+    entry = _slow_query_entry(mongo_project, db_name, collection_name, filter, query, duration_ms, operation_id)
+    try:
+        with mongo_clients.lease(connection_string) as client:
+            explain = client[db_name].command(
+                "explain",
+                explain_command(collection_name, find_explain_input(filter, query)),
+                verbosity="queryPlanner",
+                read_preference=READ_PREFERENCES.get(query.read_preference),
+            )
+        entry.plan = summarize_explain(explain)
+    except Exception as ex:
+        logger.warning(f"Could not explain slow query on {entry.namespace}: {ex}")
+        entry.plan_error = str(ex)
+
+    slow_queries.record(entry)
+
+
+async def acapture_slow_query(
+    connection_string: str,
+    mongo_project: str,
+    db_name: str,
+    collection_name: str,
+    filter: dict[str, Any],
+    query: FindQueryInput,
+    duration_ms: float,
+    operation_id: str,
+):
+    """Async variant of `capture_slow_query`"""
+    logger = getLogger(__name__ + ".acapture_slow_query")
+    entry = _slow_query_entry(mongo_project, db_name, collection_name, filter, query, duration_ms, operation_id)
+    try:
+        with async_mongo_clients.lease(connection_string) as client:
+            explain = await client[db_name].command(
+                "explain",
+                explain_command(collection_name, find_explain_input(filter, query)),
+                verbosity="queryPlanner",
+                read_preference=READ_PREFERENCES.get(query.read_preference),
+            )
+        entry.plan = summarize_explain(explain)
+    except Exception as ex:
+        logger.warning(f"Could not explain slow query on {entry.namespace}: {ex}")
+        entry.plan_error = str(ex)
+
+    slow_queries.record(entry)
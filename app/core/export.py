@@ -0,0 +1,395 @@
+import asyncio
+import csv
+import datetime
+import io
+import queue
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from logging import getLogger
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Literal
+
+import bson
+import zstandard
+from bson import Decimal128, Int64, ObjectId
+from core.bson_json import JsonMode, dumps_document
+from core.document_stream import count_raw_documents
+from core.pagination import query_digest, sign_token, verify_token
+from fastapi import Request
+
+ExportFormat = Literal["ndjson", "bson", "csv"]
+Compression = Literal["none", "gzip", "zstd"]
+
+MEDIA_TYPES: dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "bson": "application/bson",
+    "csv": "text/csv",
+    "gzip": "application/gzip",
+    "zstd": "application/zstd",
+}
+
+FILE_EXTENSIONS: dict[str, str] = {"ndjson": "ndjson", "bson": "bson", "csv": "csv", "gzip": "gz", "zstd": "zst"}
+
+# Documents sampled per requested partition when choosing range boundaries
+SAMPLES_PER_PARTITION = 100
+
+# Range queries only match values of the same BSON type bracket, so boundaries must share one
+_TYPE_ALIASES: list[tuple[tuple[type, ...], str]] = [
+    ((ObjectId,), "objectId"),
+    ((bool,), "bool"),
+    ((int, float, Int64, Decimal128), "number"),
+    ((str,), "string"),
+    ((datetime.datetime,), "date"),
+]
+
+_DONE = object()
+
+
+class InvalidRangeTokenError(ValueError):
+    """Raised when an export range token is malformed, tampered with or used with a different export"""
+
+
+def _type_alias(value: Any) -> str | None:
+    for types, alias in _TYPE_ALIASES:
+        if isinstance(value, types):
+            return alias
+    return None
+
+
+class ExportRange:
+    """
+    A partition of an export: key values in [lower, upper) of one BSON type bracket.
+
+    A missing bound is open ended. The remainder range holds every document whose key is
+    of another type (or missing), which the typed ranges cannot match.
+    """
+
+    def __init__(self, lower: Any = None, upper: Any = None, type_alias: str | None = None, remainder: bool = False):
+        self.lower = lower
+        self.upper = upper
+        self.type_alias = type_alias
+        self.remainder = remainder
+
+    def filter(self, key: str, filter: dict[str, Any]) -> dict[str, Any]:
+        """Restricts filter to the documents of this range"""
+        if self.remainder:
+            condition = {"$not": {"$type": self.type_alias}}
+        elif self.type_alias is None:
+            return filter
+        else:
+            condition = {}
+            if self.lower is not None:
+                condition["$gte"] = self.lower
+            if self.upper is not None:
+                condition["$lt"] = self.upper
+            if not condition:
+                condition = {"$type": self.type_alias}
+
+        return {"$and": [filter, {key: condition}]} if filter else {key: condition}
+
+    def describe(self) -> dict[str, str | None]:
+        if self.remainder:
+            return {"lower": None, "upper": None, "type": f"not {self.type_alias}"}
+        return {
+            "lower": None if self.lower is None else str(self.lower),
+            "upper": None if self.upper is None else str(self.upper),
+            "type": self.type_alias,
+        }
+
+
+def _binding(db_name: str, collection_name: str, key: str, filter: dict[str, Any]) -> bytes:
+    return query_digest({"db": db_name, "collection": collection_name, "key": key, "filter": filter})
+
+
+def encode_range_token(
+    export_range: ExportRange, db_name: str, collection_name: str, key: str, filter: dict[str, Any]
+) -> str:
+    """Builds a signed token for one range, bound to the collection, key and filter of the export"""
+    body = {"t": export_range.type_alias, "r": export_range.remainder}
+    if export_range.lower is not None:
+        body["lo"] = export_range.lower
+    if export_range.upper is not None:
+        body["hi"] = export_range.upper
+    return sign_token(_binding(db_name, collection_name, key, filter) + bson.encode(body))
+
+
+def decode_range_token(token: str, db_name: str, collection_name: str, key: str, filter: dict[str, Any]) -> ExportRange:
+    """Verifies a range token and returns the range it describes"""
+    payload = verify_token(token, error=InvalidRangeTokenError)
+    if payload[:8] != _binding(db_name, collection_name, key, filter):
+        raise InvalidRangeTokenError("Range token was issued for a different collection, key or filter")
+
+    try:
+        body = bson.decode(payload[8:])
+    except Exception:
+        raise InvalidRangeTokenError("Malformed range token")
+    return ExportRange(body.get("lo"), body.get("hi"), body.get("t"), body.get("r", False))
+
+
+def bucket_pipeline(key: str, filter: dict[str, Any], partitions: int) -> list[dict[str, Any]]:
+    """Samples the collection and lets $bucketAuto choose evenly filled key ranges"""
+    pipeline: list[dict[str, Any]] = [{"$match": filter}] if filter else []
+    pipeline.append({"$sample": {"size": partitions * SAMPLES_PER_PARTITION}})
+    pipeline.append({"$bucketAuto": {"groupBy": f"${key}", "buckets": partitions}})
+    return pipeline
+
+
+def ranges_from_buckets(buckets: list[dict[str, Any]]) -> list[ExportRange]:
+    """
+    Turns $bucketAuto output into contiguous ranges covering the whole key space.
+
+    Falls back to a single unbounded range when the sampled boundaries are not of a
+    single BSON type, since a range query cannot span type brackets.
+    """
+    bounds = [bucket["_id"]["min"] for bucket in buckets[1:]]
+    aliases = {_type_alias(bound) for bound in bounds}
+    if not bounds or len(aliases) != 1 or None in aliases:
+        return [ExportRange()]
+
+    alias = aliases.pop()
+    edges = [None, *bounds, None]
+    ranges = [ExportRange(lower, upper, alias) for lower, upper in zip(edges, edges[1:])]
+    ranges.append(ExportRange(type_alias=alias, remainder=True))
+    return ranges
+
+
+def plan_ranges(collection, key: str, filter: dict[str, Any], partitions: int) -> list[ExportRange]:
+    """Splits the documents matching filter into about `partitions` key ranges"""
+    if partitions <= 1:
+        return [ExportRange()]
+    return ranges_from_buckets(list(collection.aggregate(bucket_pipeline(key, filter, partitions), allowDiskUse=True)))
+
+
+async def aplan_ranges(collection, key: str, filter: dict[str, Any], partitions: int) -> list[ExportRange]:
+    """Async counterpart of plan_ranges for AsyncMongoClient collections"""
+    if partitions <= 1:
+        return [ExportRange()]
+    cursor = await collection.aggregate(bucket_pipeline(key, filter, partitions), allowDiskUse=True)
+    return ranges_from_buckets(await cursor.to_list())
+
+
+def _get_path(document: dict[str, Any], path: str) -> Any:
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return dumps_document(value, "string").decode()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _csv_rows(rows: list[list[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def csv_header(fields: list[str]) -> bytes:
+    return _csv_rows([fields])
+
+
+def encoder(format: ExportFormat, json_mode: JsonMode, fields: list[str] | None) -> Callable[[bytes], bytes]:
+    """Returns a function encoding one raw BSON batch in the export format"""
+    if format == "bson":
+        # A raw batch already is a concatenation of BSON documents, the mongodump file format
+        return lambda raw_batch: raw_batch
+
+    if format == "csv":
+        return lambda raw_batch: _csv_rows(
+            [[_csv_value(_get_path(document, field)) for field in fields] for document in bson.decode_all(raw_batch)]
+        )
+
+    return lambda raw_batch: b"".join(
+        dumps_document(document, json_mode) + b"\n" for document in bson.decode_all(raw_batch)
+    )
+
+
+class _Uncompressed:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def compressor(compression: Compression):
+    """Returns a streaming compressor with compress and flush methods"""
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compressobj()
+    return _Uncompressed()
+
+
+def media_type(format: ExportFormat, compression: Compression) -> str:
+    return MEDIA_TYPES[format if compression == "none" else compression]
+
+
+def content_disposition(collection_name: str, format: ExportFormat, compression: Compression) -> str:
+    """Names the download after the collection, e.g. orders.ndjson.gz"""
+    name = f"{collection_name}.{FILE_EXTENSIONS[format]}"
+    if compression != "none":
+        name = f"{name}.{FILE_EXTENSIONS[compression]}"
+    return f'attachment; filename="{name}"'
+
+
+def iter_export(
+    collection,
+    key: str,
+    filter: dict[str, Any],
+    ranges: list[ExportRange],
+    encode: Callable[[bytes], bytes],
+    header: bytes,
+    compress,
+    workers: int,
+    find_kwargs: dict[str, Any],
+    on_close: Callable[[], None],
+    charge: Callable[[int], None] | None = None,
+) -> Iterator[bytes]:
+    """
+    Scans export ranges on up to `workers` threads and yields one compressed stream.
+
+    Workers hand encoded batches over through a small bounded queue, so at most a few
+    batches are held in memory and a slow client slows the scans down. When the client
+    goes away the generator is closed, which stops the workers and kills their cursors.
+    A scan error ends the stream early, so the client sees a truncated response.
+    `charge` is called with the number of documents of each batch before it is encoded.
+    """
+    logger = getLogger(__name__ + ".iter_export")
+    chunks: queue.Queue = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def scan(export_range: ExportRange):
+        try:
+            cursor = collection.find_raw_batches(filter=export_range.filter(key, filter), **find_kwargs)
+            try:
+                for raw_batch in cursor:
+                    if stop.is_set():
+                        return
+                    if charge is not None:
+                        charge(count_raw_documents(raw_batch))
+                    put(encode(raw_batch))
+            finally:
+                cursor.close()
+        except Exception as ex:
+            logger.exception(ex)
+            put(ex)
+        finally:
+            put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+    try:
+        for export_range in ranges:
+            executor.submit(copy_context().run, scan, export_range)
+
+        if header:
+            yield compress.compress(header)
+
+        remaining = len(ranges)
+        while remaining:
+            item = chunks.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+
+            data = compress.compress(item)
+            if data:
+                yield data
+
+        yield compress.flush()
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        on_close()
+
+
+async def aiter_export(
+    collection,
+    key: str,
+    filter: dict[str, Any],
+    ranges: list[ExportRange],
+    encode: Callable[[bytes], bytes],
+    header: bytes,
+    compress,
+    workers: int,
+    find_kwargs: dict[str, Any],
+    request: Request,
+    on_close: Callable[[], None],
+    charge: Callable[[int], Awaitable[None]] | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Async counterpart of iter_export for AsyncMongoClient collections.
+
+    Up to `workers` range scans run as tasks on the event loop and stop as soon as
+    the client disconnects.
+    """
+    logger = getLogger(__name__ + ".aiter_export")
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    pending: asyncio.Queue = asyncio.Queue()
+    for export_range in ranges:
+        pending.put_nowait(export_range)
+
+    async def scan():
+        while not pending.empty():
+            export_range = pending.get_nowait()
+            cursor = collection.find_raw_batches(filter=export_range.filter(key, filter), **find_kwargs)
+            try:
+                async for raw_batch in cursor:
+                    if charge is not None:
+                        await charge(count_raw_documents(raw_batch))
+                    await chunks.put(encode(raw_batch))
+            except Exception as ex:
+                logger.exception(ex)
+                await chunks.put(ex)
+            finally:
+                await cursor.close()
+        await chunks.put(_DONE)
+
+    tasks = [asyncio.create_task(scan()) for _ in range(min(workers, len(ranges)))]
+    try:
+        if header:
+            yield compress.compress(header)
+
+        remaining = len(tasks)
+        while remaining:
+            if await request.is_disconnected():
+                return
+            item = await chunks.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+
+            data = compress.compress(item)
+            if data:
+                yield data
+
+        yield compress.flush()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        on_close()
@@ -0,0 +1,343 @@
+import itertools
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from logging import getLogger
+from typing import Any
+
+import orjson
+from bson import Binary, Decimal128, ObjectId, json_util
+from bson.binary import UUID_SUBTYPE
+from bson.errors import InvalidId
+from core.config import settings
+from core.explain import SHAPE_PLACEHOLDER, query_shape
+from core.ttl_cache import AsyncTTLCache, TTLCache
+
+# The keys of the MongoDB Extended JSON type wrappers, e.g. {"$oid": "..."} or {"$date": "..."}
+EXTENDED_JSON_KEYS = {
+    frozenset(keys)
+    for keys in (
+        ("$oid",),
+        ("$date",),
+        ("$numberDecimal",),
+        ("$numberLong",),
+        ("$numberInt",),
+        ("$numberDouble",),
+        ("$binary",),
+        ("$binary", "$type"),
+        ("$uuid",),
+        ("$regularExpression",),
+        ("$timestamp",),
+        ("$minKey",),
+        ("$maxKey",),
+    )
+}
+
+# Operators whose operand is a value of the field, or a list of them
+_VALUE_OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte"}
+_LIST_OPERATORS = {"$in", "$nin", "$all"}
+_LOGICAL_OPERATORS = {"$and", "$or", "$nor"}
+
+# Conversions, by the type of a field's sampled values. Strings of other types are left as sent.
+WRAPPER = "extendedJson"
+OBJECT_ID = "objectId"
+DATE = "date"
+DECIMAL = "decimal"
+UUID = "uuid"
+
+# A conversion to apply at a path of a filter or update, "*" standing for every item of a list
+Plan = list[tuple[tuple[str, ...], str]]
+
+
+class FilterDecodeError(ValueError):
+    """Raised when a filter or update holds malformed Extended JSON, e.g. an invalid $oid"""
+
+
+class FieldTypes:
+    """
+    The fields of a collection whose sampled values all had one type a string can be converted to.
+    Every sample gets a new version, so plans compiled against an older sample are not reused.
+    """
+
+    _versions = itertools.count(1)
+
+    def __init__(self, types: dict[str, str]):
+        self.types = types
+        self.version = next(self._versions)
+
+
+def _is_wrapper(value: Any) -> bool:
+    return isinstance(value, dict) and frozenset(value) in EXTENDED_JSON_KEYS
+
+
+def _field_path(prefix: str | None, key: str) -> str:
+    return key if prefix is None else f"{prefix}.{key}"
+
+
+def _coercion(types: FieldTypes | None, field: str) -> str | None:
+    # Array positions, e.g. items.0.sku, are typed as the items themselves
+    field = ".".join(part for part in field.split(".") if not part.isdigit())
+    if types is not None and field in types.types:
+        return types.types[field]
+    # Top level _id strings have always been read as ObjectIds when they are valid ones
+    return OBJECT_ID if field == "_id" else None
+
+
+def _compile_values(shape: Any, path: tuple[str, ...], plan: Plan):
+    """Decodes the Extended JSON anywhere in a value, where field types do not apply"""
+    if _is_wrapper(shape):
+        plan.append((path, WRAPPER))
+    elif isinstance(shape, dict):
+        for key, item in shape.items():
+            _compile_values(item, path + (key,), plan)
+    elif isinstance(shape, list):
+        for item in shape:
+            _compile_values(item, path + ("*",), plan)
+
+
+def _compile_value(shape: Any, types: FieldTypes | None, path: tuple[str, ...], field: str, plan: Plan):
+    if shape == SHAPE_PLACEHOLDER:
+        coercion = _coercion(types, field)
+        if coercion is not None:
+            plan.append((path, coercion))
+    else:
+        # Extended JSON, or an embedded document or array matched as a whole
+        _compile_values(shape, path, plan)
+
+
+def _compile_condition(shape: Any, types: FieldTypes | None, path: tuple[str, ...], field: str, plan: Plan):
+    if not (isinstance(shape, dict) and shape and all(key.startswith("$") for key in shape)) or _is_wrapper(shape):
+        _compile_value(shape, types, path, field, plan)
+        return
+
+    for operator, operand in shape.items():
+        if operator in _VALUE_OPERATORS:
+            _compile_value(operand, types, path + (operator,), field, plan)
+        elif operator in _LIST_OPERATORS and isinstance(operand, list):
+            for item in operand:
+                _compile_value(item, types, path + (operator, "*"), field, plan)
+        elif operator == "$not":
+            _compile_condition(operand, types, path + (operator,), field, plan)
+        elif operator == "$elemMatch" and isinstance(operand, dict):
+            if operand and all(key.startswith("$") for key in operand):
+                # Conditions on the array items themselves
+                _compile_condition(operand, types, path + (operator,), field, plan)
+            else:
+                _compile_filter(operand, types, path + (operator,), field, plan)
+        else:
+            _compile_values(operand, path + (operator,), plan)
+
+
+def _compile_filter(
+    shape: dict[str, Any], types: FieldTypes | None, path: tuple[str, ...], prefix: str | None, plan: Plan
+):
+    for key, value in shape.items():
+        if key in _LOGICAL_OPERATORS and isinstance(value, list):
+            for clause in value:
+                if isinstance(clause, dict):
+                    _compile_filter(clause, types, path + (key, "*"), prefix, plan)
+        elif key.startswith("$"):
+            # $expr, $text, $where and the like only get their Extended JSON decoded
+            _compile_values(value, path + (key,), plan)
+        else:
+            _compile_condition(value, types, path + (key,), _field_path(prefix, key), plan)
+
+
+def _decode_wrapper(value: dict[str, Any]) -> Any:
+    # Inner wrappers first, as in {"$date": {"$numberLong": "..."}}, like json_util.loads decodes bottom up
+    inner = {key: _decode_wrapper(item) if _is_wrapper(item) else item for key, item in value.items()}
+    try:
+        return json_util.object_hook(inner)
+    except Exception as ex:
+        raise FilterDecodeError(f"Invalid Extended JSON {orjson.dumps(value).decode()}: {ex}")
+
+
+def _convert(value: Any, conversion: str) -> Any:
+    """Converts one value. Values that are not of the expected form are left unchanged."""
+    if conversion == WRAPPER:
+        return _decode_wrapper(value) if _is_wrapper(value) else value
+    if not isinstance(value, str):
+        return value
+
+    try:
+        if conversion == OBJECT_ID:
+            return ObjectId(value) if len(value) == 24 else value
+        if conversion == DATE:
+            return datetime.fromisoformat(value)
+        if conversion == DECIMAL:
+            return Decimal128(value)
+        if conversion == UUID:
+            return Binary.from_uuid(uuid.UUID(value))
+    except (InvalidId, ValueError, ArithmeticError):
+        pass
+    return value
+
+
+def _apply(node: Any, path: tuple[str, ...], conversion: str):
+    key, rest = path[0], path[1:]
+    if key == "*" and isinstance(node, list):
+        keys = range(len(node))
+    elif isinstance(node, dict) and key in node:
+        keys = (key,)
+    else:
+        return
+
+    for key in keys:
+        if rest:
+            _apply(node[key], rest, conversion)
+        else:
+            node[key] = _convert(node[key], conversion)
+
+
+class FilterDecoder:
+    """
+    Decodes the Extended JSON of filters and updates into BSON types, so an ObjectId or date
+    compares as one and can use an index. With the field types of a collection, plain strings
+    sent for ObjectId, date, decimal and UUID fields are converted too.
+
+    The conversions a filter needs depend only on its shape, its fields and operators, and the
+    field types, so they are compiled once per shape and kept in a bounded LRU. Each request
+    then only visits the paths that need converting.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._plans: OrderedDict[tuple, Plan] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _plan(self, kind: str, value: Any, types: FieldTypes | None) -> Plan:
+        shape = query_shape(value)
+        key = (kind, orjson.dumps(shape), types.version if types is not None else 0)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        plan = []
+        if kind == "filter":
+            _compile_filter(shape, types, (), None, plan)
+        else:
+            _compile_values(shape, (), plan)
+        # Lists collapse to their distinct item shapes, which may need the same conversions
+        plan = list(dict.fromkeys(plan))
+
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def decode_filter(self, filter: dict[str, Any], types: FieldTypes | None = None) -> dict[str, Any]:
+        """
+        Converts a filter in place and returns it.
+
+        Raises:
+            FilterDecodeError: if it holds malformed Extended JSON
+        """
+        for path, conversion in self._plan("filter", filter, types):
+            _apply(filter, path, conversion)
+        return filter
+
+    def decode_update(self, update: dict[str, Any] | list[dict[str, Any]]) -> dict[str, Any] | list[dict[str, Any]]:
+        """
+        Converts the Extended JSON of an update document or pipeline in place and returns it.
+        Field types do not apply: the values written are stored as sent.
+
+        Raises:
+            FilterDecodeError: if it holds malformed Extended JSON
+        """
+        for path, conversion in self._plan("update", update, None):
+            _apply(update, path, conversion)
+        return update
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"shapes": len(self._plans), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+filter_decoder = FilterDecoder(maxsize=settings.FILTER_SHAPE_CACHE_SIZE)
+decode_filter = filter_decoder.decode_filter
+decode_update = filter_decoder.decode_update
+
+# Sampled field types per collection, when FILTER_SCHEMA_COERCION_ENABLED
+field_types_cache = TTLCache(ttl=settings.FILTER_SCHEMA_TTL, maxsize=settings.METADATA_CACHE_MAXSIZE)
+async_field_types_cache = AsyncTTLCache(ttl=settings.FILTER_SCHEMA_TTL, maxsize=settings.METADATA_CACHE_MAXSIZE)
+
+
+def _value_type(value: Any) -> str:
+    if isinstance(value, ObjectId):
+        return OBJECT_ID
+    if isinstance(value, datetime):
+        return DATE
+    if isinstance(value, Decimal128):
+        return DECIMAL
+    if isinstance(value, uuid.UUID) or (isinstance(value, Binary) and value.subtype == UUID_SUBTYPE):
+        return UUID
+    return type(value).__name__
+
+
+def sampled_field_types(documents: list[dict[str, Any]]) -> FieldTypes:
+    """Returns the fields, dotted for embedded documents, whose non null values all have one convertible type"""
+    seen: dict[str, set[str]] = {}
+
+    def visit(value: Any, field: str | None):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                visit(item, _field_path(field, key))
+        elif isinstance(value, list):
+            # Queries on an array field match its items
+            for item in value:
+                visit(item, field)
+        elif value is not None and field is not None:
+            seen.setdefault(field, set()).add(_value_type(value))
+
+    for document in documents:
+        visit(document, None)
+
+    convertible = {OBJECT_ID, DATE, DECIMAL, UUID}
+    return FieldTypes({field: kinds.pop() for field, kinds in seen.items() if len(kinds) == 1 and kinds <= convertible})
+
+
+def _sample_pipeline() -> list[dict[str, Any]]:
+    return [{"$sample": {"size": settings.FILTER_SCHEMA_SAMPLE_SIZE}}]
+
+
+def field_types(client, connection_string: str, db_name: str, collection_name: str) -> FieldTypes | None:
+    """
+    Returns the sampled field types of a collection, cached for FILTER_SCHEMA_TTL seconds, or None
+    unless FILTER_SCHEMA_COERCION_ENABLED. A failed sample is cached as None, filters are then only
+    decoded from their Extended JSON.
+    """
+    if not settings.FILTER_SCHEMA_COERCION_ENABLED:
+        return None
+
+    def load() -> FieldTypes | None:
+        try:
+            return sampled_field_types(list(client[db_name][collection_name].aggregate(_sample_pipeline())))
+        except Exception as ex:
+            getLogger(__name__ + ".field_types").warning(f"Could not sample {db_name}.{collection_name}: {ex}")
+            return None
+
+    return field_types_cache.get_or_load((connection_string, db_name, collection_name), load)
+
+
+async def afield_types(client, connection_string: str, db_name: str, collection_name: str) -> FieldTypes | None:
+    """Async variant of `field_types`"""
+    if not settings.FILTER_SCHEMA_COERCION_ENABLED:
+        return None
+
+    async def load() -> FieldTypes | None:
+        try:
+            cursor = await client[db_name][collection_name].aggregate(_sample_pipeline())
+            return sampled_field_types(await cursor.to_list())
+        except Exception as ex:
+            getLogger(__name__ + ".field_types").warning(f"Could not sample {db_name}.{collection_name}: {ex}")
+            return None
+
+    return await async_field_types_cache.get_or_load((connection_string, db_name, collection_name), load)
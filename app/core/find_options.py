@@ -0,0 +1,64 @@
+from typing import Any
+
+from pymongo import ReadPreference
+from schemas.database import CountQueryInput, DistinctQueryInput, FindQueryInput
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def find_kwargs(query: FindQueryInput) -> dict[str, Any]:
+    """
+    Builds the keyword arguments for Collection.find / find_raw_batches from a find request.
+    Options the caller did not set are left out so the server defaults apply.
+    """
+    kwargs: dict[str, Any] = {
+        "limit": query.limit,
+        "skip": query.skip,
+        "sort": query.sort,
+    }
+    if query.projection is not None:
+        kwargs["projection"] = query.projection
+    if query.hint is not None:
+        kwargs["hint"] = query.hint
+    if query.max_time_ms is not None:
+        kwargs["max_time_ms"] = query.max_time_ms
+    if query.batch_size is not None:
+        kwargs["batch_size"] = query.batch_size
+    if query.collation is not None:
+        kwargs["collation"] = query.collation
+
+    return kwargs
+
+
+def count_kwargs(query: CountQueryInput) -> dict[str, Any]:
+    """Builds the keyword arguments for Collection.count_documents from a count request"""
+    kwargs: dict[str, Any] = {}
+    if query.skip:
+        kwargs["skip"] = query.skip
+    if query.limit:
+        kwargs["limit"] = query.limit
+    if query.hint is not None:
+        kwargs["hint"] = query.hint
+    if query.max_time_ms is not None:
+        kwargs["maxTimeMS"] = query.max_time_ms
+
+    return kwargs
+
+
+def distinct_kwargs(query: DistinctQueryInput) -> dict[str, Any]:
+    """Builds the keyword arguments for Collection.distinct from a distinct request"""
+    return {} if query.max_time_ms is None else {"maxTimeMS": query.max_time_ms}
+
+
+def with_read_preference(collection, read_preference: str | None):
+    """Returns the collection configured with the requested read preference, if any"""
+    if read_preference is None:
+        return collection
+
+    return collection.with_options(read_preference=READ_PREFERENCES[read_preference])
@@ -0,0 +1,334 @@
+import threading
+import time
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Hashable
+
+import orjson
+from core.bson_json import dumps_document
+from core.config import settings
+from core.explain import query_shape
+from core.metadata import creating
+from core.mongo_client_registry import async_mongo_clients, mongo_clients
+from pymongo import IndexModel
+from schemas.database import (
+    CreateIndexQueryInput,
+    IndexAdviceResult,
+    IndexRecommendation,
+    IndexResult,
+    IndexUsageResult,
+)
+
+# Operators a compound index serves like an equality match. $in is only one when the query does not sort,
+# otherwise the index has to merge the sorted runs of every value like a range.
+_EQUALITY_OPERATORS = {"$eq", "$in"}
+
+# Top level operators that do not change which index can serve a query
+_IGNORED_OPERATORS = {"$comment"}
+
+
+def _jsonable(value: Any) -> Any:
+    return orjson.loads(dumps_document(value, "relaxed"))
+
+
+def _index_keys(key: dict[str, Any]) -> list[tuple[str, int | str]]:
+    # Directions may come back as doubles
+    return [(field, int(value) if isinstance(value, float) else value) for field, value in key.items()]
+
+
+def index_result(spec: dict[str, Any]) -> IndexResult:
+    """Converts a listIndexes entry"""
+    partial_filter = spec.get("partialFilterExpression")
+    return IndexResult(
+        name=spec["name"],
+        keys=_index_keys(spec["key"]),
+        unique=spec.get("unique", False),
+        sparse=spec.get("sparse", False),
+        hidden=spec.get("hidden", False),
+        expire_after_seconds=spec.get("expireAfterSeconds"),
+        partial_filter_expression=None if partial_filter is None else _jsonable(partial_filter),
+    )
+
+
+def index_usage_result(stats: dict[str, Any]) -> IndexUsageResult:
+    """Converts an $indexStats entry"""
+    accesses = stats.get("accesses", {})
+    return IndexUsageResult(
+        name=stats["name"],
+        keys=_index_keys(stats["key"]),
+        accesses=int(accesses.get("ops", 0)),
+        since=accesses.get("since"),
+        host=stats.get("host"),
+        shard=stats.get("shard"),
+        building=stats.get("building", False),
+    )
+
+
+def index_model(query: CreateIndexQueryInput) -> IndexModel:
+    """Builds the index to create. Options the caller did not set are left out so the server defaults apply."""
+    kwargs: dict[str, Any] = {}
+    if query.name is not None:
+        kwargs["name"] = query.name
+    if query.unique:
+        kwargs["unique"] = True
+    if query.sparse:
+        kwargs["sparse"] = True
+    if query.hidden:
+        kwargs["hidden"] = True
+    if query.expire_after_seconds is not None:
+        kwargs["expireAfterSeconds"] = query.expire_after_seconds
+    if query.partial_filter_expression is not None:
+        kwargs["partialFilterExpression"] = query.partial_filter_expression
+    if query.collation is not None:
+        kwargs["collation"] = query.collation
+
+    return IndexModel(query.keys, **kwargs)
+
+
+def create_indexes_kwargs(query: CreateIndexQueryInput) -> dict[str, Any]:
+    """Builds the keyword arguments for Collection.create_indexes"""
+    return {} if query.commit_quorum is None else {"commitQuorum": query.commit_quorum}
+
+
+def build_index(connection_string: str, db_name: str, collection_name: str, model: IndexModel, kwargs: dict):
+    """Builds an index in a background task, logging failures since the caller has already been answered"""
+    logger = getLogger(__name__ + ".build_index")
+    try:
+        with mongo_clients.lease(connection_string) as client:
+            with creating((connection_string, db_name, collection_name)):
+                client[db_name][collection_name].create_indexes([model], **kwargs)
+    except Exception as ex:
+        logger.exception(ex)
+
+
+async def abuild_index(connection_string: str, db_name: str, collection_name: str, model: IndexModel, kwargs: dict):
+    """Async variant of `build_index`"""
+    logger = getLogger(__name__ + ".abuild_index")
+    try:
+        with async_mongo_clients.lease(connection_string) as client:
+            with creating((connection_string, db_name, collection_name)):
+                await client[db_name][collection_name].create_indexes([model], **kwargs)
+    except Exception as ex:
+        logger.exception(ex)
+
+
+class QueryShape:
+    """The equality, sort and range fields of a query, the parts of an ESR compound index"""
+
+    __slots__ = ("equality", "sort", "range")
+
+    def __init__(self, equality: tuple[str, ...], sort: tuple[tuple[str, int], ...], range: tuple[str, ...]):
+        self.equality = equality
+        self.sort = sort
+        self.range = range
+
+    @property
+    def key(self) -> tuple:
+        return (self.equality, self.sort, self.range)
+
+
+def analyze_query(filter: dict[str, Any], sort: list[tuple[str, int]] | None = None) -> QueryShape | None:
+    """
+    Splits a query into its equality, sort and range fields. Returns None for queries a single
+    compound index cannot serve, such as $or, $expr or $text queries.
+    """
+    sort = sort or []
+    equality: list[str] = []
+    ranges: list[str] = []
+
+    def visit(clause: dict[str, Any]) -> bool:
+        for field, value in clause.items():
+            if field == "$and" and isinstance(value, list):
+                if not all(isinstance(sub, dict) and visit(sub) for sub in value):
+                    return False
+            elif field.startswith("$"):
+                if field not in _IGNORED_OPERATORS:
+                    return False
+            elif isinstance(value, dict) and value and all(op.startswith("$") for op in value):
+                operators = set(value)
+                if operators <= _EQUALITY_OPERATORS and not ("$in" in operators and sort):
+                    equality.append(field)
+                else:
+                    ranges.append(field)
+            else:
+                # Plain values and embedded documents are matched exactly
+                equality.append(field)
+        return True
+
+    if not visit(filter):
+        return None
+
+    equality_fields = tuple(sorted(set(equality)))
+    # Sorting on a field matched by equality is free, every matched document has the same value
+    sort_fields = tuple((field, direction) for field, direction in sort if field not in equality_fields)
+    sorted_fields = {field for field, _ in sort_fields}
+    range_fields = tuple(sorted(set(ranges) - set(equality_fields) - sorted_fields))
+
+    return QueryShape(equality_fields, sort_fields, range_fields)
+
+
+class _ShapeStats:
+    def __init__(self, shape: QueryShape, example: dict[str, Any]):
+        self.shape = shape
+        self.example = example
+        self.count = 0
+        self.operations: set[str] = set()
+        self.last_seen = time.monotonic()
+
+
+class IndexAdvisor:
+    """
+    Thread safe aggregate of the query shapes sent to each collection. Bounded both in
+    collections and in shapes per collection, evicting the least recently seen first.
+    """
+
+    def __init__(self, max_namespaces: int, max_shapes: int, enabled: bool = True):
+        self.enabled = enabled
+        self.max_namespaces = max_namespaces
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._namespaces: OrderedDict[Hashable, OrderedDict[tuple, _ShapeStats]] = OrderedDict()
+
+    def observe(
+        self,
+        namespace: Hashable,
+        filter: dict[str, Any],
+        sort: list[tuple[str, int]] | None,
+        operation_id: str,
+    ):
+        """Records the shape of a query. Queries without filter or sort fields are ignored."""
+        if not self.enabled:
+            return
+
+        shape = analyze_query(filter, sort)
+        if shape is None or not (shape.equality or shape.sort or shape.range):
+            return
+
+        with self._lock:
+            shapes = self._namespaces.get(namespace)
+            if shapes is None:
+                shapes = self._namespaces[namespace] = OrderedDict()
+                while len(self._namespaces) > self.max_namespaces:
+                    self._namespaces.popitem(last=False)
+            self._namespaces.move_to_end(namespace)
+
+            stats = shapes.get(shape.key)
+            if stats is None:
+                stats = shapes[shape.key] = _ShapeStats(shape, query_shape(filter))
+                while len(shapes) > self.max_shapes:
+                    shapes.popitem(last=False)
+            shapes.move_to_end(shape.key)
+
+            stats.count += 1
+            stats.operations.add(operation_id)
+            stats.last_seen = time.monotonic()
+
+    def shapes(self, namespace: Hashable) -> list[_ShapeStats]:
+        """Returns the shapes seen for a collection, most frequent first"""
+        with self._lock:
+            shapes = list(self._namespaces.get(namespace, {}).values())
+        return sorted(shapes, key=lambda stats: stats.count, reverse=True)
+
+
+index_advisor = IndexAdvisor(
+    max_namespaces=settings.INDEX_ADVISOR_MAX_NAMESPACES,
+    max_shapes=settings.INDEX_ADVISOR_MAX_SHAPES,
+    enabled=settings.INDEX_ADVISOR_ENABLED,
+)
+
+
+def equality_fields(shapes: list[_ShapeStats]) -> list[str]:
+    """Returns the fields whose selectivity the advice needs. _id values are unique, so it is never sampled."""
+    return sorted({field for stats in shapes for field in stats.shape.equality} - {"_id"})
+
+
+def selectivity_pipeline(fields: list[str], sample_size: int) -> list[dict[str, Any]]:
+    """Counts the distinct values of each field in a random sample of the collection"""
+    facets: dict[str, Any] = {"sampled": [{"$count": "n"}]}
+    for i, field in enumerate(fields):
+        facets[f"f{i}"] = [{"$group": {"_id": f"${field}"}}, {"$count": "n"}]
+
+    return [{"$sample": {"size": sample_size}}, {"$facet": facets}]
+
+
+def parse_selectivity(result: dict[str, Any] | None, fields: list[str]) -> tuple[int, dict[str, int]]:
+    """Returns the number of sampled documents and the distinct values per field from the selectivity pipeline"""
+
+    def count(facet: str) -> int:
+        rows = (result or {}).get(facet) or []
+        return rows[0]["n"] if rows else 0
+
+    return count("sampled"), {field: count(f"f{i}") for i, field in enumerate(fields)}
+
+
+def index_serves(keys: list[tuple[str, Any]], shape: QueryShape) -> bool:
+    """
+    Whether an index serves a query shape following ESR: its keys start with the equality fields
+    in any order, then the sort fields in order and all in the same or all in reverse direction,
+    then the range fields in any order.
+    """
+    equality_end = len(shape.equality)
+    sort_end = equality_end + len(shape.sort)
+    range_end = sort_end + len(shape.range)
+    if len(keys) < range_end:
+        return False
+
+    if {field for field, _ in keys[:equality_end]} != set(shape.equality):
+        return False
+
+    sort_keys = keys[equality_end:sort_end]
+    if [field for field, _ in sort_keys] != [field for field, _ in shape.sort]:
+        return False
+    directions = [direction for _, direction in sort_keys]
+    if not all(isinstance(direction, int) for direction in directions):
+        return False
+    wanted = [direction for _, direction in shape.sort]
+    if directions != wanted and directions != [-direction for direction in wanted]:
+        return False
+
+    return {field for field, _ in keys[sort_end:range_end]} == set(shape.range)
+
+
+def recommend_indexes(
+    namespace: str,
+    shapes: list[_ShapeStats],
+    indexes: list[IndexResult],
+    sampled: int,
+    distinct: dict[str, int],
+) -> IndexAdviceResult:
+    """
+    Recommends an ESR compound index per query shape: the equality fields, most selective first,
+    then the sort fields, then the range fields. Hidden and partial indexes are not counted as
+    serving a shape since the planner may not be able to use them.
+    """
+    usable = [index for index in indexes if not index.hidden and index.partial_filter_expression is None]
+    advice = IndexAdviceResult(namespace=namespace, shapes_seen=len(shapes), sample_size=sampled)
+    distinct = {"_id": sampled, **distinct}
+
+    for stats in shapes:
+        shape = stats.shape
+        equality = sorted(shape.equality, key=lambda field: distinct.get(field, 0), reverse=True)
+
+        selectivity = None
+        if equality and sampled:
+            selectivity = 1.0
+            for field in equality:
+                selectivity /= max(distinct.get(field, 1), 1)
+
+        covered_by = next((index.name for index in usable if index_serves(index.keys, shape)), None)
+
+        advice.recommendations.append(
+            IndexRecommendation(
+                keys=[(field, 1) for field in equality] + list(shape.sort) + [(field, 1) for field in shape.range],
+                equality_fields=equality,
+                sort_fields=list(shape.sort),
+                range_fields=list(shape.range),
+                query_count=stats.count,
+                operations=sorted(stats.operations),
+                example_shape=stats.example,
+                estimated_selectivity=selectivity,
+                covered_by=covered_by,
+            )
+        )
+
+    return advice
@@ -0,0 +1,184 @@
+import copy
+import datetime
+import logging
+import queue
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler
+
+import orjson
+from core.metrics import log_records_dropped
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Header carrying the id that ties together the log records of one request, accepted from callers and echoed back
+CORRELATION_ID_HEADER = "x-correlation-id"
+
+correlation_id: ContextVar[str | None] = ContextVar("correlation_id", default=None)
+
+
+class CorrelationIdMiddleware:
+    """ASGI middleware binding a correlation id to every request, taken from the request headers or generated"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        value = (headers.get(CORRELATION_ID_HEADER.encode()) or headers.get(b"x-request-id") or b"").decode("latin-1")
+        # Caller supplied ids end up in every log line, so they are kept short
+        request_id = value[:64] or uuid.uuid4().hex
+        token = correlation_id.set(request_id)
+        header = (CORRELATION_ID_HEADER.encode(), request_id.encode("latin-1"))
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            correlation_id.reset(token)
+
+
+async def forward_correlation_id(request):
+    """httpx request hook passing the correlation id of the current request on to the called service"""
+    request_id = correlation_id.get()
+    if request_id is not None:
+        request.headers[CORRELATION_ID_HEADER] = request_id
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Stamps records with the correlation id of the request they were logged for"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class ExceptionRateLimitFilter(logging.Filter):
+    """
+    Limits how many tracebacks each call site logs: at most `burst` per `interval` seconds.
+    Records over the limit are still logged, without their traceback, so failures stay visible
+    while an error storm does not pay for formatting and writing thousands of identical tracebacks.
+    """
+
+    def __init__(self, burst: int, interval: float, max_sites: int = 4096):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_sites = max_sites
+        self._lock = threading.Lock()
+        self._sites: dict[tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not record.exc_info:
+            return True
+
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._sites.get(site)
+            if window is None or now - window[0] >= self.interval:
+                if window is None and len(self._sites) >= self.max_sites:
+                    self._sites.clear()
+                # [window start, tracebacks logged, tracebacks suppressed]
+                suppressed = 0 if window is None else window[2]
+                window = self._sites[site] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed_tracebacks = suppressed
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+
+        record.exc_info = None
+        record.exc_text = None
+        record.traceback_suppressed = True
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records to a QueueListener thread through a bounded queue, so the request path never
+    waits on disk or console I/O. When the queue is full, records below WARNING are dropped and
+    WARNING and above replace the oldest queued record.
+
+    Unlike QueueHandler, records are not formatted here: the queue stays in process, so tracebacks
+    are formatted on the listener thread.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Arguments are merged now, as they may change before the listener formats the record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        dropped = record
+        if record.levelno >= logging.WARNING:
+            try:
+                dropped = self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                dropped = record
+
+        self.dropped += 1
+        log_records_dropped.labels(dropped.levelname).inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        if getattr(record, "traceback_suppressed", False):
+            entry["traceback_suppressed"] = True
+        if getattr(record, "suppressed_tracebacks", 0):
+            entry["suppressed_tracebacks"] = record.suppressed_tracebacks
+
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """The plain text format, with the correlation id and suppressed traceback counts"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(name)s - [%(correlation_id)s]  - %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.correlation_id = getattr(record, "correlation_id", None) or "-"
+        message = super().formatMessage(record)
+        if getattr(record, "traceback_suppressed", False):
+            message += " (traceback suppressed)"
+        if getattr(record, "suppressed_tracebacks", 0):
+            message += f" ({record.suppressed_tracebacks} tracebacks suppressed in the previous window)"
+        return message
@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from core.config import settings
+from core.ttl_cache import AsyncTTLCache, TTLCache
+from schemas.database import CollectionStatsResult, DatabaseStatsResult
+
+# Database and collection listings, keyed by connection string so every project on a cluster shares them
+metadata_cache = TTLCache(ttl=settings.METADATA_CACHE_TTL, maxsize=settings.METADATA_CACHE_MAXSIZE)
+async_metadata_cache = AsyncTTLCache(ttl=settings.METADATA_CACHE_TTL, maxsize=settings.METADATA_CACHE_MAXSIZE)
+
+# Server error code of a namespace that does not exist
+NAMESPACE_NOT_FOUND = 26
+
+
+def _databases_key(connection_string: str) -> tuple:
+    return ("databases", connection_string)
+
+
+def _collections_key(connection_string: str, db_name: str) -> tuple:
+    return ("collections", connection_string, db_name)
+
+
+def list_database_names(client, connection_string: str) -> list[str]:
+    """Returns the databases of a cluster, cached for METADATA_CACHE_TTL seconds"""
+    return metadata_cache.get_or_load(_databases_key(connection_string), client.list_database_names)
+
+
+async def alist_database_names(client, connection_string: str) -> list[str]:
+    """Async variant of `list_database_names`"""
+    return await async_metadata_cache.get_or_load(_databases_key(connection_string), client.list_database_names)
+
+
+def list_collection_names(client, connection_string: str, db_name: str) -> list[str]:
+    """Returns the collections of a database, cached for METADATA_CACHE_TTL seconds"""
+    return metadata_cache.get_or_load(
+        _collections_key(connection_string, db_name), client[db_name].list_collection_names
+    )
+
+
+async def alist_collection_names(client, connection_string: str, db_name: str) -> list[str]:
+    """Async variant of `list_collection_names`"""
+    return await async_metadata_cache.get_or_load(
+        _collections_key(connection_string, db_name), client[db_name].list_collection_names
+    )
+
+
+def collection_written(connection_string: str, db_name: str, collection_name: str):
+    """
+    Drops the listings a write may have changed. Writing to a collection that does not exist creates
+    it, and its database, so the listings are kept only if they already contain the collection.
+    """
+    # Sync and async routes share the cluster, so both caches are checked. The async cache is not
+    # thread safe but a single dict lookup or pop is atomic.
+    for cache in (metadata_cache, async_metadata_cache):
+        collections = cache.peek(_collections_key(connection_string, db_name))
+        if collections is None or collection_name not in collections:
+            cache.invalidate(_collections_key(connection_string, db_name))
+            cache.invalidate(_databases_key(connection_string))
+
+
+@contextmanager
+def creating(namespace: tuple[str, str, str]) -> Iterator[None]:
+    """Drops the listings a write may have changed once the block finished, even if it failed part way"""
+    try:
+        yield
+    finally:
+        collection_written(*namespace)
+
+
+def collection_stats_pipeline() -> list[dict[str, Any]]:
+    """Reads the storage statistics of a collection, one document per shard"""
+    return [{"$collStats": {"storageStats": {}}}]
+
+
+def collection_stats(namespace: str, results: list[dict[str, Any]]) -> CollectionStatsResult:
+    """Sums the $collStats storage statistics of every shard of a collection"""
+    stats = CollectionStatsResult(namespace=namespace)
+    for result in results:
+        storage = result.get("storageStats", {})
+        stats.count += int(storage.get("count", 0))
+        stats.size += int(storage.get("size", 0))
+        stats.storage_size += int(storage.get("storageSize", 0))
+        stats.total_index_size += int(storage.get("totalIndexSize", 0))
+        for name, size in storage.get("indexSizes", {}).items():
+            stats.index_sizes[name] = stats.index_sizes.get(name, 0) + int(size)
+        stats.nindexes = max(stats.nindexes, int(storage.get("nindexes", 0)))
+        stats.capped = stats.capped or bool(storage.get("capped", False))
+        if "shard" in result:
+            stats.shards.append(result["shard"])
+
+    stats.avg_obj_size = stats.size / stats.count if stats.count else None
+    return stats
+
+
+def database_stats(result: dict[str, Any]) -> DatabaseStatsResult:
+    """Converts the dbStats command result"""
+    return DatabaseStatsResult(
+        db=result.get("db", ""),
+        collections=int(result.get("collections", 0)),
+        views=int(result.get("views", 0)),
+        objects=int(result.get("objects", 0)),
+        avg_obj_size=result.get("avgObjSize") or None,
+        data_size=int(result.get("dataSize", 0)),
+        storage_size=int(result.get("storageSize", 0)),
+        indexes=int(result.get("indexes", 0)),
+        index_size=int(result.get("indexSize", 0)),
+        total_size=int(result.get("totalSize", result.get("storageSize", 0) + result.get("indexSize", 0))),
+    )
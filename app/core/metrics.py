@@ -0,0 +1,301 @@
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Header set on the requests the MCP layer makes against the app, so tool calls can be told apart from REST calls
+REQUEST_SOURCE_HEADER = "x-request-source"
+
+registry = CollectorRegistry()
+
+# ASGI scope of the request being served. The router stores the matched route in the scope,
+# so the operation id is available to the Mongo listeners and upstream timers once routing is done.
+_request_scope: ContextVar[Scope | None] = ContextVar("request_scope", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent serving a request, including the full streamed response body",
+    ["operation_id", "transport", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+http_request_size = Histogram(
+    "http_request_size_bytes",
+    "Size of request bodies",
+    ["operation_id", "transport"],
+    buckets=SIZE_BUCKETS,
+    registry=registry,
+)
+http_response_size = Histogram(
+    "http_response_size_bytes",
+    "Size of response bodies",
+    ["operation_id", "transport"],
+    buckets=SIZE_BUCKETS,
+    registry=registry,
+)
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds",
+    "Server round trip time of MongoDB commands",
+    ["operation_id", "command"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+mongo_command_errors = Counter(
+    "mongo_command_errors_total",
+    "MongoDB commands that failed",
+    ["operation_id", "command"],
+    registry=registry,
+)
+mongo_pool_checkout_wait = Histogram(
+    "mongo_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of a MongoDB pool",
+    ["operation_id"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+mongo_pool_checkout_failures = Counter(
+    "mongo_pool_checkout_failures_total",
+    "MongoDB connection checkouts that failed",
+    ["operation_id", "reason"],
+    registry=registry,
+)
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds",
+    "Time spent calling the platform integration and marketplace APIs",
+    ["operation_id", "upstream", "call", "outcome"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+query_cache_requests = Counter(
+    "query_cache_requests_total",
+    "query_documents calls served from the result cache (hit), from MongoDB (miss) or bypassing the cache (bypass)",
+    ["result"],
+    registry=registry,
+)
+query_cache_invalidations = Counter(
+    "query_cache_invalidations_total",
+    "Collections whose cached query results were invalidated, by a write through the service or a change stream",
+    ["source"],
+    registry=registry,
+)
+log_records_dropped = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the logging queue was full",
+    ["level"],
+    registry=registry,
+)
+admission_rejections = Counter(
+    "admission_rejections_total",
+    "Requests rejected with a 429 by admission control, by tier and exhausted budget",
+    ["tier", "reason"],
+    registry=registry,
+)
+admission_wait = Histogram(
+    "admission_wait_seconds",
+    "Time admitted requests queued for a concurrency slot of their tenant",
+    ["tier"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+change_stream_subscribers_dropped = Counter(
+    "change_stream_subscribers_dropped_total",
+    "Change stream subscribers dropped because their event buffer was full",
+    registry=registry,
+)
+write_coalescer_batch_size = Histogram(
+    "write_coalescer_batch_size",
+    "Writes sent together in one coalesced bulk write",
+    ["kind"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+    registry=registry,
+)
+write_coalescer_wait = Histogram(
+    "write_coalescer_wait_seconds",
+    "Time a coalesced write waited for its batch to be sent, the latency coalescing added",
+    ["kind"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+query_cache_size = Gauge(
+    "query_cache_bytes",
+    "Size of the cached query results",
+    registry=registry,
+)
+change_stream_subscribers = Gauge(
+    "change_stream_subscribers",
+    "Clients subscribed to a change stream, over SSE or long polling",
+    registry=registry,
+)
+
+
+def _operation_id(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "operation_id", None) or getattr(route, "name", None) or "unmatched"
+
+
+def current_operation_id() -> str:
+    """Returns the operation id of the request being served, or "none" outside of a request"""
+    scope = _request_scope.get()
+    return "none" if scope is None else _operation_id(scope)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and body sizes per operation id.
+
+    It is a plain ASGI middleware rather than BaseHTTPMiddleware so streamed
+    responses are passed through untouched and timed until their last chunk.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        transport = "mcp" if headers.get(REQUEST_SOURCE_HEADER.encode()) == b"mcp" else "http"
+        token = _request_scope.set(scope)
+
+        status = 500
+        request_size = 0
+        response_size = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            operation_id = _operation_id(scope)
+            http_request_duration.labels(operation_id, transport, scope["method"], str(status)).observe(
+                time.perf_counter() - started
+            )
+            http_request_size.labels(operation_id, transport).observe(request_size)
+            http_response_size.labels(operation_id, transport).observe(response_size)
+            _request_scope.reset(token)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records the latency and failures of every MongoDB command"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration.labels(current_operation_id(), event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        operation_id = current_operation_id()
+        mongo_command_duration.labels(operation_id, event.command_name).observe(event.duration_micros / 1e6)
+        mongo_command_errors.labels(operation_id, event.command_name).inc()
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Records how long requests wait for a pooled MongoDB connection"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        operation_id = current_operation_id()
+        mongo_pool_checkout_wait.labels(operation_id).observe(event.duration)
+        mongo_pool_checkout_failures.labels(operation_id, str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        mongo_pool_checkout_wait.labels(current_operation_id()).observe(event.duration)
+
+    def connection_checked_in(self, event):
+        pass
+
+
+# Shared by every MongoClient created by the client registries
+mongo_event_listeners = [CommandMetricsListener(), PoolMetricsListener()]
+
+
+def timed_upstream_call(upstream: str, call: str) -> Callable:
+    """
+    Decorator timing a sync or async function that calls an upstream HTTP API.
+
+    The outcome label is "success" when the function returns and "failure" when it raises.
+    """
+
+    def observe(started: float, outcome: str):
+        upstream_request_duration.labels(current_operation_id(), upstream, call, outcome).observe(
+            time.perf_counter() - started
+        )
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = "failure"
+                try:
+                    res = await fn(*args, **kwargs)
+                    outcome = "success"
+                    return res
+                finally:
+                    observe(started, outcome)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "failure"
+            try:
+                res = fn(*args, **kwargs)
+                outcome = "success"
+                return res
+            finally:
+                observe(started, outcome)
+
+        return wrapper
+
+    return decorator
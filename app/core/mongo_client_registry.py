@@ -0,0 +1,281 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Iterator
+
+from core.config import settings
+from core.metrics import mongo_event_listeners
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running connection pool counters for a single MongoClient"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "open_connections": self.connections_created - self.connections_closed,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+
+class _RegistryEntry:
+    def __init__(self, key: str, client: MongoClient, listener: PoolStatsListener):
+        self.key = key
+        self.client = client
+        self.listener = listener
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.leases = 0
+        self.hits = 0
+        self.retired = False
+
+
+class MongoClientRegistry:
+    """
+    Process-wide registry of MongoClient objects keyed by connection string.
+
+    MongoClient is thread safe and owns its own connection pool, so one client
+    per connection string is shared by every request. The registry is bounded:
+    the least recently used client is evicted when `max_clients` is reached and
+    clients unused for `idle_ttl` seconds are closed. A client that is evicted
+    while leased is closed once its last lease is released.
+    """
+
+    def __init__(
+        self,
+        max_clients: int = 32,
+        idle_ttl: float = 600,
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        max_idle_time_ms: int | None = None,
+    ):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self.pool_options = {"maxPoolSize": max_pool_size, "minPoolSize": min_pool_size}
+        if max_idle_time_ms:
+            self.pool_options["maxIdleTimeMS"] = max_idle_time_ms
+
+        self._lock = threading.Lock()
+        self._clients: OrderedDict[str, _RegistryEntry] = OrderedDict()
+        self.evictions = 0
+
+    def _create_entry(self, connection_string: str) -> _RegistryEntry:
+        listener = PoolStatsListener()
+        client = MongoClient(connection_string, event_listeners=[listener, *mongo_event_listeners], **self.pool_options)
+        return _RegistryEntry(connection_string, client, listener)
+
+    def _retire(self, entry: _RegistryEntry, to_close: list[_RegistryEntry]):
+        """Removes an entry from the registry, deferring the close while it is leased"""
+        self._clients.pop(entry.key, None)
+        entry.retired = True
+        self.evictions += 1
+        if entry.leases == 0:
+            to_close.append(entry)
+
+    def _evict_idle(self, now: float, to_close: list[_RegistryEntry]):
+        for entry in list(self._clients.values()):
+            if entry.leases == 0 and now - entry.last_used > self.idle_ttl:
+                self._retire(entry, to_close)
+
+    def _close_client(self, client: MongoClient):
+        client.close()
+
+    def _close(self, entries: list[_RegistryEntry]):
+        logger = getLogger(__name__ + ".close")
+        for entry in entries:
+            try:
+                self._close_client(entry.client)
+            except Exception as ex:
+                logger.exception(ex)
+
+    def acquire(self, connection_string: str) -> _RegistryEntry:
+        """Leases the shared client for a connection string, creating it on first use"""
+        if not connection_string:
+            raise ValueError("A connection string is required")
+
+        to_close: list[_RegistryEntry] = []
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now, to_close)
+
+            entry = self._clients.get(connection_string)
+            if entry is None:
+                # MongoClient connects lazily, so construction under the lock is cheap
+                entry = self._create_entry(connection_string)
+                self._clients[connection_string] = entry
+                while len(self._clients) > self.max_clients:
+                    oldest = next(iter(self._clients.values()))
+                    self._retire(oldest, to_close)
+            else:
+                entry.hits += 1
+                self._clients.move_to_end(connection_string)
+
+            entry.leases += 1
+            entry.last_used = now
+
+        self._close(to_close)
+        return entry
+
+    def release(self, entry: _RegistryEntry):
+        """Returns a lease taken with `acquire`"""
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            close_now = entry.retired and entry.leases == 0
+
+        if close_now:
+            self._close([entry])
+
+    @contextmanager
+    def lease(self, connection_string: str) -> Iterator[MongoClient]:
+        """Context manager yielding the shared client for a connection string"""
+        entry = self.acquire(connection_string)
+        try:
+            yield entry.client
+        finally:
+            self.release(entry)
+
+    def close_all(self):
+        """Closes every client. Called on application shutdown."""
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+            for entry in entries:
+                entry.retired = True
+
+        self._close(entries)
+
+    def stats(self) -> dict:
+        """Returns registry level counters and per pool statistics"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._clients.values())
+            evictions = self.evictions
+
+        pools = []
+        for index, entry in enumerate(entries):
+            servers = entry.client.topology_description.server_descriptions()
+            address = ", ".join(f"{host}:{port}" for host, port in servers)
+            pools.append(
+                {
+                    "pool": index,
+                    "servers": address,
+                    "leases": entry.leases,
+                    "hits": entry.hits,
+                    "age_seconds": round(now - entry.created_at, 3),
+                    "idle_seconds": round(now - entry.last_used, 3),
+                    **entry.listener.snapshot(),
+                }
+            )
+
+        return {
+            "clients": len(entries),
+            "max_clients": self.max_clients,
+            "evictions": evictions,
+            "pool_options": self.pool_options,
+            "pools": pools,
+        }
+
+
+class AsyncMongoClientRegistry(MongoClientRegistry):
+    """
+    Registry of AsyncMongoClient objects for the async routers.
+
+    Leasing is identical to MongoClientRegistry. Evicted clients are closed by a
+    task on the running event loop, and `aclose_all` waits for every close.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._closing: set[asyncio.Task] = set()
+
+    def _create_entry(self, connection_string: str) -> _RegistryEntry:
+        listener = PoolStatsListener()
+        client = AsyncMongoClient(
+            connection_string, event_listeners=[listener, *mongo_event_listeners], **self.pool_options
+        )
+        return _RegistryEntry(connection_string, client, listener)
+
+    def _close_client(self, client: AsyncMongoClient):
+        task = asyncio.get_running_loop().create_task(client.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def aclose_all(self):
+        """Closes every client and waits for pending closes. Called on application shutdown."""
+        self.close_all()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+
+mongo_clients = MongoClientRegistry(
+    max_clients=settings.MONGO_MAX_CLIENTS,
+    idle_ttl=settings.MONGO_CLIENT_IDLE_TTL,
+    max_pool_size=settings.MONGO_MAX_POOL_SIZE,
+    min_pool_size=settings.MONGO_MIN_POOL_SIZE,
+    max_idle_time_ms=settings.MONGO_MAX_IDLE_TIME_MS,
+)
+
+async_mongo_clients = AsyncMongoClientRegistry(
+    max_clients=settings.MONGO_MAX_CLIENTS,
+    idle_ttl=settings.MONGO_CLIENT_IDLE_TTL,
+    max_pool_size=settings.MONGO_MAX_POOL_SIZE,
+    min_pool_size=settings.MONGO_MIN_POOL_SIZE,
+    max_idle_time_ms=settings.MONGO_MAX_IDLE_TIME_MS,
+)
@@ -0,0 +1,205 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import re
+import uuid
+from typing import Any
+
+import bson
+from bson import Binary, Decimal128, MaxKey, MinKey, ObjectId, Regex, Timestamp, json_util
+from core.bson_json import JsonMode, dumps_document, dumps_documents
+from core.config import settings
+
+_SIGNATURE_SIZE = 16
+
+# The $type aliases of each BSON type bracket, in MongoDB's sort order. Comparison operators only match
+# values of the same bracket, so a keyset range also has to name the brackets sorting after it.
+# Missing fields sort as null. Arrays sort by one of their elements, so they have no bracket of their own.
+_TYPE_BRACKETS = [
+    ("minKey",),
+    ("null",),
+    ("number",),
+    ("string", "symbol"),
+    ("object",),
+    ("binData",),
+    ("objectId",),
+    ("bool",),
+    ("date",),
+    ("timestamp",),
+    ("regex",),
+    ("maxKey",),
+]
+_NULL_BRACKET = 1
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor is malformed, tampered with or used with a different query"""
+
+
+def _secret() -> bytes:
+    return (settings.PAGINATION_SECRET_KEY or settings.QUEST_AI_SECRET_KEY).encode()
+
+
+def query_digest(query: dict[str, Any]) -> bytes:
+    """Short digest binding a signed token to the query it was issued for"""
+    canonical = json_util.dumps(query, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).digest()[:8]
+
+
+def _query_digest(filter: dict[str, Any], sort: list[tuple[str, int]]) -> bytes:
+    """Binds a cursor to the filter and sort it was issued for"""
+    return query_digest({"filter": filter, "sort": sort})
+
+
+def sign_token(payload: bytes) -> str:
+    """Appends an HMAC signature to payload and returns it as a url safe string"""
+    signature = hmac.new(_secret(), payload, hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+    return base64.urlsafe_b64encode(payload + signature).rstrip(b"=").decode()
+
+
+def verify_token(token: str, error: type[ValueError] = InvalidCursorError) -> bytes:
+    """Checks the signature of a token created by sign_token and returns its payload"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except Exception:
+        raise error("Malformed token")
+
+    payload, signature = raw[:-_SIGNATURE_SIZE], raw[-_SIGNATURE_SIZE:]
+    expected = hmac.new(_secret(), payload, hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+    if len(payload) <= 8 or not hmac.compare_digest(signature, expected):
+        raise error("Invalid token signature")
+    return payload
+
+
+def _get_path(document: dict[str, Any], path: str) -> Any:
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _bracket(field: str, value: Any) -> int:
+    """Returns the position of the type bracket of a sort key value"""
+    if isinstance(value, MinKey):
+        return 0
+    if value is None:
+        return _NULL_BRACKET
+    # bool before numbers, as it is a subclass of int
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float, Decimal128)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (bytes, Binary, uuid.UUID)):
+        return 5
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, datetime.datetime):
+        return 8
+    if isinstance(value, Timestamp):
+        return 9
+    if isinstance(value, (Regex, re.Pattern)):
+        return 10
+    if isinstance(value, MaxKey):
+        return 11
+    if isinstance(value, list):
+        raise InvalidCursorError(f"Cannot paginate on {field}: it holds an array")
+    raise InvalidCursorError(f"Cannot paginate on {field}: it holds a {type(value).__name__}")
+
+
+def _after(field: str, direction: int, value: Any) -> list[Any]:
+    """Conditions on field matching the values that sort strictly after value, one per $or branch"""
+    bracket = _bracket(field, value)
+    following = range(bracket + 1, len(_TYPE_BRACKETS)) if direction == 1 else range(bracket)
+
+    conditions: list[Any] = []
+    # MinKey, null and MaxKey are the only values of their bracket
+    if bracket not in (0, _NULL_BRACKET, len(_TYPE_BRACKETS) - 1):
+        conditions.append({"$gt" if direction == 1 else "$lt": value})
+    types = [alias for position in following if position != _NULL_BRACKET for alias in _TYPE_BRACKETS[position]]
+    if types:
+        conditions.append({"$type": types})
+    if _NULL_BRACKET in following:
+        # Equality with null also matches documents missing the field, which sort as null
+        conditions.append(None)
+    return conditions
+
+
+def keyset_sort(sort: list[tuple[str, int]]) -> list[tuple[str, int]]:
+    """Appends _id as a tie breaker so the sort order is total"""
+    sort = [(field, direction) for field, direction in sort]
+    if not any(field == "_id" for field, _ in sort):
+        direction = sort[-1][1] if sort else 1
+        sort.append(("_id", direction))
+    return sort
+
+
+def encode_cursor(last_document: dict[str, Any], filter: dict[str, Any], sort: list[tuple[str, int]]) -> str:
+    """
+    Builds an opaque, signed cursor pointing just past last_document.
+
+    Args:
+        last_document: the last document of the current page
+        filter: the filter of the query, before the keyset range is applied
+        sort: the total sort order returned by keyset_sort
+
+    Returns:
+        The url safe cursor string
+    """
+    values = [_get_path(last_document, field) for field, _ in sort]
+    for (field, _), value in zip(sort, values):
+        # Raises InvalidCursorError for values a keyset range cannot be built for, e.g. arrays
+        _bracket(field, value)
+    return sign_token(_query_digest(filter, sort) + bson.encode({"v": values}))
+
+
+def decode_cursor(cursor: str, filter: dict[str, Any], sort: list[tuple[str, int]]) -> list[Any]:
+    """Verifies a cursor and returns the sort key values it points past"""
+    payload = verify_token(cursor)
+    if payload[:8] != _query_digest(filter, sort):
+        raise InvalidCursorError("Cursor was issued for a different filter or sort")
+
+    values = bson.decode(payload[8:])["v"]
+    if len(values) != len(sort):
+        raise InvalidCursorError("Malformed cursor")
+    return values
+
+
+def keyset_filter(filter: dict[str, Any], sort: list[tuple[str, int]], values: list[Any]) -> dict[str, Any]:
+    """
+    Restricts filter to documents strictly after the given sort key values.
+
+    For sort keys (a, b, _id) this is a OR (a = va AND b > vb) OR ..., which
+    MongoDB answers with index range seeks on a matching compound index. Each
+    range also includes the values of the type brackets sorting after it, e.g.
+    strings after numbers or any value after null, so fields holding mixed types
+    or nulls are paged through completely.
+    """
+    branches = []
+    for index, (field, direction) in enumerate(sort):
+        prefix = {prev_field: values[prev] for prev, (prev_field, _) in enumerate(sort[:index])}
+        for condition in _after(field, direction, values[index]):
+            branches.append({**prefix, field: condition})
+
+    # Nothing sorts after a trailing MaxKey
+    after = {"$or": branches} if branches else {"_id": {"$in": []}}
+    return {"$and": [filter, after]} if filter else after
+
+
+def dumps_page(items: list[Any], next_cursor: str | None, mode: JsonMode) -> bytes:
+    """Encodes a Page of documents without revalidating the items"""
+    return (
+        b'{"items":'
+        + dumps_documents(items, mode)
+        + b',"item_count":'
+        + str(len(items)).encode()
+        + b',"next_cursor":'
+        + (dumps_document(next_cursor, "string") if next_cursor else b"null")
+        + b"}"
+    )
@@ -1,3 +1,4 @@
+import hashlib
 from enum import StrEnum
 from logging import getLogger
 from typing import Literal
@@ -5,24 +6,104 @@ from typing import Literal
 import httpx
 from core.authentication.auth_middleware import get_current_token
 from core.config import settings
+from core.metrics import timed_upstream_call
+from core.ttl_cache import AsyncTTLCache, TTLCache
 from fastapi import Depends
 from schemas.token import TokenData
 
+# Shared keep-alive client so platform calls reuse TCP/TLS connections
+http_client = httpx.Client(
+    timeout=settings.PLATFORM_HTTP_TIMEOUT,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+async_http_client = httpx.AsyncClient(
+    timeout=settings.PLATFORM_HTTP_TIMEOUT,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+)
+
+mongodb_details_cache = TTLCache(
+    ttl=settings.PLATFORM_CACHE_TTL,
+    maxsize=settings.PLATFORM_CACHE_MAXSIZE,
+    stale_ttl=settings.PLATFORM_CACHE_STALE_TTL,
+)
+graph_token_cache = TTLCache(ttl=settings.PLATFORM_CACHE_TTL, maxsize=settings.PLATFORM_CACHE_MAXSIZE)
+power_automate_flow_cache = TTLCache(
+    ttl=settings.PLATFORM_CACHE_TTL,
+    maxsize=settings.PLATFORM_CACHE_MAXSIZE,
+    stale_ttl=settings.PLATFORM_CACHE_STALE_TTL,
+)
+
+async_mongodb_details_cache = AsyncTTLCache(
+    ttl=settings.PLATFORM_CACHE_TTL,
+    maxsize=settings.PLATFORM_CACHE_MAXSIZE,
+    stale_ttl=settings.PLATFORM_CACHE_STALE_TTL,
+)
+async_graph_token_cache = AsyncTTLCache(ttl=settings.PLATFORM_CACHE_TTL, maxsize=settings.PLATFORM_CACHE_MAXSIZE)
+async_power_automate_flow_cache = AsyncTTLCache(
+    ttl=settings.PLATFORM_CACHE_TTL,
+    maxsize=settings.PLATFORM_CACHE_MAXSIZE,
+    stale_ttl=settings.PLATFORM_CACHE_STALE_TTL,
+)
+
+
+def _graph_token_ttl(res: dict) -> float:
+    """Expires a cached graph token a minute before the token itself expires"""
+    expires_in = res.get("expires_in")
+    if expires_in is None:
+        return settings.PLATFORM_CACHE_TTL
+    return float(expires_in) - 60
+
+
+async def close_http_clients():
+    """Closes the shared platform http clients. Called on application shutdown."""
+    http_client.close()
+    await async_http_client.aclose()
+
+
+def _cache_scope(auth_token: str, user_id: str | None) -> str:
+    """Cached responses are scoped to the user, falling back to the token itself"""
+    return user_id or hashlib.sha256(auth_token.encode()).hexdigest()
+
 
 class PlatformIntegrationClient:
-    def __init__(self, auth_token: str):
+    def __init__(self, auth_token: str, user_id: str | None = None):
         """Creates a PlatformIntegrationClient object"""
         self.auth_token = auth_token
+        self.cache_scope = _cache_scope(auth_token, user_id)
 
     def get_power_automate_flow(self, flow_name_or_objId: str) -> dict[str, str]:
         """Get the details for a user flow"""
+        return power_automate_flow_cache.get_or_load(
+            (self.cache_scope, flow_name_or_objId),
+            lambda: self._fetch_power_automate_flow(flow_name_or_objId),
+        )
+
+    def get_graph_token(self, scope: Literal["graph:mail", "graph:people"]) -> str:
+        """Gets a microsoft graph token for the selected scope set"""
+        res = graph_token_cache.get_or_load(
+            (self.cache_scope, scope),
+            lambda: self._fetch_graph_token(scope),
+            ttl_for=_graph_token_ttl,
+        )
+        return res.get("access_token")
+
+    def get_mongodb_details(self, mongo_project: str) -> dict[str, str]:
+        """Gets the details for a mongodb database"""
+        return mongodb_details_cache.get_or_load(
+            (self.cache_scope, mongo_project),
+            lambda: self._fetch_mongodb_details(mongo_project),
+        )
+
+    @timed_upstream_call("platform", "power_automate_flow")
+    def _fetch_power_automate_flow(self, flow_name_or_objId: str) -> dict[str, str]:
+        """Fetches the details for a user flow from the platform"""
         logger = getLogger(__name__ + ".get_power_automate_flow")
 
         try:
             headers = {"Authorization": f"Bearer {self.auth_token}"}
             url = f"{settings.PLATFRORM_INT_URL}/api/v1/power_automate/flows/{flow_name_or_objId}"
 
-            response = httpx.get(url=url, headers=headers, timeout=60)
+            response = http_client.get(url=url, headers=headers)
 
             if response.is_success:
                 res = response.json()
@@ -34,8 +115,9 @@ class PlatformIntegrationClient:
             logger.exception(ex)
             raise ex
 
-    def get_graph_token(self, scope: Literal["graph:mail", "graph:people"]) -> str:
-        """Gets a microsoft graph token for the selected scope set"""
+    @timed_upstream_call("platform", "graph_token")
+    def _fetch_graph_token(self, scope: Literal["graph:mail", "graph:people"]) -> dict:
+        """Fetches a microsoft graph token response for the selected scope set"""
         logger = getLogger(__name__ + ".get_graph_token")
 
         try:
@@ -43,13 +125,11 @@ class PlatformIntegrationClient:
             url = f"{settings.PLATFRORM_INT_URL}/api/v1/ms-graph/token"
             params = {"scope": scope}
 
-            response = httpx.get(url=url, headers=headers, timeout=60, params=params)
+            response = http_client.get(url=url, headers=headers, params=params)
 
             if response.is_success:
                 res = response.json()
-
-                access_token = res.get("access_token")
-                return access_token
+                return res
             else:
                 logger.error(f"({response.status_code}) {response.content}")
                 raise Exception(f"Unable to get graph token: {response.content}")
@@ -57,15 +137,110 @@ class PlatformIntegrationClient:
             logger.exception(ex)
             raise ex
 
-    def get_mongodb_details(self, mongo_project: str) -> dict[str, str]:
+    @timed_upstream_call("platform", "mongodb_details")
+    def _fetch_mongodb_details(self, mongo_project: str) -> dict[str, str]:
+        """Fetches the details for a mongodb database from the platform"""
+        logger = getLogger(__name__ + ".get_mongodb_details")
+
+        try:
+            headers = {"Authorization": f"Bearer {self.auth_token}"}
+            url = f"{settings.PLATFRORM_INT_URL}/api/v1/mongodb_connections/{mongo_project}"
+
+            response = http_client.get(url=url, headers=headers)
+
+            if response.is_success:
+                res = response.json()
+                return res
+            else:
+                logger.error(f"({response.status_code}) {response.content}")
+                raise Exception(f"Unable to get mongodb details: {response.content}")
+        except Exception as ex:
+            logger.exception(ex)
+            raise ex
+
+
+class AsyncPlatformIntegrationClient:
+    def __init__(self, auth_token: str, user_id: str | None = None):
+        """Creates an AsyncPlatformIntegrationClient object"""
+        self.auth_token = auth_token
+        self.cache_scope = _cache_scope(auth_token, user_id)
+
+    async def get_power_automate_flow(self, flow_name_or_objId: str) -> dict[str, str]:
+        """Get the details for a user flow"""
+        return await async_power_automate_flow_cache.get_or_load(
+            (self.cache_scope, flow_name_or_objId),
+            lambda: self._fetch_power_automate_flow(flow_name_or_objId),
+        )
+
+    async def get_graph_token(self, scope: Literal["graph:mail", "graph:people"]) -> str:
+        """Gets a microsoft graph token for the selected scope set"""
+        res = await async_graph_token_cache.get_or_load(
+            (self.cache_scope, scope),
+            lambda: self._fetch_graph_token(scope),
+            ttl_for=_graph_token_ttl,
+        )
+        return res.get("access_token")
+
+    async def get_mongodb_details(self, mongo_project: str) -> dict[str, str]:
         """Gets the details for a mongodb database"""
+        return await async_mongodb_details_cache.get_or_load(
+            (self.cache_scope, mongo_project),
+            lambda: self._fetch_mongodb_details(mongo_project),
+        )
+
+    @timed_upstream_call("platform", "power_automate_flow")
+    async def _fetch_power_automate_flow(self, flow_name_or_objId: str) -> dict[str, str]:
+        """Fetches the details for a user flow from the platform"""
+        logger = getLogger(__name__ + ".get_power_automate_flow")
+
+        try:
+            headers = {"Authorization": f"Bearer {self.auth_token}"}
+            url = f"{settings.PLATFRORM_INT_URL}/api/v1/power_automate/flows/{flow_name_or_objId}"
+
+            response = await async_http_client.get(url=url, headers=headers)
+
+            if response.is_success:
+                res = response.json()
+                return res
+            else:
+                logger.error(f"({response.status_code}) {response.content}")
+                raise Exception("Unable to get flow details")
+        except Exception as ex:
+            logger.exception(ex)
+            raise ex
+
+    @timed_upstream_call("platform", "graph_token")
+    async def _fetch_graph_token(self, scope: Literal["graph:mail", "graph:people"]) -> dict:
+        """Fetches a microsoft graph token response for the selected scope set"""
+        logger = getLogger(__name__ + ".get_graph_token")
+
+        try:
+            headers = {"Authorization": f"Bearer {self.auth_token}"}
+            url = f"{settings.PLATFRORM_INT_URL}/api/v1/ms-graph/token"
+            params = {"scope": scope}
+
+            response = await async_http_client.get(url=url, headers=headers, params=params)
+
+            if response.is_success:
+                res = response.json()
+                return res
+            else:
+                logger.error(f"({response.status_code}) {response.content}")
+                raise Exception(f"Unable to get graph token: {response.content}")
+        except Exception as ex:
+            logger.exception(ex)
+            raise ex
+
+    @timed_upstream_call("platform", "mongodb_details")
+    async def _fetch_mongodb_details(self, mongo_project: str) -> dict[str, str]:
+        """Fetches the details for a mongodb database from the platform"""
         logger = getLogger(__name__ + ".get_mongodb_details")
 
         try:
             headers = {"Authorization": f"Bearer {self.auth_token}"}
             url = f"{settings.PLATFRORM_INT_URL}/api/v1/mongodb_connections/{mongo_project}"
 
-            response = httpx.get(url=url, headers=headers, timeout=60)
+            response = await async_http_client.get(url=url, headers=headers)
 
             if response.is_success:
                 res = response.json()
@@ -83,6 +258,16 @@ def get_platform_client(
 ) -> PlatformIntegrationClient:
     """Gets platform integration client for user"""
 
-    client = PlatformIntegrationClient(current_token.access_token)
+    client = PlatformIntegrationClient(current_token.access_token, user_id=current_token.id)
+
+    return client
+
+
+def get_async_platform_client(
+    current_token: TokenData = Depends(get_current_token),
+) -> AsyncPlatformIntegrationClient:
+    """Gets async platform integration client for user"""
+
+    client = AsyncPlatformIntegrationClient(current_token.access_token, user_id=current_token.id)
 
     return client
@@ -0,0 +1,281 @@
+import fnmatch
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Any, Iterator
+
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from core.config import settings
+from core.metrics import query_cache_invalidations, query_cache_requests, query_cache_size
+from core.mongo_client_registry import mongo_clients
+from schemas.database import FindQueryInput
+
+# The connection string, database and collection a cached result was read from
+Namespace = tuple[str, str, str]
+
+# Seconds before a change stream that failed, e.g. on a standalone server, is opened again
+WATCH_RETRY_SECONDS = 300
+
+
+def _top_level_sorted(document: dict[str, Any] | None) -> dict[str, Any] | None:
+    # Only the top level is reordered: the field order of embedded documents matters for exact matches
+    return None if document is None else dict(sorted(document.items()))
+
+
+def canonical_query(filter: dict[str, Any], query: FindQueryInput) -> str:
+    """Returns the find options that determine its result, as canonical Extended JSON"""
+    return json_util.dumps(
+        {
+            "filter": _top_level_sorted(filter),
+            "projection": _top_level_sorted(query.projection),
+            "sort": query.sort,
+            "skip": query.skip,
+            "limit": query.limit,
+            "hint": query.hint,
+            "collation": query.collation,
+            "read_preference": query.read_preference,
+            "json_mode": query.json_mode,
+        },
+        json_options=CANONICAL_JSON_OPTIONS,
+    )
+
+
+class _CachedResult:
+    __slots__ = ("content", "expires_at")
+
+    def __init__(self, content: bytes, expires_at: float):
+        self.content = content
+        self.expires_at = expires_at
+
+
+class QueryResultCache:
+    """
+    Thread safe read-through cache of encoded query_documents responses, for the collections
+    matching the configured patterns. Bounded in bytes, evicting the least recently used first.
+
+    Every namespace has a generation that invalidation bumps. A result is only stored if the
+    generation did not change while it was read, so a read racing a write is never cached.
+    """
+
+    def __init__(
+        self,
+        collections: str,
+        ttl: float,
+        max_bytes: int,
+        max_entry_bytes: int,
+        watch: bool = False,
+        max_watchers: int = 64,
+    ):
+        self.patterns = [pattern.strip() for pattern in collections.split(",") if pattern.strip()]
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.watch = watch
+        self.max_watchers = max_watchers
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[Namespace, bytes], _CachedResult] = OrderedDict()
+        self._namespace_keys: dict[Namespace, set[tuple[Namespace, bytes]]] = {}
+        self._generations: dict[Namespace, int] = {}
+        self._watchers: dict[Namespace, _ChangeStreamWatcher] = {}
+        self._watch_retry_at: dict[Namespace, float] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.invalidations = 0
+
+    def enabled_for(self, db_name: str, collection_name: str) -> bool:
+        name = f"{db_name}.{collection_name}"
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)
+
+    def key(
+        self, namespace: Namespace, filter: dict[str, Any], query: FindQueryInput, bypass: bool = False
+    ) -> tuple[Namespace, bytes] | None:
+        """Returns the cache key of a find, or None if its collection is not cached or the cache is bypassed"""
+        if not self.enabled_for(namespace[1], namespace[2]):
+            return None
+        if bypass:
+            with self._lock:
+                self.bypasses += 1
+            query_cache_requests.labels("bypass").inc()
+            return None
+
+        return namespace, hashlib.sha256(canonical_query(filter, query).encode()).digest()
+
+    def get(self, key: tuple[Namespace, bytes]) -> tuple[bytes | None, int]:
+        """Returns the cached result, if any, and the generation to store a freshly read result with"""
+        namespace = key[0]
+        with self._lock:
+            generation = self._generations.get(namespace, 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        query_cache_requests.labels("miss" if entry is None else "hit").inc()
+        return (None if entry is None else entry.content), generation
+
+    def put(self, key: tuple[Namespace, bytes], content: bytes, generation: int):
+        """Stores a result read at `generation`, unless the namespace was invalidated since"""
+        if len(content) > self.max_entry_bytes:
+            return
+
+        namespace = key[0]
+        with self._lock:
+            if self._generations.get(namespace, 0) != generation:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CachedResult(content, time.monotonic() + self.ttl)
+            self._namespace_keys.setdefault(namespace, set()).add(key)
+            self.bytes += len(content)
+
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+            if self.watch:
+                self._start_watcher(namespace)
+
+        query_cache_size.set(self.bytes)
+
+    def invalidate(self, namespace: Namespace, source: str = "write"):
+        """Drops the cached results of a collection and rejects results still being read from it"""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in list(self._namespace_keys.get(namespace, ())):
+                self._remove(key)
+            self.invalidations += 1
+
+        query_cache_invalidations.labels(source).inc()
+        query_cache_size.set(self.bytes)
+
+    @contextmanager
+    def invalidating(self, namespace: Namespace) -> Iterator[None]:
+        """Invalidates a collection once the writes in the block finished, even if they failed part way"""
+        try:
+            yield
+        finally:
+            if self.enabled_for(namespace[1], namespace[2]):
+                self.invalidate(namespace)
+
+    def _remove(self, key: tuple[Namespace, bytes]):
+        # Called with the lock held
+        entry = self._entries.pop(key)
+        self.bytes -= len(entry.content)
+
+        keys = self._namespace_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._namespace_keys[key[0]]
+
+    def _start_watcher(self, namespace: Namespace):
+        # Called with the lock held
+        if namespace in self._watchers or len(self._watchers) >= self.max_watchers:
+            return
+        if self._watch_retry_at.get(namespace, 0) > time.monotonic():
+            return
+
+        self._watch_retry_at.pop(namespace, None)
+        watcher = self._watchers[namespace] = _ChangeStreamWatcher(self, namespace)
+        watcher.start()
+
+    def _release_watcher(self, namespace: Namespace, force: bool = False, retry_after: float = 0) -> bool:
+        """
+        Called by a watcher that is idle or stopped. An idle watcher only stops once its collection
+        has no cached results left. Returns whether the watcher should stop.
+        """
+        with self._lock:
+            if not force and namespace in self._namespace_keys:
+                return False
+
+            self._watchers.pop(namespace, None)
+            if retry_after:
+                self._watch_retry_at[namespace] = time.monotonic() + retry_after
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "collections": self.patterns,
+                "ttl": self.ttl,
+                "max_bytes": self.max_bytes,
+                "bytes": self.bytes,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "bypasses": self.bypasses,
+                "invalidations": self.invalidations,
+                "watchers": len(self._watchers),
+            }
+
+    def close(self):
+        """Stops the change stream watchers. Called on application shutdown."""
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+
+        for watcher in watchers:
+            watcher.stop_event.set()
+        for watcher in watchers:
+            watcher.join(timeout=5)
+
+
+class _ChangeStreamWatcher(threading.Thread):
+    """
+    Invalidates a collection on every change, including writes made outside the service.
+    Runs while the collection has cached results and holds a lease on its MongoDB client meanwhile.
+    """
+
+    def __init__(self, cache: QueryResultCache, namespace: Namespace):
+        super().__init__(name=f"query-cache-watch-{namespace[1]}.{namespace[2]}", daemon=True)
+        self.cache = cache
+        self.namespace = namespace
+        self.stop_event = threading.Event()
+
+    def run(self):
+        logger = getLogger(__name__ + ".watch")
+        connection_string, db_name, collection_name = self.namespace
+        retry_after = 0
+        try:
+            with mongo_clients.lease(connection_string) as client:
+                with client[db_name][collection_name].watch(max_await_time_ms=1000) as stream:
+                    # Results cached before the stream opened could have missed a change
+                    self.cache.invalidate(self.namespace, "change_stream")
+
+                    while not self.stop_event.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self.cache.invalidate(self.namespace, "change_stream")
+                        elif self.cache._release_watcher(self.namespace):
+                            return
+        except Exception as ex:
+            logger.warning(f"Change stream on {db_name}.{collection_name} stopped, results expire by TTL only: {ex}")
+            retry_after = WATCH_RETRY_SECONDS
+
+        # The stream ended, e.g. because the collection was dropped, so changes can no longer be seen
+        self.cache._release_watcher(self.namespace, force=True, retry_after=retry_after)
+        self.cache.invalidate(self.namespace, "change_stream")
+
+
+query_cache = QueryResultCache(
+    collections=settings.QUERY_CACHE_COLLECTIONS,
+    ttl=settings.QUERY_CACHE_TTL,
+    max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.QUERY_CACHE_MAX_ENTRY_BYTES,
+    watch=settings.QUERY_CACHE_CHANGE_STREAMS,
+    max_watchers=settings.QUERY_CACHE_MAX_WATCHERS,
+)
@@ -0,0 +1,276 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _CacheEntry:
+    __slots__ = ("value", "expires_at", "stale_until")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """
+    Thread safe TTL + LRU cache with single-flight loading.
+
+    Concurrent misses for the same key share one call to the loader. Once an
+    entry is older than `ttl` it is still served for up to `stale_ttl` more
+    seconds while a single background refresh replaces it. Loader failures are
+    never cached.
+    """
+
+    def __init__(self, ttl: float = 300, maxsize: int = 1024, stale_ttl: float = 0, refresh_workers: int = 2):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+        self._inflight: dict[Hashable, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="ttl-cache-refresh")
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def _store(self, key: Hashable, value: Any, ttl: float):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = _CacheEntry(value, now + ttl, now + ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], ttl_for: Callable[[Any], float] | None, future: Future):
+        try:
+            value = loader()
+            ttl = self.ttl if ttl_for is None else min(self.ttl, ttl_for(value))
+            if ttl > 0:
+                self._store(key, value, ttl)
+            future.set_result(value)
+        except BaseException as ex:
+            future.set_exception(ex)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        ttl_for: Callable[[Any], float] | None,
+        future: Future,
+    ):
+        self._load(key, loader, ttl_for, future)
+        if future.exception() is not None:
+            logger = getLogger(__name__ + ".refresh")
+            logger.warning(f"Background refresh failed, serving stale value: {future.exception()}")
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        ttl_for: Callable[[Any], float] | None = None,
+    ) -> Any:
+        """
+        Returns the cached value for key, calling loader on a miss.
+
+        Args:
+            key: the cache key
+            loader: zero argument callable producing the value
+            ttl_for: optional callable returning a ttl (capped at the cache ttl) for a loaded value
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+            if entry is not None and now < entry.stale_until:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    future = Future()
+                    self._inflight[key] = future
+                    self._executor.submit(copy_context().run, self._refresh, key, loader, ttl_for, future)
+                return entry.value
+
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if leader:
+            self._load(key, loader, ttl_for, future)
+
+        return future.result()
+
+    def peek(self, key: Hashable) -> Any:
+        """Returns the cached value for key, stale or not, or None. Does not load or count a hit."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry.value
+
+    def invalidate(self, key: Hashable):
+        """Drops a single key from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drops every entry from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "inflight": len(self._inflight),
+            }
+
+
+class AsyncTTLCache:
+    """
+    Asyncio counterpart of TTLCache for use from coroutines.
+
+    Concurrent misses for the same key await one shared loader task, and stale
+    entries are refreshed by a background task. With `refresh_ahead` set, entries
+    that are within that many seconds of expiry are also refreshed in the
+    background, so hot keys never expire. Loader failures are never cached.
+    """
+
+    def __init__(self, ttl: float = 300, maxsize: int = 1024, stale_ttl: float = 0, refresh_ahead: float = 0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.refresh_ahead = refresh_ahead
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+
+    def _store(self, key: Hashable, value: Any, ttl: float):
+        now = time.monotonic()
+        self._entries[key] = _CacheEntry(value, now + ttl, now + ttl + self.stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_for: Callable[[Any], float] | None,
+    ) -> Any:
+        try:
+            value = await loader()
+            ttl = self.ttl if ttl_for is None else min(self.ttl, ttl_for(value))
+            if ttl > 0:
+                self._store(key, value, ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _log_refresh_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger = getLogger(__name__ + ".refresh")
+            logger.warning(f"Background refresh failed, serving stale value: {task.exception()}")
+
+    def _refresh_in_background(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_for: Callable[[Any], float] | None,
+    ):
+        if key in self._inflight:
+            return
+        self.refreshes += 1
+        task = asyncio.create_task(self._load(key, loader, ttl_for))
+        task.add_done_callback(self._log_refresh_failure)
+        self._inflight[key] = task
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_for: Callable[[Any], float] | None = None,
+    ) -> Any:
+        """
+        Returns the cached value for key, awaiting loader on a miss.
+
+        Args:
+            key: the cache key
+            loader: zero argument coroutine function producing the value
+            ttl_for: optional callable returning a ttl (capped at the cache ttl) for a loaded value
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now < entry.expires_at:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry.expires_at - now < self.refresh_ahead:
+                self._refresh_in_background(key, loader, ttl_for)
+            return entry.value
+
+        if entry is not None and now < entry.stale_until:
+            self.stale_hits += 1
+            self._refresh_in_background(key, loader, ttl_for)
+            return entry.value
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader, ttl_for))
+            self._inflight[key] = task
+
+        # Shield the shared load so one cancelled caller does not fail the others
+        return await asyncio.shield(task)
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        """Stores a value directly, e.g. a short lived fallback after a failed load"""
+        self._store(key, value, ttl)
+
+    def peek(self, key: Hashable) -> Any:
+        """Returns the cached value for key, stale or not, or None. Does not load or count a hit."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry.value
+
+    def invalidate(self, key: Hashable):
+        """Drops a single key from the cache"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drops every entry from the cache"""
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache counters"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "inflight": len(self._inflight),
+        }
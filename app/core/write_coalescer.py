@@ -0,0 +1,324 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from bson import ObjectId
+from core.config import settings
+from core.metrics import write_coalescer_batch_size, write_coalescer_wait
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, ClientBulkWriteException, WriteConcernError, WriteError
+from pymongo.results import UpdateResult
+
+# The connection string, database and collection written to
+Namespace = tuple[str, str, str]
+
+# The kind of write, insert or update, and its namespace
+BatchKey = tuple[str, str, str, str]
+
+# Wire version of MongoDB 8.0, the first server with the client level bulkWrite command
+CLIENT_BULK_WRITE_WIRE_VERSION = 25
+
+
+class _Write:
+    """One caller's write, waiting in a batch for its result or error"""
+
+    __slots__ = ("model", "result", "error", "queued_at")
+
+    def __init__(self, model, result: Any = None):
+        self.model = model
+        self.result = result
+        self.error: Exception | None = None
+        self.queued_at = time.perf_counter()
+
+    def outcome(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _Batch:
+    __slots__ = ("writes", "full", "done")
+
+    def __init__(self, full, done):
+        self.writes: list[_Write] = []
+        # Set once the batch takes no more writes, and once every write has its outcome
+        self.full = full
+        self.done = done
+
+
+def _write_error(error: dict[str, Any]) -> WriteError:
+    return WriteError(error.get("errmsg", "Write error"), error.get("code"), error)
+
+
+def _write_concern_error(errors: list[dict[str, Any]]) -> WriteConcernError | None:
+    # Applies to every write of the batch: they were applied, but not acknowledged by the requested members
+    if not errors:
+        return None
+    return WriteConcernError(errors[0].get("errmsg", "Write concern error"), errors[0].get("code"), errors[0])
+
+
+def _settle_inserts(writes: list[_Write], error: Exception | None):
+    """Hands each insert of a batch its own error. The inserted ids were assigned before sending."""
+    if error is None:
+        return
+
+    write_errors: dict[int, WriteError] = {}
+    concern_error = None
+    if isinstance(error, BulkWriteError):
+        write_errors = {e["index"]: _write_error(e) for e in error.details.get("writeErrors", [])}
+        concern_error = _write_concern_error(error.details.get("writeConcernErrors", []))
+        error = None
+
+    for index, write in enumerate(writes):
+        write.error = error or write_errors.get(index) or concern_error
+
+
+def _settle_updates(writes: list[_Write], result, error: Exception | None):
+    """Hands each update of a batch its own UpdateResult or error"""
+    write_errors: dict[int, WriteError] = {}
+    concern_error = None
+    if isinstance(error, ClientBulkWriteException) and error.error is None:
+        write_errors = {e["idx"]: _write_error(e) for e in error.write_errors}
+        concern_error = _write_concern_error(error.write_concern_errors)
+        result = error.partial_result
+        error = None
+
+    updates = {} if result is None else result.update_results
+    for index, write in enumerate(writes):
+        write.error = error or write_errors.get(index) or concern_error
+        if write.error is None:
+            if index in updates:
+                write.result = updates[index]
+            else:
+                write.error = RuntimeError("The bulk write returned no result for the update")
+
+
+class _Coalescer:
+    """
+    Group commit for small concurrent writes. Single document inserts, and updates, sent to the
+    same collection within `window_ms` of each other are written as one unordered bulk write of at
+    most `max_batch` writes. The first write of a batch waits for the others and sends it, then
+    every caller gets its own result or error.
+
+    Concurrent requests have no order between them, so writing them unordered loses nothing. The
+    bulk write uses the collection's write concern, and collections with an unacknowledged write
+    concern are not coalesced. Updates need the per-operation results of the client level bulk
+    write of MongoDB 8.0, so on older servers they are sent one by one as before.
+    """
+
+    def __init__(self, enabled: bool, window_ms: float, max_batch: int):
+        self.enabled = enabled
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._open: dict[BatchKey, _Batch] = {}
+        self.writes = 0
+        self.batches = 0
+        self.direct = 0
+
+    def _coalesces(self, collection) -> bool:
+        return self.enabled and collection.write_concern.acknowledged
+
+    def _coalesces_updates(self, client, collection) -> bool:
+        if not self._coalesces(collection):
+            return False
+        return (client.topology_description.common_wire_version or 0) >= CLIENT_BULK_WRITE_WIRE_VERSION
+
+    def _join(self, key: BatchKey, write: _Write, new_batch: Callable[[], _Batch]) -> tuple[_Batch, bool]:
+        batch = self._open.get(key)
+        leader = batch is None
+        if leader:
+            batch = self._open[key] = new_batch()
+        batch.writes.append(write)
+        if len(batch.writes) >= self.max_batch:
+            self._close(key, batch)
+        return batch, leader
+
+    def _close(self, key: BatchKey, batch: _Batch):
+        if self._open.get(key) is batch:
+            del self._open[key]
+        batch.full.set()
+
+    def _sending(self, kind: str, writes: list[_Write]):
+        sent_at = time.perf_counter()
+        self.writes += len(writes)
+        self.batches += 1
+        write_coalescer_batch_size.labels(kind).observe(len(writes))
+        for write in writes:
+            write_coalescer_wait.labels(kind).observe(sent_at - write.queued_at)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "open_batches": len(self._open),
+            "batches": self.batches,
+            "coalesced_writes": self.writes,
+            "average_batch_size": self.writes / self.batches if self.batches else None,
+            "direct_writes": self.direct,
+        }
+
+
+class WriteCoalescer(_Coalescer):
+    """Thread safe coalescer for the sync routes, whose writes run on the threadpool"""
+
+    def __init__(self, enabled: bool, window_ms: float, max_batch: int):
+        super().__init__(enabled, window_ms, max_batch)
+        self._lock = threading.Lock()
+
+    def _submit(self, kind: str, namespace: Namespace, write: _Write, execute: Callable[[list[_Write]], None]) -> Any:
+        key = (kind, *namespace)
+        with self._lock:
+            batch, leader = self._join(key, write, lambda: _Batch(threading.Event(), threading.Event()))
+
+        if not leader:
+            batch.done.wait()
+            return write.outcome()
+
+        batch.full.wait(self.window)
+        with self._lock:
+            self._close(key, batch)
+            self._sending(kind, batch.writes)
+        try:
+            execute(batch.writes)
+        finally:
+            batch.done.set()
+        return write.outcome()
+
+    def insert_many(self, client, namespace: Namespace, documents: list[dict[str, Any]]) -> list[Any]:
+        """Inserts documents, coalescing single document inserts. Returns the inserted ids."""
+        collection = client[namespace[1]][namespace[2]]
+        if len(documents) != 1 or not self._coalesces(collection):
+            with self._lock:
+                self.direct += 1
+            return collection.insert_many(documents=documents).inserted_ids
+
+        def execute(writes: list[_Write]):
+            try:
+                collection.bulk_write([write.model for write in writes], ordered=False)
+            except Exception as ex:
+                _settle_inserts(writes, ex)
+
+        # Assigned here, as insert_many does, so the id is known whichever batch the document is sent in
+        document = documents[0]
+        document.setdefault("_id", ObjectId())
+        return [self._submit("insert", namespace, _Write(InsertOne(document), document["_id"]), execute)]
+
+    def update(
+        self, client, namespace: Namespace, filter: dict[str, Any], update: dict[str, Any], multi: bool, upsert: bool
+    ) -> UpdateResult:
+        """Updates one or, with `multi`, every matching document, coalescing on servers that support it"""
+        collection = client[namespace[1]][namespace[2]]
+        if not self._coalesces_updates(client, collection):
+            with self._lock:
+                self.direct += 1
+            if multi:
+                return collection.update_many(filter=filter, update=update, upsert=upsert)
+            return collection.update_one(filter=filter, update=update, upsert=upsert)
+
+        def execute(writes: list[_Write]):
+            try:
+                result = client.bulk_write(
+                    [write.model for write in writes],
+                    ordered=False,
+                    verbose_results=True,
+                    write_concern=collection.write_concern,
+                )
+            except Exception as ex:
+                _settle_updates(writes, None, ex)
+            else:
+                _settle_updates(writes, result, None)
+
+        model = (UpdateMany if multi else UpdateOne)(filter, update, upsert=upsert, namespace=collection.full_name)
+        return self._submit("update", namespace, _Write(model), execute)
+
+
+class AsyncWriteCoalescer(_Coalescer):
+    """Async variant of `WriteCoalescer` for AsyncMongoClient collections. Runs on the event loop."""
+
+    def __init__(self, enabled: bool, window_ms: float, max_batch: int):
+        super().__init__(enabled, window_ms, max_batch)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _submit(
+        self, kind: str, namespace: Namespace, write: _Write, execute: Callable[[list[_Write]], Awaitable[None]]
+    ) -> Any:
+        key = (kind, *namespace)
+        batch, leader = self._join(key, write, lambda: _Batch(asyncio.Event(), asyncio.Event()))
+        if leader:
+            # Sent by a task of its own, so a cancelled request does not strand the other writes of its batch
+            task = asyncio.create_task(self._send(kind, key, batch, execute))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        await batch.done.wait()
+        return write.outcome()
+
+    async def _send(self, kind: str, key: BatchKey, batch: _Batch, execute: Callable[[list[_Write]], Awaitable[None]]):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except TimeoutError:
+            pass
+        self._close(key, batch)
+        self._sending(kind, batch.writes)
+        try:
+            await execute(batch.writes)
+        finally:
+            batch.done.set()
+
+    async def insert_many(self, client, namespace: Namespace, documents: list[dict[str, Any]]) -> list[Any]:
+        """Async variant of `WriteCoalescer.insert_many`"""
+        collection = client[namespace[1]][namespace[2]]
+        if len(documents) != 1 or not self._coalesces(collection):
+            self.direct += 1
+            return (await collection.insert_many(documents=documents)).inserted_ids
+
+        async def execute(writes: list[_Write]):
+            try:
+                await collection.bulk_write([write.model for write in writes], ordered=False)
+            except Exception as ex:
+                _settle_inserts(writes, ex)
+
+        document = documents[0]
+        document.setdefault("_id", ObjectId())
+        return [await self._submit("insert", namespace, _Write(InsertOne(document), document["_id"]), execute)]
+
+    async def update(
+        self, client, namespace: Namespace, filter: dict[str, Any], update: dict[str, Any], multi: bool, upsert: bool
+    ) -> UpdateResult:
+        """Async variant of `WriteCoalescer.update`"""
+        collection = client[namespace[1]][namespace[2]]
+        if not self._coalesces_updates(client, collection):
+            self.direct += 1
+            if multi:
+                return await collection.update_many(filter=filter, update=update, upsert=upsert)
+            return await collection.update_one(filter=filter, update=update, upsert=upsert)
+
+        async def execute(writes: list[_Write]):
+            try:
+                result = await client.bulk_write(
+                    [write.model for write in writes],
+                    ordered=False,
+                    verbose_results=True,
+                    write_concern=collection.write_concern,
+                )
+            except Exception as ex:
+                _settle_updates(writes, None, ex)
+            else:
+                _settle_updates(writes, result, None)
+
+        model = (UpdateMany if multi else UpdateOne)(filter, update, upsert=upsert, namespace=collection.full_name)
+        return await self._submit("update", namespace, _Write(model), execute)
+
+
+write_coalescer = WriteCoalescer(
+    enabled=settings.WRITE_COALESCING_ENABLED,
+    window_ms=settings.WRITE_COALESCING_WINDOW_MS,
+    max_batch=settings.WRITE_COALESCING_MAX_BATCH,
+)
+async_write_coalescer = AsyncWriteCoalescer(
+    enabled=settings.WRITE_COALESCING_ENABLED,
+    window_ms=settings.WRITE_COALESCING_WINDOW_MS,
+    max_batch=settings.WRITE_COALESCING_MAX_BATCH,
+)
@@ -1,12 +1,38 @@
 import os
-from api.v1.routers import database
+from contextlib import asynccontextmanager
+
+import httpx
+from api.v1.routers import database, database_async, diagnostics
+from core.authentication.subscription import marketplace_client
+from core.change_streams import change_streams
 from core.config import settings
-from fastapi import FastAPI
+from core.log_pipeline import CorrelationIdMiddleware, forward_correlation_id
+from core.metrics import REQUEST_SOURCE_HEADER, MetricsMiddleware, registry
+from core.mongo_client_registry import async_mongo_clients, mongo_clients
+from core.platfom_integration_client import close_http_clients
+from core.query_cache import query_cache
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_mcp import FastApiMCP
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from schemas.database import MAX_CHANGES_WAIT_MS
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Stop change streams and watchers, then close shared MongoDB connection pools and http clients on shutdown
+    await change_streams.aclose()
+    query_cache.close()
+    mongo_clients.close_all()
+    await async_mongo_clients.aclose_all()
+    await close_http_clients()
+    await marketplace_client.aclose()
+    await mcp_http_client.aclose()
+
 
 # Create main FastAPI app
-app = FastAPI(title=settings.APP_TITLE)
+app = FastAPI(title=settings.APP_TITLE, lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS.split(","),
@@ -14,16 +40,38 @@ app.add_middleware(
     allow_headers=["*"],
     allow_methods=["*"],
 )
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> Response:
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+# Added last so the correlation id is bound before any other middleware logs
+app.add_middleware(CorrelationIdMiddleware)
 
 # Include all app routers
 app.include_router(database.router, prefix=settings.API_V1_STR, tags=["database"])
+app.include_router(database_async.router, prefix=f"{settings.API_V1_STR}/async", tags=["database-async"])
+app.include_router(diagnostics.router, prefix=settings.API_V1_STR, tags=["diagnostics"])
 
-# Mount MCP
-mcp = FastApiMCP(app)
+# Mount MCP. The async router duplicates the database tools, so only one set is exposed,
+# and streaming responses are meant for HTTP clients rather than agents.
+# Tool calls are dispatched back into the app, tagged so metrics can tell them apart from REST calls.
+mcp_http_client = httpx.AsyncClient(
+    transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+    base_url="http://apiserver",
+    headers={REQUEST_SOURCE_HEADER: "mcp"},
+    # Long polls of poll_*_changes wait up to MAX_CHANGES_WAIT_MS, so reads may take that long
+    timeout=httpx.Timeout(10.0, read=MAX_CHANGES_WAIT_MS / 1000 + 10.0),
+    event_hooks={"request": [forward_correlation_id]},
+)
+mcp = FastApiMCP(app, http_client=mcp_http_client, exclude_tags=["database-async", "diagnostics", "streaming"])
 mcp.mount_http(mount_path="/streamable-http/mcp")
 
 if __name__ == "__main__":
     import uvicorn
+
     port = int(os.environ.get("PORT", 8000))  # Render sets PORT automatically
     uvicorn.run(app, host="0.0.0.0", port=port)
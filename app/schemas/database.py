@@ -1,4 +1,5 @@
-from typing import Any
+import datetime
+from typing import Any, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -10,6 +11,76 @@ class FindQueryInput(BaseModel):
     sort: list[tuple[str, int]] = Field(
         default=[("_id", 1)], description="The sort order to apply to the query. Desending order is indicated by -1."
     )
+    projection: Optional[dict[str, Any]] = Field(
+        default=None,
+        description="The fields to include (1) or exclude (0). Supports operators such as $slice and $elemMatch",
+    )
+    hint: Optional[str | list[tuple[str, int]]] = Field(
+        default=None, description="The index to use, as an index name or a key specification"
+    )
+    max_time_ms: Optional[int] = Field(
+        default=None, ge=1, description="The maximum server execution time in milliseconds"
+    )
+    batch_size: Optional[int] = Field(
+        default=None, ge=1, le=100000, description="The number of documents per server batch"
+    )
+    collation: Optional[dict[str, Any]] = Field(
+        default=None, description="The collation to use, e.g. {'locale': 'en', 'strength': 2}"
+    )
+    read_preference: Optional[Literal["primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"]] = (
+        Field(default=None, description="The replica set members to read from")
+    )
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="string",
+        description="How BSON types are rendered: as strings, or as relaxed or canonical MongoDB Extended JSON",
+    )
+
+
+class StreamFindQueryInput(FindQueryInput):
+    limit: int = Field(default=0, ge=0, description="The number of documents to return. 0 returns all documents")
+    batch_size: int = Field(default=500, ge=1, le=100000, description="The number of documents per server batch")
+    format: Literal["ndjson", "json"] = Field(
+        default="ndjson", description="Stream newline delimited JSON documents or a single JSON array"
+    )
+
+
+class PageQueryInput(BaseModel):
+    filter: dict[str, Any] = Field(default={}, description="The filter to apply to the query")
+    limit: int = Field(default=10, ge=1, le=10000, description="The number of documents per page")
+    sort: list[tuple[str, int]] = Field(
+        default=[("_id", 1)], description="The sort order to apply to the query. Desending order is indicated by -1."
+    )
+    cursor: Optional[str] = Field(
+        default=None, description="The next_cursor of the previous page. Omit to fetch the first page"
+    )
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="string",
+        description="How BSON types are rendered: as strings, or as relaxed or canonical MongoDB Extended JSON",
+    )
+
+
+class AggregateQueryInput(BaseModel):
+    pipeline: list[dict[str, Any]] = Field(default=[], description="The aggregation pipeline stages")
+    allow_disk_use: bool = Field(default=False, description="Whether stages may write temporary files to disk")
+    max_time_ms: Optional[int] = Field(
+        default=None, ge=1, description="The maximum server execution time in milliseconds"
+    )
+    batch_size: Optional[int] = Field(
+        default=None, ge=1, le=100000, description="The number of documents per server batch"
+    )
+    hint: Optional[str | list[tuple[str, int]]] = Field(
+        default=None, description="The index to use, as an index name or a key specification"
+    )
+    collation: Optional[dict[str, Any]] = Field(
+        default=None, description="The collation to use, e.g. {'locale': 'en', 'strength': 2}"
+    )
+    format: Literal["json", "ndjson"] = Field(
+        default="json", description="Return a single JSON array or newline delimited JSON documents"
+    )
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="string",
+        description="How BSON types are rendered: as strings, or as relaxed or canonical MongoDB Extended JSON",
+    )
 
 
 class InsertQueryInput(BaseModel):
@@ -20,6 +91,68 @@ class InsertQueryResult(BaseModel):
     inserted_ids: list[str] = Field(default=[], description="The ids of the documents inserted")
 
 
+class BulkWriteOperation(BaseModel):
+    op: Literal["insert_one", "update_one", "update_many", "replace_one", "delete_one", "delete_many"] = Field(
+        description="The write operation to perform"
+    )
+    document: Optional[dict[str, Any]] = Field(default=None, description="The document to insert (insert_one)")
+    filter: dict[str, Any] = Field(default={}, description="The filter selecting the documents to write")
+    update: Optional[dict[str, Any] | list[dict[str, Any]]] = Field(
+        default=None, description="The update document or pipeline (update_one, update_many)"
+    )
+    replacement: Optional[dict[str, Any]] = Field(default=None, description="The replacement document (replace_one)")
+    upsert: bool = Field(default=False, description="Whether to insert the document if it does not exist")
+
+
+class BulkWriteQueryInput(BaseModel):
+    operations: list[BulkWriteOperation] = Field(default=[], description="The write operations to perform")
+    ordered: bool = Field(
+        default=False, description="Whether to stop at the first error. Unordered writes are faster and run in parallel"
+    )
+    batch_size: int = Field(default=1000, ge=1, le=100000, description="The number of operations per bulk batch")
+    workers: int = Field(default=1, ge=1, le=16, description="The number of batches written in parallel")
+
+
+class BulkWriteOperationError(BaseModel):
+    index: int = Field(description="The position of the failed operation in the request")
+    code: Optional[int] = Field(default=None, description="The MongoDB error code, if any")
+    message: str = Field(description="The error message")
+
+
+class BulkWriteQueryResult(BaseModel):
+    inserted_count: int = Field(default=0, description="The number of documents inserted")
+    matched_count: int = Field(default=0, description="The number of documents matched")
+    modified_count: int = Field(default=0, description="The number of documents modified")
+    deleted_count: int = Field(default=0, description="The number of documents deleted")
+    upserted_count: int = Field(default=0, description="The number of documents upserted")
+    upserted_ids: dict[int, str] = Field(default={}, description="The ids of upserted documents by operation index")
+    error_count: int = Field(default=0, description="The number of operations that failed")
+    errors: list[BulkWriteOperationError] = Field(
+        default=[], description="The failed operations, truncated to the configured maximum"
+    )
+
+
+class ImportBatchResult(BaseModel):
+    batch: int = Field(description="The number of the batch, in completion order")
+    first_index: int = Field(description="The line number of the first document in the batch")
+    documents: int = Field(default=0, description="The number of documents in the batch")
+    inserted_count: int = Field(default=0, description="The number of documents inserted")
+    upserted_count: int = Field(default=0, description="The number of documents upserted")
+    duplicate_count: int = Field(default=0, description="The number of documents skipped as duplicates")
+    error_count: int = Field(default=0, description="The number of documents that failed")
+
+
+class ImportQueryResult(BulkWriteQueryResult):
+    import_id: str = Field(description="The id to fetch the progress of the import with")
+    status: Literal["running", "completed", "failed"] = Field(default="running", description="The import status")
+    documents_read: int = Field(default=0, description="The number of documents read from the upload so far")
+    batch_count: int = Field(default=0, description="The number of batches written so far")
+    duplicate_count: int = Field(default=0, description="The number of documents skipped as duplicates (dedup)")
+    failed_batches: list[ImportBatchResult] = Field(
+        default=[], description="The batches with failed documents, truncated to the configured maximum"
+    )
+
+
 class UpdateQueryInput(BaseModel):
     filter: dict[str, Any] = Field(default={}, description="The filter to apply to the query")
     update: dict[str, Any] = Field(default={}, description="The update to apply to the query")
@@ -39,3 +172,319 @@ class DeleteQueryInput(BaseModel):
 
 class DeleteQueryResult(BaseModel):
     deleted_count: int = Field(default=0, description="The number of documents deleted")
+
+
+class ExportPlanQueryInput(BaseModel):
+    filter: dict[str, Any] = Field(default={}, description="The filter selecting the documents to export")
+    key: str = Field(
+        default="_id", description="The indexed field the collection is partitioned on, e.g. _id or the shard key"
+    )
+    partitions: int = Field(
+        default=8, ge=1, le=1024, description="The approximate number of key ranges to split the export into"
+    )
+
+
+class ExportRangeResult(BaseModel):
+    range_token: str = Field(description="The signed token selecting this range in an export request")
+    lower: Optional[str] = Field(default=None, description="The inclusive lower bound of the range, if any")
+    upper: Optional[str] = Field(default=None, description="The exclusive upper bound of the range, if any")
+    type: Optional[str] = Field(default=None, description="The BSON type of the key values in the range")
+
+
+class ExportPlanQueryResult(BaseModel):
+    key: str = Field(description="The field the collection is partitioned on")
+    ranges: list[ExportRangeResult] = Field(default=[], description="The key ranges covering the export")
+
+
+class ExportQueryInput(ExportPlanQueryInput):
+    range_tokens: Optional[list[str]] = Field(
+        default=None,
+        description="Range tokens from the export plan to export. Omit to plan and export the whole collection",
+    )
+    projection: Optional[dict[str, Any]] = Field(default=None, description="The fields to include (1) or exclude (0)")
+    format: Literal["ndjson", "bson", "csv"] = Field(
+        default="ndjson", description="Export newline delimited JSON, a mongodump style BSON file or CSV"
+    )
+    fields: Optional[list[str]] = Field(default=None, description="The CSV columns as (dotted) field paths")
+    compression: Literal["none", "gzip", "zstd"] = Field(default="none", description="The compression to apply")
+    workers: int = Field(default=4, ge=1, le=16, description="The number of ranges scanned in parallel")
+    batch_size: int = Field(default=1000, ge=1, le=100000, description="The number of documents per server batch")
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="relaxed",
+        description="How BSON types are rendered in NDJSON: as strings, or as relaxed or canonical Extended JSON",
+    )
+
+
+class ExplainQueryInput(BaseModel):
+    operation: Literal["find", "aggregate", "update", "delete"] = Field(
+        default="find", description="The operation to explain. Updates and deletes are planned but not applied"
+    )
+    filter: dict[str, Any] = Field(default={}, description="The filter to apply to the query (find, update, delete)")
+    sort: Optional[list[tuple[str, int]]] = Field(default=None, description="The sort order to apply (find)")
+    projection: Optional[dict[str, Any]] = Field(default=None, description="The fields to include or exclude (find)")
+    limit: int = Field(default=0, ge=0, description="The number of documents to return, 0 for no limit (find)")
+    skip: int = Field(default=0, ge=0, description="The number of documents to skip (find)")
+    hint: Optional[str | list[tuple[str, int]]] = Field(
+        default=None, description="The index to use, as an index name or a key specification"
+    )
+    collation: Optional[dict[str, Any]] = Field(
+        default=None, description="The collation to use, e.g. {'locale': 'en', 'strength': 2}"
+    )
+    pipeline: list[dict[str, Any]] = Field(default=[], description="The aggregation pipeline stages (aggregate)")
+    update: Optional[dict[str, Any] | list[dict[str, Any]]] = Field(
+        default=None, description="The update document or pipeline (update)"
+    )
+    multi: bool = Field(default=False, description="Whether to update or delete multiple documents (update, delete)")
+    verbosity: Literal["queryPlanner", "executionStats", "allPlansExecution"] = Field(
+        default="executionStats",
+        description="queryPlanner only plans the query, executionStats also runs the winning plan and "
+        "allPlansExecution runs the rejected plans too",
+    )
+
+
+class ExplainQueryResult(BaseModel):
+    namespace: Optional[str] = Field(default=None, description="The database and collection the query ran on")
+    stages: list[str] = Field(default=[], description="The stages of the winning plan, from the root to the leaves")
+    indexes_used: list[str] = Field(default=[], description="The indexes scanned by the winning plan")
+    collection_scan: bool = Field(default=False, description="Whether the winning plan scans the whole collection")
+    rejected_plans: int = Field(default=0, description="The number of candidate plans the planner rejected")
+    keys_examined: Optional[int] = Field(default=None, description="The number of index keys examined")
+    docs_examined: Optional[int] = Field(default=None, description="The number of documents examined")
+    n_returned: Optional[int] = Field(default=None, description="The number of documents returned")
+    execution_time_ms: Optional[int] = Field(default=None, description="The server execution time in milliseconds")
+
+
+class SlowQueryResult(BaseModel):
+    timestamp: datetime.datetime = Field(description="When the query finished")
+    mongo_project: str = Field(description="The project the query ran against")
+    namespace: str = Field(description="The database and collection the query ran on")
+    operation_id: str = Field(description="The operation that ran the query")
+    duration_ms: float = Field(description="The time taken to run the query and encode its results")
+    shape: dict[str, Any] = Field(description="The query with its values replaced by placeholders")
+    plan: Optional[ExplainQueryResult] = Field(default=None, description="The summary of the query plan")
+    plan_error: Optional[str] = Field(default=None, description="Why the query could not be explained, if it failed")
+
+
+class IndexResult(BaseModel):
+    name: str = Field(description="The name of the index")
+    keys: list[tuple[str, int | str]] = Field(description="The indexed fields and their direction or index type")
+    unique: bool = Field(default=False, description="Whether the index rejects duplicate keys")
+    sparse: bool = Field(default=False, description="Whether documents without the indexed fields are skipped")
+    hidden: bool = Field(default=False, description="Whether the index is hidden from the query planner")
+    expire_after_seconds: Optional[int] = Field(default=None, description="The TTL of documents, for TTL indexes")
+    partial_filter_expression: Optional[dict[str, Any]] = Field(
+        default=None, description="The filter selecting the indexed documents, for partial indexes"
+    )
+
+
+class CreateIndexQueryInput(BaseModel):
+    keys: list[tuple[str, int | str]] = Field(
+        min_length=1,
+        description="The fields to index and their direction (1, -1) or index type (text, 2dsphere, hashed)",
+    )
+    name: Optional[str] = Field(default=None, description="The name of the index. Generated from the keys if omitted")
+    unique: bool = Field(default=False, description="Whether to reject duplicate keys")
+    sparse: bool = Field(default=False, description="Whether to skip documents without the indexed fields")
+    hidden: bool = Field(default=False, description="Whether to hide the index from the query planner")
+    expire_after_seconds: Optional[int] = Field(
+        default=None, ge=0, description="The seconds after which documents expire, for TTL indexes on a date field"
+    )
+    partial_filter_expression: Optional[dict[str, Any]] = Field(
+        default=None, description="Only index the documents matching this filter"
+    )
+    collation: Optional[dict[str, Any]] = Field(
+        default=None, description="The collation of the index, e.g. {'locale': 'en', 'strength': 2}"
+    )
+    commit_quorum: Optional[int | str] = Field(
+        default=None,
+        description="The number of data bearing members, 'majority' or 'votingMembers' that must finish the build "
+        "before the index is ready",
+    )
+    wait: bool = Field(
+        default=True,
+        description="Whether to wait for the build to finish. Otherwise the build runs in the background and its "
+        "progress shows in index_usage",
+    )
+
+
+class CreateIndexQueryResult(BaseModel):
+    name: str = Field(description="The name of the index")
+    status: Literal["created", "building"] = Field(
+        description="created once the build finished, building when it runs in the background"
+    )
+
+
+class DropIndexQueryResult(BaseModel):
+    name: str = Field(description="The name of the dropped index")
+
+
+class IndexUsageResult(BaseModel):
+    name: str = Field(description="The name of the index")
+    keys: list[tuple[str, int | str]] = Field(description="The indexed fields and their direction or index type")
+    accesses: int = Field(default=0, description="The number of operations that used the index")
+    since: Optional[datetime.datetime] = Field(default=None, description="When the access counter started")
+    host: Optional[str] = Field(default=None, description="The server the counters come from")
+    shard: Optional[str] = Field(default=None, description="The shard the counters come from, if sharded")
+    building: bool = Field(default=False, description="Whether the index is still being built")
+
+
+class IndexRecommendation(BaseModel):
+    keys: list[tuple[str, int]] = Field(description="The recommended index keys: equality, then sort, then range")
+    equality_fields: list[str] = Field(default=[], description="The fields matched by equality")
+    sort_fields: list[tuple[str, int]] = Field(default=[], description="The fields sorted on")
+    range_fields: list[str] = Field(default=[], description="The fields matched by range or other operators")
+    query_count: int = Field(default=0, description="The number of queries seen with this shape")
+    operations: list[str] = Field(default=[], description="The operations that sent queries with this shape")
+    example_shape: dict[str, Any] = Field(default={}, description="A filter of this shape with values replaced by ?")
+    estimated_selectivity: Optional[float] = Field(
+        default=None,
+        description="The estimated fraction of documents matching the equality fields, from sampled distinct values",
+    )
+    covered_by: Optional[str] = Field(default=None, description="The existing index already serving these queries")
+
+
+class IndexAdviceResult(BaseModel):
+    namespace: str = Field(description="The database and collection advised on")
+    shapes_seen: int = Field(default=0, description="The number of distinct query shapes seen")
+    sample_size: int = Field(default=0, description="The number of documents sampled to estimate selectivity")
+    recommendations: list[IndexRecommendation] = Field(
+        default=[], description="The index recommendations, most frequent query shapes first"
+    )
+
+
+class BatchOperation(BaseModel):
+    op: Literal["find", "count", "aggregate", "distinct"] = Field(description="The read operation to run")
+    db_name: str = Field(description="The database to run the operation on")
+    collection_name: str = Field(description="The collection to run the operation on")
+    filter: dict[str, Any] = Field(default={}, description="The filter to apply (find, count, distinct)")
+    projection: Optional[dict[str, Any]] = Field(default=None, description="The fields to include or exclude (find)")
+    sort: Optional[list[tuple[str, int]]] = Field(default=None, description="The sort order to apply (find)")
+    skip: int = Field(default=0, ge=0, description="The number of documents to skip (find, count)")
+    limit: int = Field(
+        default=10, ge=0, le=10000, description="The number of documents to return or count, 0 for no limit to count"
+    )
+    pipeline: list[dict[str, Any]] = Field(default=[], description="The aggregation pipeline stages (aggregate)")
+    field: Optional[str] = Field(default=None, description="The field to get the distinct values of (distinct)")
+    max_time_ms: Optional[int] = Field(
+        default=None, ge=1, description="The maximum server execution time in milliseconds"
+    )
+
+
+class BatchQueryInput(BaseModel):
+    operations: list[BatchOperation] = Field(
+        default=[], max_length=100, description="The operations to run, across any databases of the project"
+    )
+    concurrency: int = Field(default=4, ge=1, le=16, description="The number of operations run at the same time")
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="string",
+        description="How BSON types are rendered: as strings, or as relaxed or canonical MongoDB Extended JSON",
+    )
+
+
+class BatchOperationResult(BaseModel):
+    index: int = Field(description="The position of the operation in the request")
+    op: str = Field(description="The operation that ran")
+    ok: bool = Field(description="Whether the operation succeeded")
+    result: Any = Field(
+        default=None, description="The documents (find, aggregate), the count (count) or the values (distinct)"
+    )
+    error: Optional[str] = Field(default=None, description="The error message, if the operation failed")
+    duration_ms: float = Field(description="The time the operation took in milliseconds")
+
+
+class BatchQueryResult(BaseModel):
+    results: list[BatchOperationResult] = Field(default=[], description="The results, in the order of the operations")
+
+
+class CountQueryInput(BaseModel):
+    filter: dict[str, Any] = Field(default={}, description="The filter selecting the documents to count")
+    skip: int = Field(default=0, ge=0, description="The number of matching documents to skip")
+    limit: int = Field(default=0, ge=0, description="The maximum number of documents to count, 0 for no limit")
+    hint: Optional[str | list[tuple[str, int]]] = Field(
+        default=None, description="The index to use, as an index name or a key specification"
+    )
+    max_time_ms: Optional[int] = Field(
+        default=None, ge=1, description="The maximum server execution time in milliseconds"
+    )
+
+
+class CountQueryResult(BaseModel):
+    count: int = Field(description="The number of documents")
+    estimated: bool = Field(
+        default=False, description="Whether the count comes from the collection metadata rather than a scan"
+    )
+
+
+class DistinctQueryInput(BaseModel):
+    field: str = Field(description="The field to get the distinct values of, in dot notation for embedded fields")
+    filter: dict[str, Any] = Field(default={}, description="The filter selecting the documents to read values from")
+    max_time_ms: Optional[int] = Field(
+        default=None, ge=1, description="The maximum server execution time in milliseconds"
+    )
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="string",
+        description="How BSON types are rendered: as strings, or as relaxed or canonical MongoDB Extended JSON",
+    )
+
+
+class CollectionStatsResult(BaseModel):
+    namespace: str = Field(description="The database and collection, as db.collection")
+    count: int = Field(default=0, description="The number of documents")
+    size: int = Field(default=0, description="The uncompressed size of the documents in bytes")
+    avg_obj_size: Optional[float] = Field(default=None, description="The average document size in bytes")
+    storage_size: int = Field(default=0, description="The space allocated for the documents on disk in bytes")
+    total_index_size: int = Field(default=0, description="The size of all indexes in bytes")
+    index_sizes: dict[str, int] = Field(default={}, description="The size of each index in bytes")
+    nindexes: int = Field(default=0, description="The number of indexes")
+    capped: bool = Field(default=False, description="Whether the collection is capped")
+    shards: list[str] = Field(default=[], description="The shards the statistics were summed over, if sharded")
+
+
+class DatabaseStatsResult(BaseModel):
+    db: str = Field(description="The database")
+    collections: int = Field(default=0, description="The number of collections")
+    views: int = Field(default=0, description="The number of views")
+    objects: int = Field(default=0, description="The number of documents across all collections")
+    avg_obj_size: Optional[float] = Field(default=None, description="The average document size in bytes")
+    data_size: int = Field(default=0, description="The uncompressed size of the documents in bytes")
+    storage_size: int = Field(default=0, description="The space allocated for the documents on disk in bytes")
+    indexes: int = Field(default=0, description="The number of indexes across all collections")
+    index_size: int = Field(default=0, description="The size of all indexes in bytes")
+    total_size: int = Field(default=0, description="The storage size of the documents and indexes in bytes")
+
+
+class WatchQueryInput(BaseModel):
+    pipeline: list[dict[str, Any]] = Field(
+        default=[], description="The stages filtering or reshaping change events, e.g. [{'$match': {...}}]"
+    )
+    full_document: Literal["default", "updateLookup", "whenAvailable", "required"] = Field(
+        default="default",
+        description="Whether update events carry the current document (updateLookup) or only the changed fields",
+    )
+    resume_after: Optional[str] = Field(
+        default=None,
+        description="The id of the last event received, to resume after it. SSE clients may send Last-Event-ID instead",
+    )
+    json_mode: Literal["string", "relaxed", "canonical"] = Field(
+        default="string",
+        description="How BSON types are rendered: as strings, or as relaxed or canonical MongoDB Extended JSON",
+    )
+
+
+# The longest a changes poll may wait for an event. The MCP client's read timeout is derived from it.
+MAX_CHANGES_WAIT_MS = 60000
+
+
+class ChangesQueryInput(WatchQueryInput):
+    max_events: int = Field(default=100, ge=1, le=1000, description="The maximum number of events to return")
+    wait_ms: int = Field(
+        default=5000, ge=0, le=MAX_CHANGES_WAIT_MS, description="How long to wait for a first event in milliseconds"
+    )
+
+
+class ChangesQueryResult(BaseModel):
+    events: list[dict] = Field(default=[], description="The change events, oldest first")
+    resume_token: Optional[str] = Field(
+        default=None, description="The position after the returned events. Pass it as resume_after to get the next"
+    )
+    error: Optional[str] = Field(default=None, description="Why the change stream ended, if it did")
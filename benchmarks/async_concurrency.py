@@ -0,0 +1,141 @@
+"""
+Compares how the sync and async database routers behave under concurrency.
+
+Each request runs a deliberately slow find (`$where` with a server-side sleep)
+against a local mongod, so the sync router is bounded by the threadpool size
+while the async router is bounded only by the MongoDB connection pool.
+
+Usage:
+    python benchmarks/async_concurrency.py --mongo-uri mongodb://localhost:27017 --concurrency 10 40 100 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+os.environ.setdefault("PLATFRORM_INT_URL", "http://platform.invalid")
+os.environ.setdefault("QUEST_AI_SECRET_KEY", "benchmark")
+os.environ.setdefault("PUBLIC_KEY_B64", "")
+os.environ.setdefault("MONGO_MAX_POOL_SIZE", "500")
+# Every request comes from one tenant, whose quotas would turn the run into a rate limit test
+os.environ.setdefault("ADMISSION_ENABLED", "false")
+
+DB_NAME = "benchmark"
+COLLECTION_NAME = "async_concurrency"
+
+
+class _StubPlatformClient:
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+
+    def get_mongodb_details(self, mongo_project: str) -> dict[str, str]:
+        return {"connection_string": self.connection_string}
+
+
+class _AsyncStubPlatformClient(_StubPlatformClient):
+    async def get_mongodb_details(self, mongo_project: str) -> dict[str, str]:
+        return {"connection_string": self.connection_string}
+
+
+def build_app(mongo_uri: str):
+    """Imports the app and replaces auth and platform lookups with stand-ins"""
+    from core.authentication.auth_middleware import get_current_token
+    from core.authentication.subscription import validate_subscription
+    from core.platfom_integration_client import (
+        get_async_platform_client,
+        get_platform_client,
+    )
+    from main import app
+    from schemas.token import TokenData
+
+    token = TokenData(
+        id="benchmark",
+        email="benchmark@example.com",
+        role="admin",
+        type="bearer",
+        client_id="quest_ai",
+        access_token="benchmark",
+    )
+
+    async def subscription() -> str:
+        return "ENTERPRISE"
+
+    app.dependency_overrides[get_current_token] = lambda: token
+    app.dependency_overrides[validate_subscription] = subscription
+    app.dependency_overrides[get_platform_client] = lambda: _StubPlatformClient(mongo_uri)
+    app.dependency_overrides[get_async_platform_client] = lambda: _AsyncStubPlatformClient(mongo_uri)
+    return app
+
+
+def seed(mongo_uri: str):
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_uri)
+    collection = client[DB_NAME][COLLECTION_NAME]
+    collection.drop()
+    collection.insert_one({"name": "benchmark"})
+    client.close()
+
+
+async def run_level(app, prefix: str, concurrency: int, sleep_ms: int) -> dict:
+    import httpx
+
+    path = f"{prefix}/databases/{DB_NAME}/collections/{COLLECTION_NAME}/documents/find"
+    body = {"filter": {"$where": f"sleep({sleep_ms}) || true"}, "limit": 1}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+
+        async def one() -> float:
+            started = time.perf_counter()
+            response = await client.post(path, params={"mongo_project": "benchmark"}, json=body)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(one() for _ in range(concurrency))))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "router": prefix,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(concurrency / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        # With perfect concurrency every request finishes in about one server-side sleep
+        "effective_parallelism": round(concurrency * sleep_ms / 1000 / elapsed, 1),
+    }
+
+
+async def main(args):
+    seed(args.mongo_uri)
+    app = build_app(args.mongo_uri)
+
+    from core.config import settings
+
+    results = []
+    for concurrency in args.concurrency:
+        for prefix in (settings.API_V1_STR, f"{settings.API_V1_STR}/async"):
+            result = await run_level(app, prefix, concurrency, args.sleep_ms)
+            results.append(result)
+            print(result)
+
+    from core.mongo_client_registry import async_mongo_clients, mongo_clients
+
+    mongo_clients.close_all()
+    await async_mongo_clients.aclose_all()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 40, 100, 200])
+    parser.add_argument("--sleep-ms", type=int, default=200, help="server-side sleep per query")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Microbenchmark for encoding find results as JSON response bodies.
+
+Compares the previous path (json.dumps/json.loads per document, then FastAPI
+validating list[dict] and serializing again) with core.bson_json in each mode.
+No MongoDB server is needed: documents are built in memory and round-tripped
+through BSON so they carry the same types a cursor returns.
+
+Usage:
+    python benchmarks/bson_json_encoding.py --documents 1000 --repeat 20
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+import bson  # noqa: E402
+from bson import Binary, Decimal128, ObjectId  # noqa: E402
+from core.bson_json import dumps_documents  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+
+def make_document(index: int) -> dict:
+    """Builds a document shaped like typical agent data: ids, dates, money, nesting and a small blob"""
+    return {
+        "_id": ObjectId(),
+        "customer_id": ObjectId(),
+        "name": f"customer-{index}",
+        "email": f"customer-{index}@example.com",
+        "created_at": datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=index),
+        "balance": Decimal128(f"{random.uniform(0, 10000):.2f}"),
+        "score": random.random(),
+        "active": index % 2 == 0,
+        "tags": [f"tag-{i}" for i in range(5)],
+        "address": {"street": f"{index} Main St", "city": "Zurich", "zip": f"{8000 + index % 100}"},
+        "orders": [
+            {"order_id": ObjectId(), "total": Decimal128("19.99"), "placed_at": datetime.datetime(2024, 2, 1)}
+            for _ in range(3)
+        ],
+        "token": Binary(uuid.uuid4().bytes, 4),
+    }
+
+
+def legacy(documents: list[dict]) -> bytes:
+    res = [json.loads(json.dumps(document, default=str)) for document in documents]
+    validated = TypeAdapter(list[dict]).validate_python(res)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def timeit(fn, documents: list[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(documents)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(args):
+    raw = [bson.encode(make_document(i)) for i in range(args.documents)]
+    documents = [bson.decode(data) for data in raw]
+
+    candidates = {
+        "legacy json round-trip": legacy,
+        "bson_json string": lambda docs: dumps_documents(docs, "string"),
+        "bson_json relaxed": lambda docs: dumps_documents(docs, "relaxed"),
+        "bson_json canonical": lambda docs: dumps_documents(docs, "canonical"),
+    }
+
+    baseline = None
+    for name, fn in candidates.items():
+        elapsed = timeit(fn, documents, args.repeat)
+        baseline = baseline or elapsed
+        print(
+            f"{name:<24} {elapsed * 1000:9.2f} ms  "
+            f"{args.documents / elapsed:12.0f} docs/s  {baseline / elapsed:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,129 @@
+"""
+Benchmark for decoding Extended JSON in filters.
+
+Times core.filters decoding typical agent filters with the shape plan cache,
+without it (every filter compiled again) and against a json_util round-trip of
+the whole filter. No MongoDB server is needed for the timings.
+
+With --mongo-uri, a collection is seeded with indexed ObjectId and date fields
+and each filter is explained as sent and once decoded, showing whether the
+index is used and how many documents are examined.
+
+Usage:
+    python benchmarks/filter_decoding.py --repeat 20000
+    python benchmarks/filter_decoding.py --mongo-uri mongodb://localhost:27017 --documents 20000
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+from bson import ObjectId, json_util  # noqa: E402
+from core.filters import FieldTypes, FilterDecoder  # noqa: E402
+from pymongo import ASCENDING, MongoClient  # noqa: E402
+
+
+def make_filters(owner_ids: list[ObjectId]) -> dict[str, dict]:
+    """Filters as an agent sends them: Extended JSON wrappers, or plain strings for ObjectId and date fields"""
+    return {
+        "$oid equality": {"owner_id": {"$oid": str(owner_ids[0])}},
+        "$oid $in": {"owner_id": {"$in": [{"$oid": str(owner_id)} for owner_id in owner_ids[:5]]}},
+        "$date range": {
+            "created_at": {"$gte": {"$date": "2024-01-02T00:00:00Z"}, "$lt": {"$date": "2024-01-03T00:00:00Z"}}
+        },
+        "nested $and": {
+            "$and": [
+                {"owner_id": {"$oid": str(owner_ids[1])}},
+                {"created_at": {"$gte": {"$date": "2024-01-01T00:00:00Z"}}},
+                {"status": {"$in": ["open", "pending"]}},
+            ]
+        },
+        "plain strings (schema)": {"owner_id": str(owner_ids[2]), "created_at": {"$gte": "2024-01-05T00:00:00Z"}},
+    }
+
+
+def roundtrip(filter: dict) -> dict:
+    return json_util.loads(json.dumps(filter))
+
+
+def timeit(fn, filter: dict, repeat: int) -> float:
+    # Decoding works in place, so each call gets its own copy, made before timing
+    copies = [copy.deepcopy(filter) for _ in range(repeat)]
+    started = time.perf_counter()
+    for value in copies:
+        fn(value)
+    return (time.perf_counter() - started) / repeat
+
+
+def seed(collection, documents: int) -> list[ObjectId]:
+    owner_ids = [ObjectId() for _ in range(100)]
+    collection.drop()
+    collection.insert_many(
+        [
+            {
+                "owner_id": owner_ids[i % len(owner_ids)],
+                "created_at": datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i),
+                "status": ["open", "pending", "closed"][i % 3],
+            }
+            for i in range(documents)
+        ]
+    )
+    collection.create_index([("owner_id", ASCENDING)])
+    collection.create_index([("created_at", ASCENDING)])
+    return owner_ids
+
+
+def explain(collection, filter: dict) -> str:
+    explained = collection.find(filter).explain()
+    stats = explained["executionStats"]
+    stages = json.dumps(explained["queryPlanner"]["winningPlan"])
+    plan = "IXSCAN" if "IXSCAN" in stages else "COLLSCAN"
+    return f"{plan:<8} returned {stats['nReturned']:>6}  docs examined {stats['totalDocsExamined']:>7}"
+
+
+def main(args):
+    types = FieldTypes({"owner_id": "objectId", "created_at": "date"})
+    cached = FilterDecoder(maxsize=1024)
+    uncached = FilterDecoder(maxsize=0)
+
+    client = collection = None
+    if args.mongo_uri:
+        client = MongoClient(args.mongo_uri)
+        collection = client[args.database]["filter_decoding"]
+        owner_ids = seed(collection, args.documents)
+    else:
+        owner_ids = [ObjectId() for _ in range(100)]
+
+    for name, filter in make_filters(owner_ids).items():
+        print(name)
+        candidates = {
+            "json_util round-trip": roundtrip,
+            "decoder, no shape cache": lambda value: uncached.decode_filter(value, types),
+            "decoder, shape cache": lambda value: cached.decode_filter(value, types),
+        }
+        for label, fn in candidates.items():
+            print(f"  {label:<24} {timeit(fn, filter, args.repeat) * 1e6:8.2f} us")
+
+        if collection is not None:
+            print(f"  as sent   {explain(collection, copy.deepcopy(filter))}")
+            print(f"  decoded   {explain(collection, cached.decode_filter(copy.deepcopy(filter), types))}")
+
+    if client is not None:
+        collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--database", default="benchmarks")
+    parser.add_argument("--documents", type=int, default=20000)
+    main(parser.parse_args())
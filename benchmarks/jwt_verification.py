@@ -0,0 +1,87 @@
+"""
+Measures access token verifications per second with and without the verification cache.
+
+A throwaway RSA key pair is generated and used to mint RS256 (version 2) tokens, and
+HS256 (version 1) tokens are minted with a test secret, so no real keys are needed.
+
+Usage:
+    python benchmarks/jwt_verification.py --seconds 2
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PUBLIC_PEM = PRIVATE_KEY.public_key().public_bytes(
+    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+)
+PRIVATE_PEM = PRIVATE_KEY.private_bytes(
+    serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+)
+
+os.environ["PUBLIC_KEY_B64"] = base64.b64encode(PUBLIC_PEM).decode()
+os.environ["QUEST_AI_SECRET_KEY"] = "benchmark-secret"
+os.environ.setdefault("PLATFRORM_INT_URL", "http://platform.invalid")
+
+from core.authentication.auth_token import (  # noqa: E402
+    decode_access_token,
+    token_cache,
+    verify_access_token,
+)
+from core.config import settings  # noqa: E402
+from jose import jwt  # noqa: E402
+
+
+def mint(version: int) -> str:
+    claims = {
+        "sub": "benchmark@example.com",
+        "id": "benchmark",
+        "type": "bearer",
+        "role": "user",
+        "client_id": "quest_ai",
+        "version": version,
+        "aud": settings.SERVICE_ID,
+        "exp": int(time.time()) + 3600,
+    }
+    if version == 1:
+        claims.pop("aud")
+        return jwt.encode(claims, settings.QUEST_AI_SECRET_KEY, algorithm="HS256")
+    return jwt.encode(claims, PRIVATE_PEM.decode(), algorithm="RS256")
+
+
+def rate(fn, token: str, seconds: float) -> float:
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        fn(token)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main(args):
+    for version, algorithm in ((1, "HS256"), (2, "RS256")):
+        token = mint(version)
+        token_cache.clear()
+
+        uncached = rate(decode_access_token, token, args.seconds)
+        cached = rate(verify_access_token, token, args.seconds)
+        print(
+            f"{algorithm}: uncached {uncached:10.0f} verifications/s  "
+            f"cached {cached:10.0f} verifications/s  ({cached / uncached:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="measurement time per case")
+    main(parser.parse_args())
@@ -0,0 +1,603 @@
+"""
+Load test driving every database operation and the MCP endpoint against local stand-ins.
+
+The app runs under uvicorn in a subprocess, exactly as deployed. Stub HTTP servers in
+this process stand in for PLATFRORM_INT_URL and MARKETPLACE_URL, access tokens are
+RS256 JWTs minted from a throwaway key pair, and MongoDB is a local mongod. Every
+operation in api/v1/routers/database.py is run for --duration seconds at each
+--concurrency level, followed by a call of every MCP tool over the streamable HTTP
+endpoint. The operation ids are read from the router, and the run fails if one has
+no scenario and is not listed in NOT_LOAD_TESTED, so new routes cannot be missed.
+The change polls need mongod to run as a replica set, otherwise they count as errors.
+
+Throughput, p50/p95/p99 latency, errors and the server's RSS are written as JSON, so
+runs from two commits can be compared with --compare.
+
+Usage:
+    python benchmarks/load_test.py --mongo-uri mongodb://localhost:27017 --concurrency 1 16 64 \\
+        --output before.json
+    python benchmarks/load_test.py --compare before.json after.json
+"""
+
+import argparse
+import ast
+import asyncio
+import base64
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+from pymongo import MongoClient
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, "app")
+ROUTER_PATH = os.path.join(APP_DIR, "api", "v1", "routers", "database.py")
+API_PREFIX = "/api/v1"
+
+DB_NAME = "benchmark"
+READ_COLLECTION = "load_test"
+WRITE_COLLECTION = "load_test_writes"
+MONGO_PROJECT = "benchmark"
+SERVICE_ID = "benchmark-service"
+IMPORT_ID = "load-test"
+
+# Operations that cannot be repeated as a fixed request, with the reason
+NOT_LOAD_TESTED = {
+    "watch_collection": "an open ended SSE stream; poll_collection_changes reads the same shared change stream",
+    "watch_database": "an open ended SSE stream; poll_database_changes reads the same shared change stream",
+    "drop_index": "each call removes the index the next one would drop; create_index covers index builds",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(mongo_uri: str) -> tuple[ThreadingHTTPServer, str]:
+    """Serves the platform integration and marketplace endpoints the app calls"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/api/v1/mongodb_connections/"):
+                body = {"connection_string": mongo_uri}
+            elif self.path.startswith("/api/v1/subscription"):
+                body = {"subscription_package": {"tier": "ENTERPRISE"}}
+            else:
+                self.send_error(404)
+                return
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_keys() -> tuple[str, str]:
+    """Returns a throwaway RSA private key PEM and the base64 encoded public key PEM"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem.decode(), base64.b64encode(public_pem).decode()
+
+
+def mint_token(private_pem: str) -> str:
+    claims = {
+        "sub": "benchmark@example.com",
+        "id": "benchmark",
+        "type": "bearer",
+        "role": "admin",
+        "client_id": "quest_ai",
+        "version": 2,
+        "aud": SERVICE_ID,
+        "exp": int(time.time()) + 24 * 3600,
+    }
+    return jwt.encode(claims, private_pem, algorithm="RS256")
+
+
+def start_app(port: int, env: dict[str, str], workdir: str, log) -> subprocess.Popen:
+    """Starts the app under uvicorn and waits until it answers"""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--app-dir",
+            APP_DIR,
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=workdir,
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/openapi.json", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("The app did not start within 30 seconds")
+
+
+def rss_mb(pid: int) -> float | None:
+    """Resident set size of a process in MiB, where /proc is available"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def seed(mongo_uri: str, documents: int):
+    client = MongoClient(mongo_uri)
+    db = client[DB_NAME]
+    db[READ_COLLECTION].drop()
+    db[WRITE_COLLECTION].drop()
+    db[READ_COLLECTION].insert_many(
+        [
+            {
+                "index": i,
+                "name": f"customer-{i}",
+                "group": i % 10,
+                "score": i % 100,
+                "tags": [f"tag-{i % 7}", f"tag-{i % 11}"],
+                "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+            }
+            for i in range(documents)
+        ]
+    )
+    db[READ_COLLECTION].create_index([("group", 1), ("index", 1)])
+    client.close()
+
+
+def route_operations() -> dict[str, dict]:
+    """Reads the method, path and tags of every operation id from the decorators of database.py"""
+    with open(ROUTER_PATH) as source:
+        tree = ast.parse(source.read())
+
+    operations = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not (isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute)):
+                continue
+            keywords = {
+                keyword.arg: ast.literal_eval(keyword.value)
+                for keyword in decorator.keywords
+                if keyword.arg in ("path", "operation_id", "tags")
+            }
+            if "operation_id" in keywords:
+                operations[keywords["operation_id"]] = {
+                    "method": decorator.func.attr.upper(),
+                    "path": keywords["path"],
+                    "tags": keywords.get("tags", []),
+                }
+    return operations
+
+
+def http_scenarios() -> dict[str, dict]:
+    """One request template per operation id in database.py"""
+    base = f"{API_PREFIX}/databases/{DB_NAME}/collections"
+    read = f"{base}/{READ_COLLECTION}"
+    write = f"{base}/{WRITE_COLLECTION}"
+    ndjson = "\n".join(json.dumps({"op": "insert_one", "document": {"bulk": i}}) for i in range(100)) + "\n"
+    documents = "\n".join(json.dumps({"imported": i}) for i in range(100)) + "\n"
+
+    return {
+        "list_databases": {"method": "GET", "url": f"{API_PREFIX}/databases"},
+        "list_collections": {"method": "GET", "url": f"{base}"},
+        "database_stats": {"method": "GET", "url": f"{API_PREFIX}/databases/{DB_NAME}/stats"},
+        "collection_stats": {"method": "GET", "url": f"{read}/stats"},
+        "estimated_document_count": {"method": "GET", "url": f"{read}/documents/count/estimated"},
+        "count_documents": {"method": "POST", "url": f"{read}/documents/count", "json": {"filter": {"group": 3}}},
+        "distinct_values": {
+            "method": "POST",
+            "url": f"{read}/documents/distinct",
+            "json": {"field": "score", "filter": {"group": 3}},
+        },
+        "query_documents": {
+            "method": "POST",
+            "url": f"{read}/documents/find",
+            "json": {"filter": {"group": 3}, "limit": 100, "sort": [["index", 1]]},
+        },
+        "page_documents": {
+            "method": "POST",
+            "url": f"{read}/documents/find/page",
+            "json": {"filter": {"group": 3}, "limit": 100, "sort": [["index", 1]]},
+        },
+        "stream_documents": {
+            "method": "POST",
+            "url": f"{read}/documents/find/stream",
+            "json": {"filter": {}, "limit": 1000, "format": "ndjson"},
+        },
+        "poll_collection_changes": {
+            "method": "POST",
+            "url": f"{write}/changes",
+            "json": {"max_events": 100, "wait_ms": 100},
+        },
+        "poll_database_changes": {
+            "method": "POST",
+            "url": f"{API_PREFIX}/databases/{DB_NAME}/changes",
+            "json": {"max_events": 100, "wait_ms": 100},
+        },
+        "plan_export": {"method": "POST", "url": f"{read}/export/plan", "json": {"partitions": 4}},
+        "export_documents": {
+            "method": "POST",
+            "url": f"{read}/export",
+            "json": {"partitions": 4, "format": "ndjson", "compression": "gzip"},
+        },
+        "aggregate_documents": {
+            "method": "POST",
+            "url": f"{read}/aggregate",
+            "json": {"pipeline": [{"$group": {"_id": "$group", "total": {"$sum": "$score"}}}, {"$sort": {"_id": 1}}]},
+        },
+        "batch_operations": {
+            "method": "POST",
+            "url": f"{API_PREFIX}/batch",
+            "json": {
+                "operations": [
+                    {"op": "count", "db_name": DB_NAME, "collection_name": READ_COLLECTION, "filter": {"group": g}}
+                    for g in range(5)
+                ]
+                + [
+                    {
+                        "op": "find",
+                        "db_name": DB_NAME,
+                        "collection_name": READ_COLLECTION,
+                        "filter": {"group": 3},
+                        "limit": 10,
+                    },
+                    {"op": "distinct", "db_name": DB_NAME, "collection_name": READ_COLLECTION, "field": "group"},
+                ],
+                "concurrency": 4,
+            },
+        },
+        "explain_query": {
+            "method": "POST",
+            "url": f"{read}/explain",
+            "json": {"operation": "find", "filter": {"group": 3}, "sort": [["index", 1]]},
+        },
+        "list_indexes": {"method": "GET", "url": f"{read}/indexes"},
+        # Building an index that already exists is a no-op, so this measures the round trip, not the build
+        "create_index": {"method": "POST", "url": f"{write}/indexes", "json": {"keys": [["value", 1]]}},
+        "index_usage": {"method": "GET", "url": f"{read}/indexes/usage"},
+        "advise_indexes": {"method": "GET", "url": f"{read}/indexes/advice", "params": {"sample_size": 100}},
+        "insert_documents": {
+            "method": "POST",
+            "url": f"{write}/documents/insert",
+            "json": {"documents": [{"scratch": True, "value": i} for i in range(10)]},
+        },
+        "insert_one_document": {
+            "method": "POST",
+            "url": f"{write}/documents/insert",
+            "json": {"documents": [{"scratch": True, "value": 0}]},
+        },
+        "bulk_write_documents": {
+            "method": "POST",
+            "url": f"{write}/documents/bulk",
+            "json": {"operations": [{"op": "insert_one", "document": {"bulk": i}} for i in range(100)]},
+        },
+        "bulk_write_ndjson": {
+            "method": "POST",
+            "url": f"{write}/documents/bulk/ndjson",
+            "content": ndjson.encode(),
+            "headers": {"Content-Type": "application/x-ndjson"},
+        },
+        "import_documents": {
+            "method": "POST",
+            "url": f"{write}/documents/import",
+            "params": {"import_id": IMPORT_ID},
+            "content": documents.encode(),
+            "headers": {"Content-Type": "application/x-ndjson"},
+        },
+        # Polls the progress of the imports above, so it is only meaningful after import_documents
+        "import_progress": {"method": "GET", "url": f"{API_PREFIX}/imports/{IMPORT_ID}"},
+        "update_documents": {
+            "method": "PATCH",
+            "url": f"{write}/documents",
+            "json": {"filter": {"scratch": True}, "update": {"$inc": {"value": 1}}},
+        },
+        "delete_documents": {
+            "method": "DELETE",
+            "url": f"{write}/documents",
+            "json": {"filter": {"scratch": True}},
+        },
+    }
+
+
+def path_arguments(path: str, url: str) -> dict[str, str]:
+    """Extracts the path parameters of a route from a request url"""
+    pattern = re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", re.escape(API_PREFIX + path))
+    return re.fullmatch(pattern, url).groupdict()
+
+
+def mcp_scenarios(operations: dict[str, dict], http: dict[str, dict]) -> dict[str, dict]:
+    """
+    The arguments of every MCP tool, taken from its HTTP scenario. Tools are the operations
+    of database.py except the streaming ones, which are not exposed over MCP.
+    """
+    return {
+        operation_id: {
+            **path_arguments(operation["path"], http[operation_id]["url"]),
+            **http[operation_id].get("params", {}),
+            **http[operation_id].get("json", {}),
+        }
+        for operation_id, operation in operations.items()
+        if "streaming" not in operation["tags"] and operation_id in http
+    }
+
+
+def check_coverage(operations: dict[str, dict], http: dict[str, dict]):
+    """Fails if an operation id of database.py has no scenario and is not listed in NOT_LOAD_TESTED"""
+    missing = sorted(set(operations) - set(http) - set(NOT_LOAD_TESTED))
+    if missing:
+        raise SystemExit(f"No load test scenario for: {', '.join(missing)}. Add one or list it in NOT_LOAD_TESTED")
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+
+    def percentile(p: float) -> float | None:
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": percentile(1.0),
+        },
+    }
+
+
+async def drive(request, concurrency: int, duration: float) -> dict:
+    """Runs `request` from `concurrency` workers for `duration` seconds"""
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker(index: int):
+        nonlocal errors
+        # One untimed request per worker warms connections and caches
+        await request(index)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = await request(index)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)), return_exceptions=True)
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_http(base_url: str, token: str, name: str, scenario: dict, concurrency: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token}", **scenario.get("headers", {})}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+
+        async def request(_: int) -> bool:
+            response = await client.request(
+                scenario["method"],
+                scenario["url"],
+                params={"mongo_project": MONGO_PROJECT, **scenario.get("params", {})},
+                json=scenario.get("json"),
+                content=scenario.get("content"),
+            )
+            await response.aread()
+            return response.is_success
+
+        return await drive(request, concurrency, duration)
+
+
+async def run_mcp(base_url: str, token: str, tool: str, arguments: dict, concurrency: int, duration: float) -> dict:
+    """Calls an MCP tool with one streamable HTTP session per worker"""
+    from contextlib import AsyncExitStack
+
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    async with AsyncExitStack() as stack:
+        sessions = []
+        for _ in range(concurrency):
+            read, write, _ = await stack.enter_async_context(
+                streamablehttp_client(f"{base_url}/streamable-http/mcp", headers={"Authorization": f"Bearer {token}"})
+            )
+            session = await stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            sessions.append(session)
+
+        async def request(index: int) -> bool:
+            result = await sessions[index].call_tool(tool, {"mongo_project": MONGO_PROJECT, **arguments})
+            return not result.isError
+
+        return await drive(request, concurrency, duration)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, base_url: str, token: str, pid: int) -> list[dict]:
+    results = []
+    operations = route_operations()
+    http = http_scenarios()
+    check_coverage(operations, http)
+    mcp = mcp_scenarios(operations, http)
+    selected = set(args.operations or [*http, *(f"mcp:{tool}" for tool in mcp)])
+
+    for concurrency in args.concurrency:
+        for name, scenario in http.items():
+            if name not in selected:
+                continue
+            res = await run_http(base_url, token, name, scenario, concurrency, args.duration)
+            results.append({"operation_id": name, "transport": "http", "concurrency": concurrency, **res})
+            results[-1]["rss_mb"] = rss_mb(pid)
+            print_result(results[-1])
+
+        for tool, arguments in mcp.items():
+            if f"mcp:{tool}" not in selected:
+                continue
+            res = await run_mcp(base_url, token, tool, arguments, concurrency, args.duration)
+            results.append({"operation_id": tool, "transport": "mcp", "concurrency": concurrency, **res})
+            results[-1]["rss_mb"] = rss_mb(pid)
+            print_result(results[-1])
+
+    return results
+
+
+def print_result(result: dict):
+    latency = result["latency_ms"]
+    print(
+        f"{result['transport']:<5} {result['operation_id']:<22} c={result['concurrency']:<4} "
+        f"{result['throughput_rps']:9.1f} req/s  p50 {latency['p50']} ms  p95 {latency['p95']} ms  "
+        f"p99 {latency['p99']} ms  errors {result['errors']}  rss {result['rss_mb']} MiB"
+    )
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    def key(result: dict) -> tuple:
+        return result["transport"], result["operation_id"], result["concurrency"]
+
+    baseline = {key(result): result for result in before["results"]}
+    print(f"before {before['metadata'].get('commit')}  after {after['metadata'].get('commit')}")
+    for result in after["results"]:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+
+        def change(new_value, old_value) -> str:
+            if not new_value or not old_value:
+                return "   n/a"
+            return f"{(new_value - old_value) / old_value * 100:+6.1f}%"
+
+        transport, operation_id, concurrency = key(result)
+        print(
+            f"{transport:<5} {operation_id:<22} c={concurrency:<4} "
+            f"throughput {change(result['throughput_rps'], old['throughput_rps'])}  "
+            f"p95 {change(result['latency_ms']['p95'], old['latency_ms']['p95'])}  "
+            f"p99 {change(result['latency_ms']['p99'], old['latency_ms']['p99'])}"
+        )
+
+
+def main(args):
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    seed(args.mongo_uri, args.documents)
+    stub_server, stub_url = start_stub_server(args.mongo_uri)
+    private_pem, public_key_b64 = make_keys()
+    port = free_port()
+    env = {
+        "PUBLIC_KEY_B64": public_key_b64,
+        "QUEST_AI_SECRET_KEY": "benchmark",
+        "SERVICE_ID": SERVICE_ID,
+        "PLATFRORM_INT_URL": stub_url,
+        "MARKETPLACE_URL": stub_url,
+        "PYTHONPATH": APP_DIR,
+        # Every request comes from one tenant, whose quotas would turn the run into a rate limit test
+        "ADMISSION_ENABLED": "false",
+        "WRITE_COALESCING_ENABLED": str(args.write_coalescing).lower(),
+    }
+
+    with tempfile.TemporaryDirectory() as workdir, open(args.server_log, "w") as log:
+        process = start_app(port, env, workdir, log)
+        try:
+            started_rss = rss_mb(process.pid)
+            results = asyncio.run(run(args, f"http://127.0.0.1:{port}", mint_token(private_pem), process.pid))
+        finally:
+            process.terminate()
+            process.wait()
+            stub_server.shutdown()
+
+    report = {
+        "metadata": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "duration": args.duration,
+            "documents": args.documents,
+            "rss_mb_at_start": started_rss,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="measurement time per operation and level")
+    parser.add_argument("--documents", type=int, default=10000, help="documents seeded into the read collection")
+    parser.add_argument("--operations", nargs="+", help="operation ids to run, MCP tools prefixed with mcp:")
+    parser.add_argument(
+        "--write-coalescing", action="store_true", help="run the app with WRITE_COALESCING_ENABLED, to compare both"
+    )
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--server-log", default=os.devnull, help="file receiving the app's log output")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    main(parser.parse_args())
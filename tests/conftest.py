@@ -0,0 +1,10 @@
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+# The settings require these, although the tests never reach the platform
+os.environ.setdefault("PLATFRORM_INT_URL", "http://platform.invalid")
+os.environ.setdefault("QUEST_AI_SECRET_KEY", "test")
+os.environ.setdefault("PUBLIC_KEY_B64", "")
@@ -0,0 +1,68 @@
+"""
+Checks against a real mongod that a decoded filter can use an index. Set TEST_MONGO_URI to run,
+e.g. TEST_MONGO_URI=mongodb://localhost:27017 pytest tests
+"""
+
+import datetime
+import json
+import os
+
+import pytest
+from bson import ObjectId
+from core.filters import FieldTypes, FilterDecoder
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import PyMongoError
+
+MONGO_URI = os.environ.get("TEST_MONGO_URI")
+
+pytestmark = pytest.mark.skipif(not MONGO_URI, reason="TEST_MONGO_URI is not set")
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as ex:
+        pytest.skip(f"No mongod at TEST_MONGO_URI: {ex}")
+
+    collection = client["mongo_db_tools_tests"]["filter_explain"]
+    collection.drop()
+    owners = [ObjectId() for _ in range(10)]
+    collection.insert_many(
+        [
+            {
+                "owner_id": owners[i % len(owners)],
+                "created_at": datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=i),
+            }
+            for i in range(1000)
+        ]
+    )
+    collection.create_index([("owner_id", ASCENDING)])
+    collection.create_index([("created_at", ASCENDING)])
+    yield collection, owners
+    collection.drop()
+    client.close()
+
+
+def _explain(collection, filter: dict) -> tuple[str, int]:
+    explained = collection.find(filter).explain()
+    stages = json.dumps(explained["queryPlanner"]["winningPlan"], default=str)
+    return ("IXSCAN" if "IXSCAN" in stages else "COLLSCAN"), explained["executionStats"]["nReturned"]
+
+
+def test_decoded_oid_uses_index(seeded):
+    collection, owners = seeded
+    sent = {"owner_id": {"$in": [{"$oid": str(owners[0])}, {"$oid": str(owners[1])}]}}
+
+    # As sent, the wrapper is compared as an embedded document and matches nothing
+    assert _explain(collection, json.loads(json.dumps(sent)))[1] == 0
+    assert _explain(collection, FilterDecoder(maxsize=16).decode_filter(sent)) == ("IXSCAN", 200)
+
+
+def test_coerced_date_uses_index(seeded):
+    collection, _ = seeded
+    sent = {"created_at": {"$gte": "2024-01-01T00:00:00", "$lt": "2024-01-02T00:00:00"}}
+    decoded = FilterDecoder(maxsize=16).decode_filter(sent, FieldTypes({"created_at": "date"}))
+
+    assert _explain(collection, decoded) == ("IXSCAN", 24)
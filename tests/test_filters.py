@@ -0,0 +1,149 @@
+import datetime
+import uuid
+
+import pytest
+from bson import Binary, Decimal128, ObjectId
+from core.filters import FieldTypes, FilterDecodeError, FilterDecoder, sampled_field_types
+
+OWNER = ObjectId("65a1b2c3d4e5f60718293a4b")
+OTHER = ObjectId("65a1b2c3d4e5f60718293a4c")
+
+
+@pytest.fixture
+def decoder() -> FilterDecoder:
+    return FilterDecoder(maxsize=16)
+
+
+@pytest.fixture
+def types() -> FieldTypes:
+    return FieldTypes({"owner_id": "objectId", "created_at": "date", "price": "decimal", "ref": "uuid"})
+
+
+def test_oid_equality(decoder):
+    assert decoder.decode_filter({"owner_id": {"$oid": str(OWNER)}}) == {"owner_id": OWNER}
+
+
+def test_oid_in_ne_and_nin(decoder):
+    decoded = decoder.decode_filter(
+        {
+            "owner_id": {"$in": [{"$oid": str(OWNER)}, {"$oid": str(OTHER)}], "$ne": {"$oid": str(OTHER)}},
+            "_id": {"$nin": [{"$oid": str(OTHER)}]},
+        }
+    )
+    assert decoded == {"owner_id": {"$in": [OWNER, OTHER], "$ne": OTHER}, "_id": {"$nin": [OTHER]}}
+    assert all(type(value) is ObjectId for value in decoded["owner_id"]["$in"])
+
+
+def test_date_range(decoder):
+    decoded = decoder.decode_filter(
+        {"created_at": {"$gte": {"$date": "2024-01-02T00:00:00Z"}, "$lt": {"$date": {"$numberLong": "1704240000000"}}}}
+    )
+    assert decoded == {
+        "created_at": {"$gte": datetime.datetime(2024, 1, 2), "$lt": datetime.datetime(2024, 1, 3)},
+    }
+
+
+def test_logical_operators(decoder):
+    decoded = decoder.decode_filter(
+        {
+            "$or": [
+                {"owner_id": {"$oid": str(OWNER)}},
+                {"$and": [{"created_at": {"$gte": {"$date": "2024-01-01T00:00:00Z"}}}, {"status": "open"}]},
+            ]
+        }
+    )
+    assert decoded == {
+        "$or": [
+            {"owner_id": OWNER},
+            {"$and": [{"created_at": {"$gte": datetime.datetime(2024, 1, 1)}}, {"status": "open"}]},
+        ]
+    }
+
+
+def test_plain_strings_kept_without_types(decoder):
+    assert decoder.decode_filter({"owner_id": str(OWNER)}) == {"owner_id": str(OWNER)}
+
+
+def test_schema_coercion(decoder, types):
+    ref = uuid.uuid4()
+    decoded = decoder.decode_filter(
+        {
+            "owner_id": {"$in": [str(OWNER), str(OTHER)]},
+            "created_at": {"$gte": "2024-01-02T00:00:00"},
+            "price": {"$lt": "9.99"},
+            "ref": str(ref),
+            "status": "open",
+        },
+        types,
+    )
+    assert decoded == {
+        "owner_id": {"$in": [OWNER, OTHER]},
+        "created_at": {"$gte": datetime.datetime(2024, 1, 2)},
+        "price": {"$lt": Decimal128("9.99")},
+        "ref": Binary.from_uuid(ref),
+        "status": "open",
+    }
+
+
+def test_schema_coercion_leaves_other_strings(decoder, types):
+    # Not 24 hex characters or not an ISO date: sent as is, and simply matches nothing
+    decoded = decoder.decode_filter({"owner_id": "alice", "created_at": "yesterday"}, types)
+    assert decoded == {"owner_id": "alice", "created_at": "yesterday"}
+
+
+def test_malformed_wrapper(decoder):
+    with pytest.raises(FilterDecodeError):
+        decoder.decode_filter({"owner_id": {"$oid": "not an object id"}})
+
+
+def test_plan_reused_for_same_shape(decoder, types):
+    first = decoder.decode_filter({"owner_id": {"$oid": str(OWNER)}, "created_at": {"$gte": "2024-01-01"}}, types)
+    second = decoder.decode_filter({"owner_id": {"$oid": str(OTHER)}, "created_at": {"$gte": "2024-02-01"}}, types)
+
+    assert decoder.stats()["misses"] == 1
+    assert decoder.stats()["hits"] == 1
+    # The plan holds paths, not values
+    assert first == {"owner_id": OWNER, "created_at": {"$gte": datetime.datetime(2024, 1, 1)}}
+    assert second == {"owner_id": OTHER, "created_at": {"$gte": datetime.datetime(2024, 2, 1)}}
+
+
+def test_plan_for_list_of_other_length(decoder):
+    decoder.decode_filter({"owner_id": {"$in": [{"$oid": str(OWNER)}]}})
+    decoded = decoder.decode_filter({"owner_id": {"$in": [{"$oid": str(OWNER)}, {"$oid": str(OTHER)}]}})
+
+    assert decoder.stats()["hits"] == 1
+    assert decoded == {"owner_id": {"$in": [OWNER, OTHER]}}
+
+
+def test_plan_not_reused_across_field_types(decoder):
+    filter = {"owner_id": str(OWNER)}
+    decoder.decode_filter(dict(filter), FieldTypes({"owner_id": "objectId"}))
+    decoded = decoder.decode_filter(dict(filter), FieldTypes({}))
+
+    assert decoder.stats()["misses"] == 2
+    assert decoded == {"owner_id": str(OWNER)}
+
+
+def test_plans_bounded():
+    decoder = FilterDecoder(maxsize=2)
+    for field in ("a", "b", "c"):
+        decoder.decode_filter({field: {"$oid": str(OWNER)}})
+    decoder.decode_filter({"a": {"$oid": str(OWNER)}})
+
+    assert decoder.stats()["shapes"] == 2
+    assert decoder.stats()["misses"] == 4
+
+
+def test_update_not_coerced(decoder):
+    update = decoder.decode_update({"$set": {"ref": {"$oid": str(OWNER)}, "label": str(OTHER)}})
+    assert update == {"$set": {"ref": OWNER, "label": str(OTHER)}}
+
+
+def test_sampled_field_types():
+    types = sampled_field_types(
+        [
+            {"owner_id": OWNER, "created_at": datetime.datetime(2024, 1, 1), "tags": [OWNER], "mixed": OWNER},
+            {"owner_id": OTHER, "nested": {"at": datetime.datetime(2024, 1, 2)}, "mixed": "x", "name": "n"},
+        ]
+    )
+    assert types.types == {"owner_id": "objectId", "created_at": "date", "tags": "objectId", "nested.at": "date"}